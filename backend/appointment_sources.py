@@ -0,0 +1,137 @@
+"""
+Appointment Sources
+Where the sync pipeline reads appointment rows from: the Google Sheet or a local CSV/XLSX export
+"""
+import asyncio
+import csv
+from abc import ABC, abstractmethod
+from datetime import date, datetime, time
+from itertools import islice
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from sheet_snapshot import DEFAULT_SPREADSHEET_ID, DEFAULT_RANGE, get_sheet_snapshot
+
+# (cabeceras, filas de datos) de cada bloque leído
+Chunk = Tuple[List[str], List[List[str]]]
+
+
+class AppointmentSource(ABC):
+    """Interface of a row source for sync_appointments"""
+
+    # Valor guardado en appointments.source para las citas de esta fuente
+    name = 'source'
+    # Si es True, la fuente es completa y las citas que ya no aparecen se borran
+    deletes_missing = False
+
+    @abstractmethod
+    def iter_chunks(self, chunk_size: int) -> AsyncIterator[Chunk]:
+        """Yield (headers, rows) blocks of at most chunk_size data rows, in sheet order"""
+
+    def describe(self) -> str:
+        return self.name
+
+
+class GoogleSheetsSource(AppointmentSource):
+    """The clinic's Google Sheet, read through the shared snapshot cache"""
+
+    name = 'google_sheets'
+    deletes_missing = True
+
+    def __init__(self, spreadsheet_id: str = DEFAULT_SPREADSHEET_ID, range_name: str = DEFAULT_RANGE,
+                 max_age: Optional[float] = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.range_name = range_name
+        self.max_age = max_age
+
+    async def iter_chunks(self, chunk_size: int) -> AsyncIterator[Chunk]:
+        snapshot = await get_sheet_snapshot(self.spreadsheet_id, self.range_name, max_age=self.max_age)
+        rows = snapshot.rows
+        for start in range(0, len(rows), chunk_size):
+            yield snapshot.headers, rows[start:start + chunk_size]
+
+    def describe(self) -> str:
+        return f"Google Sheets {self.spreadsheet_id} ({self.range_name})"
+
+
+def _cell_to_str(value) -> str:
+    """Render an XLSX cell the way the same value reads in the Google Sheet"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        # Excel guarda las horas sueltas como fechas de 1899/1900
+        if value.year < 1901:
+            return value.strftime('%H:%M')
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _read_chunk(rows: Iterator, chunk_size: int) -> List[List[str]]:
+    return [list(row) for row in islice(rows, chunk_size)]
+
+
+class LocalFileSource(AppointmentSource):
+    """
+    CSV or XLSX export with the same columns as the Google Sheet
+    Rows are streamed in blocks (file reads run in the default executor), so
+    large historical exports never load into memory at once. File imports are
+    partial by nature, so they never delete appointments.
+    """
+
+    name = 'file'
+
+    def __init__(self, path, sheet_name: Optional[str] = None, encoding: str = 'utf-8-sig'):
+        self.path = Path(path)
+        self.sheet_name = sheet_name
+        self.encoding = encoding
+        suffix = self.path.suffix.lower()
+        if suffix not in ('.csv', '.xlsx'):
+            raise ValueError(f"Formato no soportado: {suffix} (usa .csv o .xlsx)")
+        self.format = suffix[1:]
+
+    def describe(self) -> str:
+        return f"{self.format.upper()} {self.path.name}"
+
+    def _open_csv(self):
+        handle = open(self.path, newline='', encoding=self.encoding)
+        sample = handle.read(4096)
+        handle.seek(0)
+        try:
+            # Las exportaciones en español suelen usar ';'
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        return handle, csv.reader(handle, dialect)
+
+    def _open_xlsx(self):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as e:
+            raise RuntimeError("Importar XLSX requiere openpyxl (pip install openpyxl)") from e
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        sheet = workbook[self.sheet_name] if self.sheet_name else workbook.active
+        rows = ([_cell_to_str(value) for value in row] for row in sheet.iter_rows(values_only=True))
+        return workbook, rows
+
+    async def iter_chunks(self, chunk_size: int) -> AsyncIterator[Chunk]:
+        loop = asyncio.get_running_loop()
+        opener = self._open_csv if self.format == 'csv' else self._open_xlsx
+        handle, rows = await loop.run_in_executor(None, opener)
+        try:
+            header_rows = await loop.run_in_executor(None, _read_chunk, rows, 1)
+            if not header_rows:
+                return
+            headers = [str(header) for header in header_rows[0]]
+            while True:
+                chunk = await loop.run_in_executor(None, _read_chunk, rows, chunk_size)
+                if not chunk:
+                    break
+                yield headers, chunk
+        finally:
+            handle.close()
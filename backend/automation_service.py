@@ -9,6 +9,9 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import asyncio
 
+from reminder_queue import reminder_due_update, merge_updates, notify_reminder_dispatcher
+from sheet_parsing import parse_sheet_datetime
+
 load_dotenv()
 
 # OpenRouter client for DeepSeek
@@ -86,7 +89,8 @@ class MessageFlowEngine:
     @staticmethod
     async def execute_flow(flow: Dict, recipient: Dict, db, whatsapp_service_url: str):
         """Execute a message flow for a recipient"""
-        import httpx
+        from whatsapp_client import get_whatsapp_client
+        whatsapp_client = get_whatsapp_client()
         
         variables = {
             'Nombre': recipient.get('nombre', ''),
@@ -102,28 +106,33 @@ class MessageFlowEngine:
             # Replace variables in message
             message = MessageFlowEngine.replace_variables(step.get('message', ''), variables)
             
-            # Send message via WhatsApp
-            async with httpx.AsyncClient() as client:
-                try:
-                    response = await client.post(
-                        f"{whatsapp_service_url}/send-message",
-                        json={
-                            'number': recipient.get('telefono', ''),
-                            'message': message
-                        }
-                    )
-                    print(f"Message sent to {recipient.get('nombre')}: {response.status_code}")
-                except Exception as e:
-                    print(f"Error sending message: {e}")
+            # Send message via WhatsApp (shared connection pool)
+            try:
+                response = await whatsapp_client.post(
+                    f"{whatsapp_service_url}/send-message",
+                    json={
+                        'number': recipient.get('telefono', ''),
+                        'message': message
+                    },
+                    timeout=30.0
+                )
+                print(f"Message sent to {recipient.get('nombre')}: {response.status_code}")
+            except Exception as e:
+                print(f"Error sending message: {e}")
             
             # Execute actions (e.g., update appointment status)
             for action in step.get('actions', []):
                 if action['type'] == 'update_status':
-                    # Update appointment status in database
-                    await db.appointments.update_one(
-                        {'_id': recipient.get('appointment_id')},
-                        {'$set': {'status': action['value']}}
-                    )
+                    # Update appointment status in database (y su entrada en la cola de recordatorios)
+                    query = {'_id': recipient.get('appointment_id')}
+                    existing = await db.appointments.find_one(query)
+                    if existing:
+                        fields = {'status': action['value']}
+                        await db.appointments.update_one(
+                            query,
+                            merge_updates({'$set': fields}, reminder_due_update({**existing, **fields}))
+                        )
+                        notify_reminder_dispatcher()
             
             # Wait before next step if specified
             await asyncio.sleep(step.get('delay', 0))
@@ -155,10 +164,9 @@ class ReminderScheduler:
             for appointment in appointments:
                 try:
                     # Parse appointment date and time
-                    apt_datetime = datetime.strptime(
-                        f"{appointment['fecha']} {appointment['hora']}", 
-                        "%Y-%m-%d %H:%M"
-                    )
+                    apt_datetime = parse_sheet_datetime(appointment['fecha'], appointment['hora'])
+                    if apt_datetime is None:
+                        continue
                     
                     # Check if appointment is within 24-48 hours
                     hours_until = (apt_datetime - now).total_seconds() / 3600
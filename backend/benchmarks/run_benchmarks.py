@@ -0,0 +1,216 @@
+"""
+Benchmark Runner
+Times the sync, appointment queries, stats and reminder scans against synthetic data and writes JSON results
+
+Usage (from backend/, after benchmarks.synthetic_data):
+    python -m benchmarks.run_benchmarks --sheet-csv /tmp/bench_sheet.csv --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json   # exits 1 on regressions
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+from benchmarks.synthetic_data import default_bench_db_name  # noqa: E402
+
+
+async def time_case(func: Callable[[], Awaitable], repeat: int, warmup: int = 1) -> Dict:
+    """Run func warmup + repeat times and summarise the timed runs (seconds)"""
+    for _ in range(warmup):
+        await func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started)
+    return {
+        'runs': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'max': max(timings),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict:
+    # El servidor lee DB_NAME al importarse: apuntarlo a la base de benchmarks antes
+    os.environ['DB_NAME'] = args.db
+    import server
+    from httpx import ASGITransport, AsyncClient
+    from db_indexes import ensure_indexes
+    from reminder_queue import ReminderDispatcher
+    from sync_google_sheets import sync_appointments
+    from appointment_sources import LocalFileSource
+    from dashboard import dashboard_cache
+
+    db = server.db
+    await ensure_indexes(db)
+
+    dataset = {name: await db[name].estimated_document_count()
+               for name in ('patients', 'appointments', 'contacts', 'conversations', 'messages')}
+    results = {}
+
+    # Sin lifespan: el scheduler y el dispatcher del servidor no arrancan
+    async with AsyncClient(transport=ASGITransport(app=server.app), base_url='http://bench') as http:
+        async def get(path, **params):
+            response = await http.get(f"/api{path}", params=params)
+            response.raise_for_status()
+            return response
+
+        today = datetime.now(timezone.utc).date()
+        day_window = {'from': today.isoformat(), 'to': (today + timedelta(days=1)).isoformat()}
+        month_window = {'from': today.isoformat(), 'to': (today + timedelta(days=30)).isoformat()}
+
+        cases = {
+            'appointments_day': lambda: get('/appointments', **day_window),
+            'appointments_month': lambda: get('/appointments', **month_window),
+            'appointments_page': lambda: get('/appointments', limit=200),
+            'stats_summary': lambda: get('/appointments/stats/summary'),
+            'stats_month_breakdown': lambda: get('/appointments/stats/summary', breakdown='true', **month_window),
+        }
+
+        async def dashboard_summary():
+            # Medir las agregaciones, no la caché
+            dashboard_cache.invalidate()
+            await get('/dashboard/summary')
+
+        cases['dashboard_summary'] = dashboard_summary
+        cases['search_contacts'] = lambda: get('/search', q='Contacto 12', type='contacts')
+        cases['search_name_prefix'] = lambda: get('/search', q='Contac', type='contacts')
+        cases['search_phone'] = lambda: get('/search', q='600012', type='contacts')
+        cases['search_messages'] = lambda: get('/search', q='prueba', type='messages')
+
+        conversation = await db.conversations.find_one({}, {'_id': 0, 'id': 1}, sort=[('last_message_at', -1)])
+        if conversation:
+            cases['conversations_list'] = lambda: get('/conversations')
+            cases['conversations_page'] = lambda: get('/conversations', limit=50)
+            cases['conversation_messages'] = lambda: get(f"/conversations/{conversation['id']}/messages", limit=50)
+
+            async def conversation_history():
+                # Recorrer el historial completo página a página, como al hacer scroll hacia arriba
+                params = {'limit': 50, 'lean': 'true'}
+                while True:
+                    page = await get(f"/conversations/{conversation['id']}/messages", **params)
+                    cursor = page.headers.get('X-Next-Cursor')
+                    if not cursor:
+                        break
+                    params['before'] = cursor
+
+            cases['conversation_history_pages'] = conversation_history
+
+        dispatcher = ReminderDispatcher(db)
+
+        async def reminder_due_scan():
+            # Misma consulta que claim(), sin reclamar
+            horizon = datetime.now(timezone.utc) + timedelta(days=1)
+            await db.appointments.find(
+                {'reminder_due_at': {'$lte': horizon}, 'reminder_lease_until': {'$exists': False}},
+                {'_id': 0}
+            ).sort('reminder_due_at', 1).limit(dispatcher.batch_size).to_list(None)
+
+        cases['reminder_next_due'] = dispatcher.seconds_until_next
+        cases['reminder_due_scan'] = reminder_due_scan
+
+        for name, func in cases.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = await time_case(func, args.repeat)
+            print(f"⏱️ {name}: mediana {results[name]['median'] * 1000:.1f} ms")
+
+    if args.sheet_csv and (not args.only or 'sync_unchanged' in args.only):
+        source = LocalFileSource(args.sheet_csv)
+
+        async def sync():
+            result = await sync_appointments(db, source=source)
+            if not result.get('success'):
+                raise RuntimeError(result.get('error'))
+
+        # La primera pasada escribe todas las filas; las siguientes solo comparan hashes
+        results['sync_first_pass'] = await time_case(sync, 1, warmup=0)
+        results['sync_unchanged'] = await time_case(sync, args.repeat, warmup=0)
+        for name in ('sync_first_pass', 'sync_unchanged'):
+            print(f"⏱️ {name}: mediana {results[name]['median']:.2f} s")
+
+    server.client.close()
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'db': args.db,
+        'dataset': dataset,
+        'results': results,
+    }
+
+
+def find_regressions(report: Dict, baseline: Dict, max_regression: float) -> Dict:
+    """Cases whose median got slower than the baseline by more than max_regression (fraction)"""
+    regressions = {}
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous.get('median'):
+            continue
+        change = current['median'] / previous['median'] - 1
+        if change > max_regression:
+            regressions[name] = {'baseline': previous['median'], 'current': current['median'], 'change': change}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de sincronización y consultas")
+    parser.add_argument('--db', default=default_bench_db_name(), help="Base de datos con datos sintéticos")
+    parser.add_argument('--sheet-csv', help="Hoja sintética para medir sync_appointments")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help="Ejecutar solo estos casos")
+    parser.add_argument('--output', help="Fichero JSON de resultados (por defecto benchmarks/results/<fecha>.json)")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Empeoramiento máximo tolerado de la mediana (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.db == os.environ.get('DB_NAME'):
+        # La sincronización de benchmark escribe en la base de datos
+        raise SystemExit("❌ Refusing to benchmark against the main database")
+
+    report = asyncio.run(run(args))
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).parent / 'results' / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    exit_code = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        report['regressions'] = find_regressions(report, baseline, args.max_regression)
+        for name, regression in report['regressions'].items():
+            print(f"❌ Regresión en {name}: {regression['baseline']:.4f}s -> {regression['current']:.4f}s "
+                  f"(+{regression['change'] * 100:.0f}%)")
+        exit_code = 1 if report['regressions'] else 0
+
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"✅ Resultados escritos en {output}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
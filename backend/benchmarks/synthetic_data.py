@@ -0,0 +1,216 @@
+"""
+Synthetic Data Generator
+Builds large sheets and collections for benchmarks, in a separate database
+
+Usage (from backend/):
+    python -m benchmarks.synthetic_data --appointments 100000 --patients 20000 --messages 1000000 --sheet-csv /tmp/bench_sheet.csv
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from reminder_queue import compute_reminder_due_at
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+INSERT_BATCH_SIZE = 5000
+
+SHEET_HEADERS = [
+    'Registro', 'CitMod', 'NumHis', 'NumPac', 'Apellidos', 'Nombre', 'TelMovil', 'Fecha', 'Hora',
+    'EstadoCita', 'Tratamiento', 'Odontologo', 'Duracion', 'Notas'
+]
+FIRST_NAMES = ['Ana', 'Luis', 'Carmen', 'Javier', 'Lucía', 'Pablo', 'Marta', 'Sergio', 'Elena', 'David']
+LAST_NAMES = ['García', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz', 'Moreno']
+TREATMENTS = ['Revisión General', 'Mensualidad Ortodoncia', 'Limpieza', 'Empaste', 'Endodoncia', 'Extracción']
+DOCTORS = ['Dra. Virginia Tresgallo', 'Dr. Mario Rubio', 'Dra. Irene García']
+STATUSES = ['planificada', 'confirmada', 'cancelada', 'finalizada']
+COLORS = [None, 'AMARILLO', 'AZUL', 'VERDE']
+
+
+def default_bench_db_name() -> str:
+    return f"{os.environ.get('DB_NAME', 'app')}_bench"
+
+
+def _phone(i: int) -> str:
+    return f"6{i:08d}"
+
+
+def _name(rng: random.Random) -> Tuple[str, str]:
+    return rng.choice(FIRST_NAMES), f"{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def generate_sheet_rows(appointments: int, patients: int, seed: int = 42, days_span: int = 180) -> Iterator[List[str]]:
+    """Rows in the Google Sheet layout (header row first), spread around today"""
+    rng = random.Random(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    yield SHEET_HEADERS
+    for i in range(appointments):
+        patient = rng.randrange(max(patients, 1))
+        nombre, apellidos = _name(random.Random(patient))
+        fecha = today + timedelta(days=rng.randint(-days_span, days_span))
+        yield [
+            f"R{i:07d}", '', str(patient), str(patient), apellidos, nombre, _phone(patient),
+            fecha.strftime('%d/%m/%Y'), f"{rng.randint(9, 19)}:{rng.choice(['00', '15', '30', '45'])}",
+            rng.choice(STATUSES).capitalize(), rng.choice(TREATMENTS), rng.choice(DOCTORS),
+            str(rng.choice([15, 30, 45, 60])), ''
+        ]
+
+
+def write_sheet_csv(path, appointments: int, patients: int, seed: int = 42) -> Path:
+    """Write a synthetic sheet as CSV, streaming rows to disk"""
+    path = Path(path)
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        csv.writer(handle).writerows(generate_sheet_rows(appointments, patients, seed))
+    return path
+
+
+async def insert_in_batches(collection, documents: Iterator[Dict], batch_size: int = INSERT_BATCH_SIZE) -> int:
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+async def populate_collections(db, appointments: int, patients: int, contacts: int, messages: int,
+                               seed: int = 42, days_span: int = 180) -> Dict[str, int]:
+    """Fill patients, appointments, contacts, conversations and messages with native datetimes"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    counts = {}
+
+    patient_ids = [str(uuid.uuid4()) for _ in range(patients)]
+
+    def patient_docs():
+        for i, patient_id in enumerate(patient_ids):
+            nombre, apellidos = _name(random.Random(i))
+            yield {
+                'id': patient_id, 'name': f"{nombre} {apellidos}", 'phone': _phone(i),
+                'email': '', 'notes': '', 'created_at': now - timedelta(days=rng.randint(0, 1000))
+            }
+
+    def appointment_docs():
+        for i in range(appointments):
+            patient = rng.randrange(max(patients, 1))
+            date = now.replace(minute=0, second=0, microsecond=0) + timedelta(
+                days=rng.randint(-days_span, days_span), hours=rng.randint(-8, 8)
+            )
+            doc = {
+                'id': str(uuid.uuid4()),
+                'registro': f"R{i:07d}",
+                'patient_id': patient_ids[patient] if patient_ids else None,
+                'patient_name': f"Paciente {patient}",
+                'patient_phone': _phone(patient),
+                'title': rng.choice(TREATMENTS),
+                'date': date,
+                'duration_minutes': 30,
+                'notes': '',
+                'status': rng.choice(STATUSES),
+                'doctor': rng.choice(DOCTORS),
+                'reminder_enabled': True,
+                'reminder_minutes_before': 1440,
+                'reminder_sent': False,
+                'created_at': now,
+            }
+            due_at = compute_reminder_due_at(doc)
+            if due_at:
+                doc['reminder_due_at'] = due_at
+            yield doc
+
+    counts['patients'] = await insert_in_batches(db.patients, patient_docs())
+    counts['appointments'] = await insert_in_batches(db.appointments, appointment_docs())
+
+    contact_ids = [str(uuid.uuid4()) for _ in range(contacts)]
+    conversation_ids = [str(uuid.uuid4()) for _ in range(contacts)]
+
+    def contact_docs():
+        for i, contact_id in enumerate(contact_ids):
+            yield {
+                'id': contact_id, 'phone': _phone(i), 'phone_digits': _phone(i), 'name': f"Contacto {i}",
+                'name_lower': f"contacto {i}", 'whatsapp_id': f"{_phone(i)}@s.whatsapp.net", 'created_at': now, 'updated_at': now
+            }
+
+    def conversation_docs():
+        for i, (conversation_id, contact_id) in enumerate(zip(conversation_ids, contact_ids)):
+            yield {
+                'id': conversation_id, 'contact_id': contact_id, 'contact_name': f"Contacto {i}",
+                'contact_phone': _phone(i), 'color_code': rng.choice(COLORS), 'last_message': 'Hola',
+                'last_message_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)),
+                'unread_count': rng.randint(0, 5), 'created_at': now, 'updated_at': now
+            }
+
+    def message_docs():
+        for i in range(messages):
+            index = rng.randrange(max(contacts, 1))
+            timestamp = now - timedelta(seconds=rng.randint(0, 60 * 60 * 24 * 90))
+            yield {
+                'id': str(uuid.uuid4()), 'conversation_id': conversation_ids[index],
+                'contact_id': contact_ids[index], 'from_me': rng.random() < 0.4, 'message_type': 'text',
+                'text': f"Mensaje de prueba {i}", 'media_url': None, 'timestamp': timestamp,
+                'transcription': None, 'created_at': timestamp
+            }
+
+    counts['contacts'] = await insert_in_batches(db.contacts, contact_docs())
+    counts['conversations'] = await insert_in_batches(db.conversations, conversation_docs())
+    counts['messages'] = await insert_in_batches(db.messages, message_docs()) if contacts else 0
+    return counts
+
+
+async def main(args):
+    if args.db == os.environ.get('DB_NAME') and not args.allow_main_db:
+        raise SystemExit("❌ Refusing to write synthetic data into the main database (use --allow-main-db)")
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    db = client[args.db]
+    try:
+        if args.drop:
+            await client.drop_database(args.db)
+            print(f"🗑️ Base de datos {args.db} eliminada")
+
+        started = time.perf_counter()
+        counts = await populate_collections(
+            db, args.appointments, args.patients, args.contacts, args.messages, seed=args.seed
+        )
+        print(f"✅ Datos sintéticos en {args.db}: {counts} ({time.perf_counter() - started:.1f}s)")
+
+        if args.sheet_csv:
+            path = write_sheet_csv(args.sheet_csv, args.appointments, args.patients, seed=args.seed)
+            print(f"✅ Hoja sintética escrita en {path}")
+    finally:
+        client.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos para benchmarks")
+    parser.add_argument('--db', default=default_bench_db_name(), help="Base de datos destino (por defecto <DB_NAME>_bench)")
+    parser.add_argument('--appointments', type=int, default=100_000)
+    parser.add_argument('--patients', type=int, default=20_000)
+    parser.add_argument('--contacts', type=int, default=5_000)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sheet-csv', help="Escribe también una hoja sintética en este CSV")
+    parser.add_argument('--drop', action='store_true', help="Vacía la base de datos destino antes de generar")
+    parser.add_argument('--allow-main-db', action='store_true')
+    return parser
+
+
+if __name__ == "__main__":
+    asyncio.run(main(build_parser().parse_args()))
@@ -0,0 +1,101 @@
+"""
+Contact Resolution Cache
+Bounded in-process LRU/TTL cache of phone -> contact -> conversation identities
+Only identity fields are cached (ids, phone, name); counters and classification
+always come from MongoDB.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+MAX_ENTRIES = int(os.environ.get('CONTACT_CACHE_MAX_ENTRIES', 5000))
+TTL_SECONDS = float(os.environ.get('CONTACT_CACHE_TTL_SECONDS', 600))
+
+CONTACT_FIELDS = ('id', 'phone', 'name')
+CONVERSATION_FIELDS = ('id', 'contact_id', 'contact_name', 'contact_phone')
+
+
+def _pick(document: Dict, fields: Tuple[str, ...]) -> Dict:
+    return {field: document.get(field) for field in fields}
+
+
+class ContactCache:
+    """
+    Two kinds of entries share one LRU:
+      ('phone', phone)          -> {'contact': {...}, 'conversation': {...}}
+      ('conversation', conv_id) -> {...conversation identity...}
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _get(self, key: Tuple[str, str]) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        return entry[1]
+
+    def _put(self, key: Tuple[str, str], value: Dict):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def _pop(self, key: Tuple[str, str]):
+        if self._entries.pop(key, None) is not None:
+            self._stats['invalidations'] += 1
+
+    def get_by_phone(self, phone: str) -> Optional[Dict]:
+        """{'contact': ..., 'conversation': ...} for a phone, or None"""
+        return self._get(('phone', phone))
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        return self._get(('conversation', conversation_id))
+
+    def put(self, contact: Dict, conversation: Dict):
+        """Remember a resolved contact and its conversation"""
+        conversation = _pick(conversation, CONVERSATION_FIELDS)
+        self._put(('phone', contact['phone']), {'contact': _pick(contact, CONTACT_FIELDS), 'conversation': conversation})
+        self._put(('conversation', conversation['id']), conversation)
+
+    def put_conversation(self, conversation: Dict):
+        self._put(('conversation', conversation['id']), _pick(conversation, CONVERSATION_FIELDS))
+
+    def invalidate_phone(self, phone: str):
+        entry = self._entries.get(('phone', phone))
+        if entry is not None:
+            self._pop(('conversation', entry[1]['conversation']['id']))
+        self._pop(('phone', phone))
+
+    def invalidate_conversation(self, conversation_id: str, phone: Optional[str] = None):
+        entry = self._entries.get(('conversation', conversation_id))
+        phone = phone or (entry[1].get('contact_phone') if entry is not None else None)
+        if phone:
+            self._pop(('phone', phone))
+        self._pop(('conversation', conversation_id))
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        lookups = self._stats['hits'] + self._stats['misses']
+        return {
+            **self._stats,
+            'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+        }
+
+
+contact_cache = ContactCache()
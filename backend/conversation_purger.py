@@ -0,0 +1,224 @@
+"""
+Conversation Purger
+Deleting a conversation removes it from the inbox at once and records a purge job;
+its messages and button responses are deleted afterwards in bounded batches
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+# Documentos borrados por lote y pausa entre lotes, para no saturar MongoDB
+BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 1000))
+PAUSE_SECONDS = float(os.environ.get('PURGE_PAUSE_SECONDS', 0.2))
+# Un trabajo 'running' con el lease vencido se considera abandonado
+LEASE = timedelta(seconds=int(os.environ.get('PURGE_LEASE_SECONDS', 300)))
+MAX_SLEEP_SECONDS = 300
+# Reintentos de un trabajo que falla, con espera creciente; después queda 'failed'
+MAX_ATTEMPTS = int(os.environ.get('PURGE_MAX_ATTEMPTS', 5))
+RETRY_BASE_SECONDS = float(os.environ.get('PURGE_RETRY_BASE_SECONDS', 30))
+
+# Colecciones con documentos que cuelgan de una conversación
+PURGED_COLLECTIONS = ('messages', 'button_responses')
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Back-off before the next attempt of a job that failed attempts times"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), MAX_SLEEP_SECONDS))
+
+
+class ConversationPurger:
+    """
+    Worker over the purge_jobs collection
+    Jobs are claimed with a lease that is renewed after every batch, so a restart
+    or a second app process picks up an abandoned job where it stopped. A failing
+    job is retried with exponential back-off (next_attempt_at) and marked 'failed'
+    after MAX_ATTEMPTS, so it cannot starve the jobs behind it.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._stats = {'jobs_done': 0, 'jobs_failed': 0, 'deleted': 0}
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def enqueue(self, conversation: Dict) -> Dict:
+        """Record a purge job for an already removed conversation"""
+        job = {
+            'id': str(uuid.uuid4()),
+            'conversation_id': conversation['id'],
+            'contact_phone': conversation.get('contact_phone'),
+            'status': 'pending',
+            'attempts': 0,
+            'deleted': {name: 0 for name in PURGED_COLLECTIONS},
+            'created_at': datetime.now(timezone.utc),
+        }
+        await self.db.purge_jobs.insert_one(dict(job))
+        self.notify()
+        return job
+
+    async def claim(self) -> Optional[Dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db.purge_jobs.find_one_and_update(
+            {'$or': [
+                {'status': 'pending', 'next_attempt_at': {'$not': {'$gt': now}}},
+                {'status': 'running', 'lease_until': {'$lt': now}},
+            ]},
+            {
+                '$set': {
+                    'status': 'running', 'lease_until': now + LEASE, 'lease_owner': self.worker_id,
+                    'started_at': now,
+                },
+                # Un trabajo abandonado a medias (lease vencido) también cuenta como intento
+                '$inc': {'attempts': 1},
+            },
+            projection={'_id': 0},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _delete_batch(self, collection_name: str, conversation_id: str) -> int:
+        collection = self.db[collection_name]
+        ids = [
+            doc['_id'] async for doc in
+            collection.find({'conversation_id': conversation_id}, {'_id': 1}).limit(BATCH_SIZE)
+        ]
+        if not ids:
+            return 0
+        result = await collection.delete_many({'_id': {'$in': ids}})
+        return result.deleted_count
+
+    async def purge(self, job: Dict):
+        lease_filter = {'id': job['id'], 'lease_owner': self.worker_id}
+        deleted = dict(job.get('deleted') or {})
+        if job.get('attempts', 1) > MAX_ATTEMPTS:
+            # Abandonado una y otra vez con el lease vencido (p. ej. el proceso muere al purgarlo)
+            await self._fail(job, lease_filter, deleted, job.get('error') or 'lease expired too many times')
+            return
+        try:
+            for collection_name in PURGED_COLLECTIONS:
+                while True:
+                    count = await self._delete_batch(collection_name, job['conversation_id'])
+                    if not count:
+                        break
+                    deleted[collection_name] = deleted.get(collection_name, 0) + count
+                    self._stats['deleted'] += count
+                    # Progreso y renovación del lease tras cada lote
+                    result = await self.db.purge_jobs.update_one(lease_filter, {'$set': {
+                        'deleted': deleted,
+                        'lease_until': datetime.now(timezone.utc) + LEASE,
+                    }})
+                    if result.matched_count == 0:
+                        logger.warning(f"Lost lease on purge job {job['id']}")
+                        return
+                    event_bus.publish('conversation.purge', {
+                        'job_id': job['id'], 'conversation_id': job['conversation_id'],
+                        'status': 'running', 'deleted': deleted,
+                    })
+                    await asyncio.sleep(PAUSE_SECONDS)
+        except Exception as e:
+            attempts = job.get('attempts', 1)
+            logger.error(f"Error purging conversation {job['conversation_id']} (attempt {attempts}): {e}")
+            self._stats['jobs_failed'] += 1
+            if attempts >= MAX_ATTEMPTS:
+                await self._fail(job, lease_filter, deleted, str(e))
+                return
+            # Vuelve a 'pending' con espera creciente; los trabajos siguientes no esperan
+            await self.db.purge_jobs.update_one(lease_filter, {
+                '$set': {
+                    'status': 'pending', 'error': str(e), 'deleted': deleted,
+                    'next_attempt_at': datetime.now(timezone.utc) + retry_delay(attempts),
+                },
+                '$unset': {'lease_until': '', 'lease_owner': ''},
+            })
+            return
+
+        finished_at = datetime.now(timezone.utc)
+        await self.db.purge_jobs.update_one(lease_filter, {
+            '$set': {'status': 'done', 'deleted': deleted, 'finished_at': finished_at},
+            '$unset': {'lease_until': '', 'lease_owner': '', 'error': '', 'next_attempt_at': ''},
+        })
+        self._stats['jobs_done'] += 1
+        event_bus.publish('conversation.purge', {
+            'job_id': job['id'], 'conversation_id': job['conversation_id'], 'status': 'done', 'deleted': deleted,
+        })
+        print(f"🗑️ Conversación {job['conversation_id']} purgada: {deleted}")
+
+    async def _fail(self, job: Dict, lease_filter: Dict, deleted: Dict, error: str):
+        """Give up on a job: it stays listed as 'failed' and no longer blocks the queue"""
+        await self.db.purge_jobs.update_one(lease_filter, {
+            '$set': {'status': 'failed', 'error': error, 'deleted': deleted, 'finished_at': datetime.now(timezone.utc)},
+            '$unset': {'lease_until': '', 'lease_owner': '', 'next_attempt_at': ''},
+        })
+        logger.error(f"Purge job {job['id']} failed after {job.get('attempts')} attempts: {error}")
+        event_bus.publish('conversation.purge', {
+            'job_id': job['id'], 'conversation_id': job['conversation_id'], 'status': 'failed', 'deleted': deleted,
+        })
+
+    async def seconds_until_next_attempt(self) -> float:
+        """Seconds until the earliest job waiting for a retry, capped at MAX_SLEEP_SECONDS"""
+        job = await self.db.purge_jobs.find_one(
+            {'status': 'pending', 'next_attempt_at': {'$exists': True}},
+            {'_id': 0, 'next_attempt_at': 1},
+            sort=[('next_attempt_at', 1)],
+        )
+        if not job:
+            return MAX_SLEEP_SECONDS
+        delta = (job['next_attempt_at'] - datetime.now(timezone.utc)).total_seconds()
+        return min(max(delta, 0), MAX_SLEEP_SECONDS)
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                while True:
+                    job = await self.claim()
+                    if not job:
+                        break
+                    await self.purge(job)
+                sleep_for = await self.seconds_until_next_attempt()
+            except Exception as e:
+                logger.error(f"Error in conversation purger: {e}")
+                sleep_for = 60
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def list_jobs(self, limit: int = 50) -> List[Dict]:
+        return await self.db.purge_jobs.find({}, {'_id': 0, 'lease_owner': 0}).sort(
+            'created_at', -1
+        ).limit(limit).to_list(limit)
+
+    def get_stats(self) -> Dict:
+        return dict(self._stats)
+
+
+_purger: Optional[ConversationPurger] = None
+
+
+def start_conversation_purger(db) -> ConversationPurger:
+    """Create the process-wide purger and start its loop (it also resumes pending jobs)"""
+    global _purger
+    _purger = ConversationPurger(db)
+    asyncio.create_task(_purger.run())
+    return _purger
+
+
+def get_conversation_purger() -> ConversationPurger:
+    if _purger is None:
+        raise RuntimeError("Conversation purger not started")
+    return _purger
@@ -0,0 +1,134 @@
+"""
+Dashboard Summary
+Everything the dashboard shows, computed with one $facet aggregation per collection
+and cached for a few seconds
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+# Segundos que se reutiliza un resumen; el panel se recarga con cada evento en vivo
+CACHE_TTL_SECONDS = float(os.environ.get('DASHBOARD_CACHE_TTL_SECONDS', 10))
+# Máximo de citas del día y de conversaciones prioritarias en la respuesta
+MAX_ITEMS = int(os.environ.get('DASHBOARD_MAX_ITEMS', 200))
+
+PRIORITY_COLORS = ['AMARILLO', 'AZUL']
+
+APPOINTMENT_FIELDS = {
+    '_id': 0, 'id': 1, 'date': 1, 'hora': 1, 'duration_minutes': 1, 'patient_name': 1,
+    'title': 1, 'notes': 1, 'status': 1, 'doctor': 1, 'reminder_sent': 1
+}
+CONVERSATION_FIELDS = {
+    '_id': 0, 'id': 1, 'contact_name': 1, 'contact_phone': 1, 'color_code': 1,
+    'last_message': 1, 'last_message_at': 1, 'unread_count': 1
+}
+
+
+async def _appointments_summary(db, window_start: datetime, window_end: datetime) -> Dict:
+    pipeline = [
+        {'$match': {'date': {'$gte': window_start, '$lt': window_end}}},
+        {'$facet': {
+            'today': [
+                {'$sort': {'date': 1, 'id': 1}},
+                {'$limit': MAX_ITEMS},
+                {'$project': APPOINTMENT_FIELDS},
+            ],
+            'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}],
+            'reminders_sent': [{'$match': {'reminder_sent': True}}, {'$count': 'count'}],
+        }},
+    ]
+    result = (await db.appointments.aggregate(pipeline).to_list(1) or [{}])[0]
+    by_status = {item['_id']: item['count'] for item in result.get('by_status', [])}
+    reminders_sent = result.get('reminders_sent') or [{'count': 0}]
+    return {
+        'today': result.get('today', []),
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'reminders_sent': reminders_sent[0]['count'],
+    }
+
+
+async def _conversations_summary(db) -> Dict:
+    pipeline = [
+        {'$facet': {
+            'by_color': [{'$group': {
+                '_id': '$color_code',
+                'conversations': {'$sum': 1},
+                'unread': {'$sum': {'$ifNull': ['$unread_count', 0]}},
+            }}],
+            'priority': [
+                {'$match': {'color_code': {'$in': PRIORITY_COLORS}}},
+                {'$sort': {'last_message_at': -1, 'id': -1}},
+                {'$limit': MAX_ITEMS},
+                {'$project': CONVERSATION_FIELDS},
+            ],
+        }},
+    ]
+    result = (await db.conversations.aggregate(pipeline).to_list(1) or [{}])[0]
+    # Las conversaciones sin clasificar van bajo 'SIN_CLASIFICAR'
+    by_color = {
+        item['_id'] or 'SIN_CLASIFICAR': {'conversations': item['conversations'], 'unread': item['unread']}
+        for item in result.get('by_color', [])
+    }
+    return {
+        'by_color': by_color,
+        'unread_total': sum(counts['unread'] for counts in by_color.values()),
+        'priority': result.get('priority', []),
+    }
+
+
+async def build_dashboard_summary(db, window_start: datetime, window_end: datetime) -> Dict:
+    appointments, conversations = await asyncio.gather(
+        _appointments_summary(db, window_start, window_end),
+        _conversations_summary(db),
+    )
+    return {
+        'generated_at': datetime.now(timezone.utc),
+        'window': {'from': window_start, 'to': window_end},
+        'appointments': appointments,
+        'conversations': conversations,
+    }
+
+
+class DashboardSummaryCache:
+    """TTL cache per day window; concurrent misses for the same window share one build"""
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[datetime, datetime], Tuple[float, Dict]] = {}
+        self._locks: Dict[Tuple[datetime, datetime], asyncio.Lock] = {}
+        self._stats = {'hits': 0, 'misses': 0}
+
+    async def get(self, db, window_start: datetime, window_end: datetime) -> Dict:
+        key = (window_start, window_end)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._stats['hits'] += 1
+            return entry[1]
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Otra petición pudo construirlo mientras esperábamos
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+            summary = await build_dashboard_summary(db, window_start, window_end)
+            # Solo se guardan las ventanas vigentes (normalmente la de hoy)
+            now = time.monotonic()
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[key] = (now + self.ttl, summary)
+            self._locks = {k: v for k, v in self._locks.items() if k in self._entries or v.locked()}
+            return summary
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        return {**self._stats, 'entries': len(self._entries), 'ttl_seconds': self.ttl}
+
+
+dashboard_cache = DashboardSummaryCache()
@@ -0,0 +1,22 @@
+"""
+Datetime helpers
+Dates are stored in MongoDB as native UTC datetimes, never as ISO strings
+"""
+from datetime import datetime, timezone
+
+
+def to_utc_datetime(value):
+    """
+    Convert an ISO string, epoch seconds or datetime to an aware UTC datetime
+    Naive values are assumed to already be in UTC. Returns None for empty values.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if isinstance(value, str):
+        # fromisoformat no acepta 'Z' en todas las versiones
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
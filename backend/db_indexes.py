@@ -0,0 +1,287 @@
+"""
+MongoDB Index Manager
+Declares the indexes each collection needs and creates them idempotently on startup
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+# Nombre alternativo con el que se construye la definición nueva de un índice cambiado
+REBUILD_SUFFIX = '__rebuild'
+
+WEBHOOK_EVENT_TTL_DAYS = int(os.environ.get('WEBHOOK_EVENT_TTL_DAYS', 7))
+PURGE_JOB_TTL_DAYS = int(os.environ.get('PURGE_JOB_TTL_DAYS', 30))
+
+# Índices requeridos por colección.
+# Cada entrada: nombre, claves y opciones que se pasan tal cual a create_index.
+INDEX_SPECS: Dict[str, List[Dict]] = {
+    'appointments': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {
+            'name': 'registro_unique',
+            'keys': [('registro', ASCENDING)],
+            # Solo las citas sincronizadas desde Google Sheets tienen registro
+            'options': {'unique': True, 'partialFilterExpression': {'registro': {'$type': 'string'}}},
+        },
+        {'name': 'patient_id', 'keys': [('patient_id', ASCENDING)], 'options': {}},
+        {'name': 'date_id', 'keys': [('date', ASCENDING), ('id', ASCENDING)], 'options': {}},
+        {'name': 'doctor_date', 'keys': [('doctor', ASCENDING), ('date', ASCENDING)], 'options': {}},
+        # Cola de recordatorios: solo las citas con recordatorio pendiente tienen el campo
+        {'name': 'reminder_due_at', 'keys': [('reminder_due_at', ASCENDING)], 'options': {'sparse': True}},
+        {'name': 'reminder_lease_until', 'keys': [('reminder_lease_until', ASCENDING)], 'options': {'sparse': True}},
+    ],
+    'patients': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'phone', 'keys': [('phone', ASCENDING)], 'options': {}},
+    ],
+    'contacts': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {
+            'name': 'phone',
+            'keys': [('phone', ASCENDING)],
+            # Un contacto por teléfono: base de los upserts de contactos
+            'options': {'unique': True, 'partialFilterExpression': {'phone': {'$type': 'string'}}},
+        },
+        {'name': 'updated_at', 'keys': [('updated_at', DESCENDING)], 'options': {}},
+        # Búsqueda: prefijo de teléfono normalizado, prefijo y texto del nombre
+        {'name': 'phone_digits', 'keys': [('phone_digits', ASCENDING)], 'options': {}},
+        {'name': 'name_lower', 'keys': [('name_lower', ASCENDING), ('id', ASCENDING)], 'options': {}},
+        {
+            'name': 'name_text',
+            'keys': [('name', TEXT)],
+            'options': {'weights': {'name': 1}, 'default_language': 'spanish'},
+        },
+    ],
+    'conversations': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {
+            'name': 'contact_id',
+            'keys': [('contact_id', ASCENDING)],
+            # Una conversación por contacto: base de los upserts de conversaciones
+            'options': {'unique': True, 'partialFilterExpression': {'contact_id': {'$type': 'string'}}},
+        },
+        # Bandeja paginada por cursor (last_message_at, id), con y sin filtro de color
+        {'name': 'last_message_at', 'keys': [('last_message_at', DESCENDING), ('id', DESCENDING)], 'options': {}},
+        {
+            'name': 'color_last_message_at',
+            'keys': [('color_code', ASCENDING), ('last_message_at', DESCENDING), ('id', DESCENDING)],
+            'options': {},
+        },
+        {'name': 'updated_at', 'keys': [('updated_at', ASCENDING)], 'options': {}},
+    ],
+    'messages': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {
+            # Historial paginado por cursor (timestamp, id) dentro de la conversación
+            'name': 'conversation_timestamp',
+            'keys': [('conversation_id', ASCENDING), ('timestamp', DESCENDING), ('id', DESCENDING)],
+            'options': {},
+        },
+        {
+            'name': 'text_search',
+            'keys': [('text', TEXT), ('transcription', TEXT)],
+            'options': {'weights': {'text': 10, 'transcription': 5}, 'default_language': 'spanish'},
+        },
+    ],
+    'webhook_events': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'status_received_at', 'keys': [('status', ASCENDING), ('received_at', ASCENDING)], 'options': {}},
+        # Los eventos procesados se borran solos pasado WEBHOOK_EVENT_TTL_DAYS
+        {
+            'name': 'processed_at_ttl',
+            'keys': [('processed_at', ASCENDING)],
+            'options': {'expireAfterSeconds': WEBHOOK_EVENT_TTL_DAYS * 24 * 3600},
+        },
+    ],
+    'button_responses': [
+        {'name': 'conversation_id', 'keys': [('conversation_id', ASCENDING)], 'options': {}},
+    ],
+    'purge_jobs': [
+        {'name': 'id_unique', 'keys': [('id', ASCENDING)], 'options': {'unique': True}},
+        {'name': 'status_created_at', 'keys': [('status', ASCENDING), ('created_at', ASCENDING)], 'options': {}},
+        {'name': 'created_at', 'keys': [('created_at', DESCENDING)], 'options': {}},
+        # Los trabajos terminados se borran solos pasado PURGE_JOB_TTL_DAYS
+        {
+            'name': 'finished_at_ttl',
+            'keys': [('finished_at', ASCENDING)],
+            'options': {'expireAfterSeconds': PURGE_JOB_TTL_DAYS * 24 * 3600},
+        },
+    ],
+}
+
+# Opciones que MongoDB devuelve en list_indexes y que comparamos con la declaración
+_COMPARED_OPTIONS = (
+    'unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds', 'weights', 'default_language'
+)
+
+
+def _index_matches(existing: Dict, spec: Dict) -> bool:
+    """Check if an existing index has the same keys and options as the declared one"""
+    existing_keys = [
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in existing['key'].items()
+    ]
+    spec_keys = list(spec['keys'])
+    if any(direction == TEXT for _, direction in spec_keys):
+        # Los índices de texto se listan como _fts/_ftsx; sus campos se comparan en weights
+        spec_keys = [(field, direction) for field, direction in spec_keys if direction != TEXT]
+        spec_keys += [('_fts', 'text'), ('_ftsx', 1)]
+    if existing_keys != spec_keys:
+        return False
+    for option in _COMPARED_OPTIONS:
+        if existing.get(option) != spec['options'].get(option):
+            # unique=False y ausencia de unique son equivalentes
+            if option == 'unique' and not existing.get(option) and not spec['options'].get(option):
+                continue
+            return False
+    return True
+
+
+def _existing_definition(index: Dict) -> Dict:
+    """Keys and options of an index as listed by MongoDB, to recreate it"""
+    keys = list(index['key'].items())
+    if '_fts' in index['key']:
+        # Un índice de texto se recrea a partir de sus weights
+        keys = [(field, TEXT) for field in index.get('weights', {})]
+    options = {option: index[option] for option in _COMPARED_OPTIONS if option in index}
+    return {'keys': keys, 'options': options}
+
+
+def _find_index(existing: Dict[str, Dict], name: str) -> Optional[Dict]:
+    """The declared index, under its name or the alternate name of a rebuild"""
+    return existing.get(name) or existing.get(f"{name}{REBUILD_SUFFIX}")
+
+
+async def _rebuild_index(collection, current: Dict, spec: Dict):
+    """
+    Replace an index whose definition changed without a window where it is missing
+    The new definition is built under the other name (declared or alternate) before
+    the old index is dropped; MongoDB cannot rename indexes, so an index may live
+    under its alternate name until its next rebuild. When both differ only in options
+    (or for a second text index) MongoDB rejects that; then the old index is dropped
+    first and restored if the new one fails.
+    """
+    name = spec['name']
+    new_name = name if current['name'] != name else f"{name}{REBUILD_SUFFIX}"
+    try:
+        await collection.create_index(spec['keys'], name=new_name, **spec['options'])
+    except OperationFailure:
+        pass
+    else:
+        await collection.drop_index(current['name'])
+        return
+
+    await collection.drop_index(current['name'])
+    try:
+        await collection.create_index(spec['keys'], name=name, **spec['options'])
+    except OperationFailure:
+        # Volver a la definición anterior (p. ej. no perder un índice único)
+        previous = _existing_definition(current)
+        await collection.create_index(previous['keys'], name=current['name'], **previous['options'])
+        raise
+
+
+# Un solo recorrido a la vez (arranque y POST /api/database/indexes)
+_build_lock: Optional[asyncio.Lock] = None
+
+
+async def ensure_indexes(db) -> Dict:
+    """
+    Create every declared index that is missing
+    Indexes whose definition changed are rebuilt (see _rebuild_index).
+    Errors are reported per index so a single failure never blocks startup.
+    """
+    global _build_lock
+    if _build_lock is None:
+        _build_lock = asyncio.Lock()
+
+    created, recreated, errors = [], [], []
+
+    async with _build_lock:
+        for collection_name, specs in INDEX_SPECS.items():
+            collection = db[collection_name]
+            existing = {}
+            async for index in collection.list_indexes():
+                existing[index['name']] = index
+
+            for spec in specs:
+                name = spec['name']
+                current = _find_index(existing, name)
+
+                if current and _index_matches(current, spec):
+                    continue
+
+                try:
+                    if current:
+                        await _rebuild_index(collection, current, spec)
+                    else:
+                        await collection.create_index(spec['keys'], name=name, **spec['options'])
+                    (recreated if current else created).append(f"{collection_name}.{name}")
+                except OperationFailure as e:
+                    # p. ej. duplicados que impiden crear un índice único
+                    errors.append({'index': f"{collection_name}.{name}", 'error': str(e)})
+
+    if created:
+        print(f"✅ Índices creados: {', '.join(created)}")
+    if recreated:
+        print(f"🔁 Índices recreados: {', '.join(recreated)}")
+    for error in errors:
+        print(f"❌ Error creando índice {error['index']}: {error['error']}")
+
+    return {'created': created, 'recreated': recreated, 'errors': errors}
+
+
+async def build_indexes_in_background(db):
+    """Startup task: index builds on large collections must not delay serving"""
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        print(f"❌ Error creando índices: {e}")
+
+
+async def report_indexes(db) -> Dict:
+    """
+    Report missing, unused and undeclared indexes per collection
+    Usage counters come from $indexStats and reset when mongod restarts.
+    """
+    report = {}
+
+    for collection_name, specs in INDEX_SPECS.items():
+        collection = db[collection_name]
+        declared = {spec['name']: spec for spec in specs}
+
+        existing = {}
+        async for index in collection.list_indexes():
+            existing[index['name']] = index
+
+        usage = {}
+        try:
+            async for stat in collection.aggregate([{'$indexStats': {}}]):
+                usage[stat['name']] = stat['accesses']['ops']
+        except OperationFailure:
+            # $indexStats no está disponible (p. ej. permisos limitados)
+            usage = None
+
+        missing = [
+            name for name, spec in declared.items()
+            if not _find_index(existing, name) or not _index_matches(_find_index(existing, name), spec)
+        ]
+        undeclared = [
+            name for name in existing
+            if name != '_id_' and name not in declared and name.removesuffix(REBUILD_SUFFIX) not in declared
+        ]
+        unused = []
+        if usage is not None:
+            unused = [name for name in existing if name != '_id_' and usage.get(name, 0) == 0]
+
+        report[collection_name] = {
+            'missing': missing,
+            'unused': unused,
+            'undeclared': undeclared,
+            'usage': usage,
+        }
+
+    return report
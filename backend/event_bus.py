@@ -0,0 +1,113 @@
+"""
+Event Bus
+In-process publish/subscribe of typed delta events, streamed to browsers over SSE
+Events are not persisted: a browser that reconnects to another process, or after
+a restart, receives a 'resync' event and reloads its data.
+"""
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+
+# Eventos pendientes por navegador; si se llena, se le pide recargar (resync)
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get('EVENT_BUS_QUEUE_SIZE', 500))
+# Eventos recientes que se reenvían a un navegador que se reconecta (Last-Event-ID)
+REPLAY_SIZE = int(os.environ.get('EVENT_BUS_REPLAY_SIZE', 1000))
+# Comentario periódico para que proxies y navegadores no cierren la conexión
+HEARTBEAT_SECONDS = float(os.environ.get('EVENT_BUS_HEARTBEAT_SECONDS', 15))
+
+
+class EventBus:
+    """
+    Fan-out of events to one bounded queue per subscriber
+    publish() never blocks: a subscriber that falls behind has its queue replaced
+    by a single 'resync' event.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, replay_size: int = REPLAY_SIZE):
+        self.queue_size = queue_size
+        # Los ids llevan el arranque del proceso: un Last-Event-ID de otro proceso no se confunde
+        self._boot = uuid.uuid4().hex[:8]
+        self._sequence = itertools.count(1)
+        self._recent = deque(maxlen=replay_size)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._stats = {'published': 0, 'resyncs': 0, 'connections': 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def _event(self, event_type: str, data: Dict, sequence: int) -> Dict:
+        return {'id': f"{self._boot}-{sequence}", 'seq': sequence, 'type': event_type, 'data': data, 'at': time.time()}
+
+    def publish(self, event_type: str, data: Optional[Dict] = None) -> Dict:
+        """Send an event to every subscriber; data must be JSON-encodable by FastAPI"""
+        event = self._event(event_type, jsonable_encoder(data or {}), next(self._sequence))
+        self._recent.append(event)
+        self._stats['published'] += 1
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._resync(queue)
+        return event
+
+    def _resync(self, queue: asyncio.Queue):
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(self._event('resync', {'reason': 'overflow'}, self._recent[-1]['seq']))
+        self._stats['resyncs'] += 1
+
+    def _replay(self, last_event_id: str):
+        """Events after last_event_id, or a resync event if they are no longer available"""
+        boot, _, sequence = last_event_id.partition('-')
+        if boot != self._boot or not sequence.isdigit():
+            return [self._event('resync', {'reason': 'restart'}, 0)]
+        sequence = int(sequence)
+        if self._recent and self._recent[0]['seq'] > sequence + 1:
+            return [self._event('resync', {'reason': 'expired'}, self._recent[-1]['seq'])]
+        return [event for event in self._recent if event['seq'] > sequence]
+
+    async def subscribe(self, last_event_id: Optional[str] = None) -> AsyncIterator[Optional[Dict]]:
+        """Yield events as they are published; None is yielded as a heartbeat"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        self._stats['connections'] += 1
+        try:
+            delivered = 0
+            if last_event_id:
+                for event in self._replay(last_event_id):
+                    delivered = max(delivered, event['seq'])
+                    yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Ya enviado durante el replay
+                if event['type'] != 'resync' and event['seq'] <= delivered:
+                    continue
+                yield event
+        finally:
+            self._subscribers.discard(queue)
+
+    def get_stats(self) -> Dict:
+        return {**self._stats, 'subscribers': self.subscriber_count, 'buffered': len(self._recent)}
+
+
+def format_sse(event: Optional[Dict]) -> str:
+    """Serialize an event (or a heartbeat for None) in text/event-stream format"""
+    if event is None:
+        return ": ping\n\n"
+    payload = json.dumps({'type': event['type'], 'data': event['data'], 'at': event['at']}, ensure_ascii=False)
+    return f"id: {event['id']}\ndata: {payload}\n\n"
+
+
+event_bus = EventBus()
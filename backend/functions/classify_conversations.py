@@ -4,6 +4,7 @@ Assigns color codes based on urgency and AI analysis
 """
 from datetime import datetime, timezone
 from automation_service import AIAssistant
+from event_bus import event_bus
 
 ai_assistant = AIAssistant()
 
@@ -51,12 +52,15 @@ async def classify_single_conversation(db, conversation_id: str, force=False):
             {
                 '$set': {
                     'color_code': classification,
-                    'classified_at': datetime.now(timezone.utc).isoformat(),
-                    'updated_at': datetime.now(timezone.utc).isoformat()
+                    'classified_at': datetime.now(timezone.utc),
+                    'updated_at': datetime.now(timezone.utc)
                 }
             }
         )
         
+        event_bus.publish('conversation.classified', {
+            'id': conversation_id, 'color_code': classification, 'manually_classified': False
+        })
         print(f"✅ Conversation classified as: {classification}")
         return {'success': True, 'classification': classification}
         
@@ -73,7 +77,7 @@ async def classify_all_conversations(db):
     try:
         # Get all conversations updated in last 24 hours
         from datetime import timedelta
-        cutoff_time = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=24)
         
         conversations = await db.conversations.find(
             {'updated_at': {'$gte': cutoff_time}}
@@ -0,0 +1,95 @@
+"""
+Contact and Conversation Upserts
+Get-or-create in a single round trip, race-free thanks to the unique indexes
+on contacts.phone and conversations.contact_id
+"""
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import uuid
+
+from search import normalize_name, normalize_phone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Los ids de mensajes contados de una conversación son internos de los contadores
+UPSERT_PROJECTION = {'_id': 0, 'counted_message_ids': 0}
+
+
+def _build_update(set_fields: Dict, insert_fields: Dict, inc: Optional[Dict] = None) -> Dict:
+    """$set / $setOnInsert / $inc document; a field may only appear in one operator"""
+    inc = inc or {}
+    update = {}
+    if set_fields:
+        update['$set'] = set_fields
+    insert_only = {
+        field: value for field, value in insert_fields.items()
+        if field not in set_fields and field not in inc and value is not None
+    }
+    if insert_only:
+        update['$setOnInsert'] = insert_only
+    if inc:
+        update['$inc'] = inc
+    return update
+
+
+def contact_update(phone: str, name: Optional[str] = None, whatsapp_id: Optional[str] = None,
+                   set_fields: Optional[Dict] = None) -> Dict:
+    """Upsert document for the contact with this phone (also used in bulk writes)"""
+    now = datetime.now(timezone.utc)
+    set_fields = {'updated_at': now, **(set_fields or {})}
+    # El nombre normalizado acompaña siempre al nombre (búsqueda por prefijo)
+    if 'name' in set_fields:
+        set_fields['name_lower'] = normalize_name(set_fields['name'])
+    return _build_update(
+        set_fields,
+        {
+            'id': str(uuid.uuid4()), 'name': name or phone, 'name_lower': normalize_name(name or phone),
+            'phone_digits': normalize_phone(phone), 'whatsapp_id': whatsapp_id, 'created_at': now
+        }
+    )
+
+
+def conversation_update(contact: Dict, set_fields: Optional[Dict] = None, inc: Optional[Dict] = None) -> Dict:
+    """Upsert document for the conversation of this contact (also used in bulk writes)"""
+    now = datetime.now(timezone.utc)
+    return _build_update(
+        {'updated_at': now, **(set_fields or {})},
+        {
+            'id': str(uuid.uuid4()),
+            'contact_name': contact['name'],
+            'contact_phone': contact['phone'],
+            'color_code': None,  # Will be classified by IA
+            'last_message': '',
+            'last_message_at': now,
+            'unread_count': 0,
+            'created_at': now,
+        },
+        inc
+    )
+
+
+async def _upsert(collection, query: Dict, update: Dict) -> Dict:
+    try:
+        return await collection.find_one_and_update(
+            query, update, projection=UPSERT_PROJECTION, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Un upsert concurrente insertó primero: ahora el documento existe y se actualiza
+        return await collection.find_one_and_update(
+            query, update, projection=UPSERT_PROJECTION, return_document=ReturnDocument.AFTER
+        )
+
+
+async def upsert_contact(db, phone: str, name: Optional[str] = None, whatsapp_id: Optional[str] = None,
+                         set_fields: Optional[Dict] = None) -> Dict:
+    """Return the contact with this phone, creating it if needed"""
+    return await _upsert(db.contacts, {'phone': phone}, contact_update(phone, name, whatsapp_id, set_fields))
+
+
+async def upsert_conversation(db, contact: Dict, set_fields: Optional[Dict] = None,
+                              inc: Optional[Dict] = None) -> Dict:
+    """Return the conversation of this contact, creating it if needed"""
+    return await _upsert(
+        db.conversations, {'contact_id': contact['id']}, conversation_update(contact, set_fields, inc)
+    )
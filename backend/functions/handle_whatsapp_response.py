@@ -4,6 +4,8 @@ Executes actions when patient clicks interactive buttons
 """
 from datetime import datetime, timezone
 
+from reminder_queue import reminder_due_update, merge_updates, notify_reminder_dispatcher
+
 async def handle_whatsapp_response(db, whatsapp_service_url: str, response_data: dict):
     """
     Handle button click response from patient
@@ -55,16 +57,18 @@ async def handle_whatsapp_response(db, whatsapp_service_url: str, response_data:
                 new_status = action.get('status', '')
                 appointment_id = action.get('appointment_id')
                 
-                if appointment_id:
+                existing = await db.appointments.find_one({'id': appointment_id}) if appointment_id else None
+                if existing:
+                    fields = {
+                        'status': new_status,
+                        'updated_at': datetime.now(timezone.utc)
+                    }
+                    # Mantener la cola de recordatorios al día (p.ej. una cancelación la saca de la cola)
                     await db.appointments.update_one(
                         {'id': appointment_id},
-                        {
-                            '$set': {
-                                'status': new_status,
-                                'updated_at': datetime.now(timezone.utc).isoformat()
-                            }
-                        }
+                        merge_updates({'$set': fields}, reminder_due_update({**existing, **fields}))
                     )
+                    notify_reminder_dispatcher()
                     results.append({'action': 'update_appointment', 'status': new_status})
             
             # ACTION 3: Send consent form
@@ -105,7 +109,7 @@ async def handle_whatsapp_response(db, whatsapp_service_url: str, response_data:
                     {
                         '$set': {
                             'color_code': new_color,
-                            'updated_at': datetime.now(timezone.utc).isoformat()
+                            'updated_at': datetime.now(timezone.utc)
                         }
                     }
                 )
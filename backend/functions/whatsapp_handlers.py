@@ -3,127 +3,248 @@ WhatsApp Message Handler
 Handles incoming messages, creates contacts, conversations and messages
 """
 from datetime import datetime, timezone
-from typing import Dict
+from typing import Dict, List
 import uuid
 
-async def handle_whatsapp_incoming(db, message_data: Dict):
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from contact_cache import contact_cache
+from event_bus import event_bus
+from functions.contact_upserts import contact_update, conversation_update
+
+
+def publish_message_activity(conversation: Dict, message: Dict, unread_delta: int = 0):
+    """Publish a new message and the resulting conversation delta to the live stream"""
+    event_bus.publish('message.created', {
+        field: value for field, value in message.items()
+        if field not in ('_id', 'buttons', 'transcription')
+    })
+    event_bus.publish('conversation.activity', {
+        'id': conversation['id'],
+        'contact_id': conversation.get('contact_id'),
+        'contact_name': conversation.get('contact_name'),
+        'contact_phone': conversation.get('contact_phone'),
+        'last_message': message['text'],
+        'last_message_at': message['timestamp'],
+        'unread_delta': unread_delta,
+    })
+
+
+# Ids de mensajes ya contados que guarda cada conversación; basta con cubrir los reintentos
+COUNTED_IDS_KEPT = 500
+
+
+def conversation_counter_update(messages: List[Dict], now: datetime) -> List[Dict]:
+    """
+    Pipeline update that counts a conversation's new messages exactly once
+    The conversation keeps the ids of its last counted messages, and only ids not
+    in that list raise unread_count, in the same atomic update. A retry after the
+    messages were stored (or counted) is therefore a no-op, however the events are
+    regrouped into batches.
+    """
+    latest = max(messages, key=lambda message: message['timestamp'])
+    counted = {'$ifNull': ['$counted_message_ids', []]}
+    # Una conversación recién creada tiene last_message vacío y last_message_at = ahora
+    is_latest = {'$or': [
+        {'$eq': [{'$ifNull': ['$last_message', '']}, '']},
+        {'$eq': [{'$ifNull': ['$last_message_at', None]}, None]},
+        {'$gte': [latest['timestamp'], '$last_message_at']},
+    ]}
+    return [
+        {'$set': {'_new_ids': {'$setDifference': [{'$literal': [message['id'] for message in messages]}, counted]}}},
+        {'$set': {
+            'unread_count': {'$add': [{'$ifNull': ['$unread_count', 0]}, {'$size': '$_new_ids'}]},
+            # Un mensaje enviado desde la app pudo llegar después
+            # $literal: un texto que empiece por '$' no es una ruta de campo
+            'last_message': {'$cond': [is_latest, {'$literal': latest['text']}, '$last_message']},
+            'last_message_at': {'$cond': [is_latest, latest['timestamp'], '$last_message_at']},
+            'counted_message_ids': {'$slice': [{'$concatArrays': [counted, '$_new_ids']}, -COUNTED_IDS_KEPT]},
+            'updated_at': now,
+        }},
+        {'$unset': '_new_ids'},
+    ]
+
+
+async def _bulk_upsert(collection, operations) -> int:
+    """Run upserts unordered; duplicate-key races mean the document exists already"""
+    if not operations:
+        return 0
+    try:
+        result = await collection.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    except BulkWriteError as e:
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        return e.details.get('nUpserted', 0)
+
+
+async def handle_whatsapp_incoming_batch(db, events: List[Dict]):
     """
-    Handle incoming WhatsApp message
-    Creates or updates Contact, Conversation and Message
+    Handle a batch of incoming WhatsApp messages
+    Events are grouped by sender: contacts and conversations are upserted once per
+    sender, messages are written with one insert_many and conversation counters
+    with one bulk_write. An event's optional 'event_id' becomes its message id, so
+    retrying a batch does not duplicate messages, and the counters only count
+    message ids they have not seen (see conversation_counter_update).
     """
     try:
-        # Extract message information
-        from_number = message_data.get('from', '').split('@')[0]
-        message_text = message_data.get('body', '')
-        message_type = message_data.get('type', 'text')
-        timestamp = message_data.get('timestamp', datetime.now(timezone.utc).timestamp())
+        now = datetime.now(timezone.utc)
         
-        # 1. Find or create Contact
-        contact = await db.contacts.find_one({'phone': from_number}, {'_id': 0})
+        # Agrupar por remitente conservando el orden de llegada
+        by_sender: Dict[str, List[Dict]] = {}
+        for event in events:
+            from_number = event.get('from', '').split('@')[0]
+            by_sender.setdefault(from_number, []).append(event)
+        phones = list(by_sender)
         
-        if not contact:
-            # Create new contact
-            contact = {
-                'id': str(uuid.uuid4()),
-                'phone': from_number,
-                'name': message_data.get('pushname', from_number),
-                'whatsapp_id': message_data.get('from'),
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
+        # Remitentes ya resueltos en caché: no necesitan upserts
+        contacts, conversations = {}, {}
+        unresolved = []
+        for phone in phones:
+            cached = contact_cache.get_by_phone(phone)
+            if cached:
+                contacts[phone] = cached['contact']
+                conversations[cached['contact']['id']] = cached['conversation']
+            else:
+                unresolved.append(phone)
+
+        # Una sola consulta confirma que las conversaciones en caché siguen existiendo
+        # (pudieron borrarse desde otro proceso); las que faltan pasan por los upserts
+        if contacts:
+            cached_ids = [conversations[contact['id']]['id'] for contact in contacts.values()]
+            existing = {
+                conversation['id'] async for conversation in
+                db.conversations.find({'id': {'$in': cached_ids}}, {'_id': 0, 'id': 1})
             }
-            await db.contacts.insert_one(contact)
-            print(f"✅ New contact created: {contact['name']}")
-        else:
-            # Update last interaction
-            await db.contacts.update_one(
-                {'id': contact['id']},
-                {'$set': {'updated_at': datetime.now(timezone.utc).isoformat()}}
+            for phone, contact in list(contacts.items()):
+                if conversations[contact['id']]['id'] not in existing:
+                    contact_cache.invalidate_phone(phone)
+                    del conversations[contact['id']]
+                    del contacts[phone]
+                    unresolved.append(phone)
+
+        # 1. Contacts: one bulk upsert for the unresolved senders, then one lookup
+        contact_operations = [
+            UpdateOne(
+                {'phone': phone},
+                contact_update(phone, name=by_sender[phone][0].get('pushname', phone),
+                               whatsapp_id=by_sender[phone][0].get('from')),
+                upsert=True
             )
+            for phone in unresolved
+        ]
+        contacts_created = await _bulk_upsert(db.contacts, contact_operations)
+        resolved_contacts = []
+        if unresolved:
+            async for contact in db.contacts.find({'phone': {'$in': unresolved}}, {'_id': 0}):
+                contacts[contact['phone']] = contact
+                resolved_contacts.append(contact)
         
-        # 2. Find or create Conversation
-        conversation = await db.conversations.find_one({'contact_id': contact['id']}, {'_id': 0})
+        # 2. Conversations: same pattern, keyed by contact
+        conversation_operations = [
+            UpdateOne({'contact_id': contact['id']}, conversation_update(contact), upsert=True)
+            for contact in resolved_contacts
+        ]
+        conversations_created = await _bulk_upsert(db.conversations, conversation_operations)
+        if resolved_contacts:
+            async for conversation in db.conversations.find(
+                {'contact_id': {'$in': [contact['id'] for contact in resolved_contacts]}},
+                {'_id': 0, 'counted_message_ids': 0}
+            ):
+                conversations[conversation['contact_id']] = conversation
+            for contact in resolved_contacts:
+                contact_cache.put(contact, conversations[contact['id']])
         
-        if not conversation:
-            # Create new conversation
-            conversation = {
-                'id': str(uuid.uuid4()),
-                'contact_id': contact['id'],
-                'contact_name': contact['name'],
-                'contact_phone': contact['phone'],
-                'color_code': None,  # Will be classified by IA
-                'last_message': message_text,
-                'last_message_at': datetime.fromtimestamp(timestamp).isoformat(),
-                'unread_count': 1,
-                'created_at': datetime.now(timezone.utc).isoformat(),
-                'updated_at': datetime.now(timezone.utc).isoformat()
-            }
-            await db.conversations.insert_one(conversation)
-            print(f"✅ New conversation created with {contact['name']}")
-        else:
-            # Update conversation
-            await db.conversations.update_one(
-                {'id': conversation['id']},
-                {
-                    '$set': {
-                        'last_message': message_text,
-                        'last_message_at': datetime.fromtimestamp(timestamp).isoformat(),
-                        'updated_at': datetime.now(timezone.utc).isoformat()
-                    },
-                    '$inc': {'unread_count': 1}
-                }
-            )
+        # 3. Messages: a single insert_many for the whole batch
+        messages = []
+        for phone, sender_events in by_sender.items():
+            contact = contacts[phone]
+            conversation = conversations[contact['id']]
+            for event in sender_events:
+                timestamp = event.get('timestamp') or now.timestamp()
+                messages.append({
+                    'id': event.get('event_id') or str(uuid.uuid4()),
+                    'conversation_id': conversation['id'],
+                    'contact_id': contact['id'],
+                    'from_me': False,
+                    'message_type': event.get('type', 'text'),
+                    'text': event.get('body', ''),
+                    'media_url': event.get('media_url'),
+                    'timestamp': datetime.fromtimestamp(float(timestamp), tz=timezone.utc),
+                    'transcription': None,  # Will be filled if it's audio
+                    'created_at': now
+                })
         
-        # 3. Save Message
-        message = {
-            'id': str(uuid.uuid4()),
-            'conversation_id': conversation['id'],
-            'contact_id': contact['id'],
-            'from_me': False,
-            'message_type': message_type,
-            'text': message_text,
-            'media_url': message_data.get('media_url'),
-            'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
-            'transcription': None,  # Will be filled if it's audio
-            'created_at': datetime.now(timezone.utc).isoformat()
-        }
-        await db.messages.insert_one(message)
-        print(f"✅ Message saved: {message_text[:50]}...")
+        duplicated = set()
+        try:
+            await db.messages.insert_many([dict(message) for message in messages], ordered=False)
+        except BulkWriteError as e:
+            # Mensajes ya guardados en un intento anterior del mismo lote
+            for error in e.details.get('writeErrors', []):
+                if error.get('code') != 11000:
+                    raise
+                duplicated.add(messages[error['index']]['id'])
+        inserted = [message for message in messages if message['id'] not in duplicated]
+        
+        # 4. Conversation counters: one bulk_write, including the messages stored by a
+        # previous attempt whose counters may not have been updated
+        per_conversation: Dict[str, List[Dict]] = {}
+        for message in messages:
+            per_conversation.setdefault(message['conversation_id'], []).append(message)
+        operations = [
+            UpdateOne({'id': conversation_id}, conversation_counter_update(conversation_messages, now))
+            for conversation_id, conversation_messages in per_conversation.items()
+        ]
+        if operations:
+            await db.conversations.bulk_write(operations, ordered=False)
+        print(f"✅ Batch saved: {len(inserted)} messages from {len(phones)} senders ({len(duplicated)} already stored)")
         
-        # 4. Auto-transcribe if audio
-        if message_type in ['audio', 'voice']:
-            from functions.transcribe_audio import transcribe_audio
-            await transcribe_audio(db, message['id'], message_data.get('media_url'))
+        conversations_by_id = {conversation['id']: conversation for conversation in conversations.values()}
+        for message in inserted:
+            # El contador de no leídos sube una vez por mensaje
+            publish_message_activity(conversations_by_id[message['conversation_id']], message, unread_delta=1)
         
-        # 5. Classify conversation (async)
+        # 5. Auto-transcribe audios and classify each conversation once
+        from functions.transcribe_audio import transcribe_audio
         from functions.classify_conversations import classify_single_conversation
-        await classify_single_conversation(db, conversation['id'])
+        for message in inserted:
+            if message['message_type'] in ['audio', 'voice']:
+                await transcribe_audio(db, message['id'], message['media_url'])
+        for conversation_id in per_conversation:
+            await classify_single_conversation(db, conversation_id)
         
         return {
             'success': True,
-            'contact_id': contact['id'],
-            'conversation_id': conversation['id'],
-            'message_id': message['id']
+            'messages': len(inserted),
+            'duplicates': len(duplicated),
+            'contacts_created': contacts_created,
+            'conversations_created': conversations_created,
+            'conversation_ids': list(per_conversation)
         }
         
     except Exception as e:
-        print(f"❌ Error handling incoming message: {e}")
+        print(f"❌ Error handling incoming batch: {e}")
         import traceback
         traceback.print_exc()
         return {'success': False, 'error': str(e)}
 
-
 async def whatsapp_send_message(db, whatsapp_service_url: str, conversation_id: str, message_text: str, buttons: list = None):
     """
     Send message to WhatsApp contact
     """
-    import httpx
+    from whatsapp_client import get_whatsapp_client
     
     try:
-        # Get conversation to find contact phone
-        conversation = await db.conversations.find_one({'id': conversation_id})
-        
+        # Get conversation to find contact phone (cached identity fields)
+        conversation = contact_cache.get_conversation(conversation_id)
         if not conversation:
-            return {'success': False, 'error': 'Conversation not found'}
+            conversation = await db.conversations.find_one(
+                {'id': conversation_id}, {'_id': 0, 'counted_message_ids': 0}
+            )
+            if not conversation:
+                return {'success': False, 'error': 'Conversation not found'}
+            contact_cache.put_conversation(conversation)
         
         contact_phone = conversation['contact_phone']
         
@@ -137,50 +258,50 @@ async def whatsapp_send_message(db, whatsapp_service_url: str, conversation_id:
         if buttons:
             payload['buttons'] = buttons
         
-        # Send via WhatsApp service
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{whatsapp_service_url}/send-message",
-                json=payload,
-                timeout=30.0
-            )
+        # Send via WhatsApp service (shared connection pool)
+        response = await get_whatsapp_client().post(
+            f"{whatsapp_service_url}/send-message",
+            json=payload,
+            timeout=30.0
+        )
+        
+        if response.status_code == 200:
+            # Save message to database
+            message = {
+                'id': str(uuid.uuid4()),
+                'conversation_id': conversation_id,
+                'contact_id': conversation['contact_id'],
+                'from_me': True,
+                'message_type': 'text',
+                'text': message_text,
+                'buttons': buttons,
+                'timestamp': datetime.now(timezone.utc),
+                'created_at': datetime.now(timezone.utc)
+            }
+            await db.messages.insert_one(message.copy())
             
-            if response.status_code == 200:
-                # Save message to database
-                message = {
-                    'id': str(uuid.uuid4()),
-                    'conversation_id': conversation_id,
-                    'contact_id': conversation['contact_id'],
-                    'from_me': True,
-                    'message_type': 'text',
-                    'text': message_text,
-                    'buttons': buttons,
-                    'timestamp': datetime.now(timezone.utc).isoformat(),
-                    'created_at': datetime.now(timezone.utc).isoformat()
-                }
-                await db.messages.insert_one(message.copy())
-                
-                # Update conversation
-                await db.conversations.update_one(
-                    {'id': conversation_id},
-                    {
-                        '$set': {
-                            'last_message': message_text,
-                            'last_message_at': datetime.now(timezone.utc).isoformat(),
-                            'updated_at': datetime.now(timezone.utc).isoformat()
-                        }
+            # Update conversation
+            await db.conversations.update_one(
+                {'id': conversation_id},
+                {
+                    '$set': {
+                        'last_message': message_text,
+                        'last_message_at': datetime.now(timezone.utc),
+                        'updated_at': datetime.now(timezone.utc)
                     }
-                )
-                
-                # Remove _id from message before returning (MongoDB adds it automatically)
-                message.pop('_id', None)
-                
-                print(f"✅ Message sent to {contact_phone}")
-                return {'success': True, 'message': message}
-            else:
-                print(f"❌ Failed to send message: {response.text}")
-                return {'success': False, 'error': response.text}
-                
+                }
+            )
+            
+            # Remove _id from message before returning (MongoDB adds it automatically)
+            message.pop('_id', None)
+            publish_message_activity(conversation, message)
+            
+            print(f"✅ Message sent to {contact_phone}")
+            return {'success': True, 'message': message}
+        else:
+            print(f"❌ Failed to send message: {response.text}")
+            return {'success': False, 'error': response.text}
+            
     except Exception as e:
         print(f"❌ Error sending message: {e}")
         return {'success': False, 'error': str(e)}
@@ -1,11 +1,18 @@
 """
 Messaging Routes - WhatsApp Conversations, Contacts, Messages
 """
-from fastapi import APIRouter, HTTPException, Request
-from typing import Dict
-from functions.whatsapp_handlers import handle_whatsapp_incoming, whatsapp_send_message
+from fastapi import APIRouter, HTTPException, Request, Response, Query
+from typing import Dict, Optional
+from functions.whatsapp_handlers import whatsapp_send_message
 from functions.handle_whatsapp_response import handle_whatsapp_response
 from functions.classify_conversations import classify_single_conversation, classify_all_conversations
+from functions.contact_upserts import upsert_contact, upsert_conversation
+from contact_cache import contact_cache
+from event_bus import event_bus
+from webhook_queue import get_webhook_queue
+from conversation_purger import get_conversation_purger
+from search import search as search_all, search_contacts, MAX_LIMIT as SEARCH_MAX_LIMIT
+from server import decode_cursor, encode_cursor, parse_date_param
 
 # Create router
 messaging_router = APIRouter(prefix="/api", tags=["messaging"])
@@ -14,6 +21,14 @@ messaging_router = APIRouter(prefix="/api", tags=["messaging"])
 db = None
 WHATSAPP_SERVICE_URL = None
 
+# Campos que necesita la lista de conversaciones (Messages.jsx, Dashboard.jsx)
+CONVERSATION_LIST_PROJECTION = {
+    '_id': 0, 'id': 1, 'contact_id': 1, 'contact_name': 1, 'contact_phone': 1,
+    'color_code': 1, 'last_message': 1, 'last_message_at': 1, 'unread_count': 1
+}
+# Conversación completa, sin los ids de mensajes contados (uso interno de los contadores)
+CONVERSATION_DETAIL_PROJECTION = {'_id': 0, 'counted_message_ids': 0}
+
 def init_messaging_routes(database, whatsapp_url):
     """Initialize messaging routes with database and WhatsApp URL"""
     global db, WHATSAPP_SERVICE_URL
@@ -25,15 +40,43 @@ def init_messaging_routes(database, whatsapp_url):
 # ============================================
 
 @messaging_router.get("/conversations")
-async def get_conversations(color: str = None):
-    """Get all conversations, optionally filtered by color"""
+async def get_conversations(
+    response: Response,
+    color: str = None,
+    before: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    full: bool = False,
+):
+    """
+    Get conversations, most recent first, optionally filtered by color
+    Only the fields the inbox renders are returned unless full=true.
+    With limit, the next page cursor (before=<last_message_at,id>) is returned in X-Next-Cursor.
+    """
     try:
         query = {}
         if color:
             query['color_code'] = color
+        if before:
+            before_at, before_id = decode_cursor(before, 'before')
+            before_at = parse_date_param(before_at, 'before')
+            query['$or'] = [
+                {'last_message_at': {'$lt': before_at}},
+                {'last_message_at': before_at, 'id': {'$lt': before_id}}
+            ]
+        
+        projection = CONVERSATION_DETAIL_PROJECTION if full else CONVERSATION_LIST_PROJECTION
+        cursor = db.conversations.find(query, projection).sort([('last_message_at', -1), ('id', -1)])
+        if limit:
+            cursor = cursor.limit(limit)
+        conversations = await cursor.to_list(None)
+        
+        if limit and len(conversations) == limit:
+            last = conversations[-1]
+            response.headers['X-Next-Cursor'] = encode_cursor(last['last_message_at'], last['id'])
         
-        conversations = await db.conversations.find(query, {'_id': 0}).sort('last_message_at', -1).to_list(None)
         return conversations
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -41,7 +84,7 @@ async def get_conversations(color: str = None):
 async def get_conversation(conversation_id: str):
     """Get a specific conversation"""
     try:
-        conversation = await db.conversations.find_one({'id': conversation_id}, {'_id': 0})
+        conversation = await db.conversations.find_one({'id': conversation_id}, CONVERSATION_DETAIL_PROJECTION)
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         return conversation
@@ -51,16 +94,42 @@ async def get_conversation(conversation_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @messaging_router.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str, limit: int = 50):
-    """Get messages for a conversation"""
+async def get_conversation_messages(
+    conversation_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    lean: bool = False,
+):
+    """
+    Get the newest messages of a conversation (oldest first)
+    Older pages are read with before=<timestamp,id>, returned in X-Next-Cursor when
+    there may be more. lean=true omits buttons and transcription.
+    """
     try:
-        messages = await db.messages.find(
-            {'conversation_id': conversation_id}, {'_id': 0}
-        ).sort('timestamp', -1).limit(limit).to_list(limit)
+        query = {'conversation_id': conversation_id}
+        if before:
+            before_at, before_id = decode_cursor(before, 'before')
+            before_at = parse_date_param(before_at, 'before')
+            query['$or'] = [
+                {'timestamp': {'$lt': before_at}},
+                {'timestamp': before_at, 'id': {'$lt': before_id}}
+            ]
+        
+        projection = {'_id': 0, 'buttons': 0, 'transcription': 0} if lean else {'_id': 0}
+        messages = await db.messages.find(query, projection).sort(
+            [('timestamp', -1), ('id', -1)]
+        ).limit(limit).to_list(limit)
+        
+        if len(messages) == limit:
+            oldest = messages[-1]
+            response.headers['X-Next-Cursor'] = encode_cursor(oldest['timestamp'], oldest['id'])
         
         # Reverse to show oldest first
         messages.reverse()
         return messages
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -90,71 +159,61 @@ async def send_message_to_conversation(conversation_id: str, request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@messaging_router.delete("/conversations/{conversation_id}")
+@messaging_router.delete("/conversations/{conversation_id}", status_code=202)
 async def delete_conversation(conversation_id: str):
-    """Eliminar una conversación y sus mensajes"""
+    """
+    Eliminar una conversación y sus mensajes
+    The conversation leaves the inbox at once; its messages are purged in the
+    background (progress in /purge-jobs).
+    """
     try:
-        # Eliminar mensajes
-        await db.messages.delete_many({'conversation_id': conversation_id})
-        
         # Eliminar conversación
-        result = await db.conversations.delete_one({'id': conversation_id})
+        conversation = await db.conversations.find_one_and_delete(
+            {'id': conversation_id}, projection={'_id': 0, 'id': 1, 'contact_phone': 1}
+        )
+        contact_cache.invalidate_conversation(conversation_id, conversation.get('contact_phone') if conversation else None)
         
-        if result.deleted_count == 0:
+        if conversation is None:
             raise HTTPException(status_code=404, detail="Conversation not found")
+        event_bus.publish('conversation.deleted', {'id': conversation_id})
         
-        return {"success": True, "message": "Conversation deleted"}
+        # Mensajes y respuestas de botones: por lotes en segundo plano
+        job = await get_conversation_purger().enqueue(conversation)
+        
+        return {"success": True, "message": "Conversation deleted", "purge_job": job}
     except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@messaging_router.get("/purge-jobs")
+async def get_purge_jobs(limit: int = Query(50, ge=1, le=500)):
+    """Recent conversation purge jobs with their progress"""
+    purger = get_conversation_purger()
+    return {"jobs": await purger.list_jobs(limit), "stats": purger.get_stats()}
 
 
 @messaging_router.post("/contacts")
 async def create_contact(contact_data: dict):
-    """Crear un nuevo contacto"""
+    """Crear un contacto (si el teléfono ya existe, se actualiza su nombre)"""
     try:
-        from datetime import datetime, timezone
-        import uuid
-        
-        contact = {
-            'id': str(uuid.uuid4()),
-            'name': contact_data['name'],
-            'phone': contact_data['phone'],
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.contacts.insert_one(contact)
-        contact.pop('_id', None)
-        
+        contact = await upsert_contact(db, contact_data['phone'], set_fields={'name': contact_data['name']})
+        # El nombre cacheado pudo cambiar
+        contact_cache.invalidate_phone(contact['phone'])
         return contact
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @messaging_router.post("/conversations")
 async def create_conversation(conversation_data: dict):
-    """Crear una nueva conversación"""
+    """Crear una conversación (si el contacto ya tiene una, se devuelve esa)"""
     try:
-        from datetime import datetime, timezone
-        import uuid
-        
-        conversation = {
-            'id': str(uuid.uuid4()),
-            'contact_id': conversation_data['contact_id'],
-            'contact_name': conversation_data['contact_name'],
-            'contact_phone': conversation_data['contact_phone'],
-            'last_message': '',
-            'last_message_at': datetime.now(timezone.utc).isoformat(),
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        await db.conversations.insert_one(conversation)
-        conversation.pop('_id', None)
-        
-        return conversation
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-        raise
+        return await upsert_conversation(db, {
+            'id': conversation_data['contact_id'],
+            'name': conversation_data['contact_name'],
+            'phone': conversation_data['contact_phone']
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -167,6 +226,7 @@ async def mark_conversation_read(conversation_id: str):
             {'id': conversation_id},
             {'$set': {'unread_count': 0}}
         )
+        event_bus.publish('conversation.read', {'id': conversation_id})
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -208,8 +268,8 @@ async def set_manual_classification(conversation_id: str, classification: str):
                 '$set': {
                     'color_code': classification,
                     'manually_classified': True,  # Flag to prevent auto-overwrite
-                    'classified_at': datetime.now(timezone.utc).isoformat(),
-                    'updated_at': datetime.now(timezone.utc).isoformat()
+                    'classified_at': datetime.now(timezone.utc),
+                    'updated_at': datetime.now(timezone.utc)
                 }
             }
         )
@@ -217,6 +277,9 @@ async def set_manual_classification(conversation_id: str, classification: str):
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
+        event_bus.publish('conversation.classified', {
+            'id': conversation_id, 'color_code': classification, 'manually_classified': True
+        })
         return {"success": True, "classification": classification}
     except HTTPException:
         raise
@@ -239,7 +302,7 @@ async def remove_classification(conversation_id: str):
                     'classified_at': ''
                 },
                 '$set': {
-                    'updated_at': datetime.now(timezone.utc).isoformat()
+                    'updated_at': datetime.now(timezone.utc)
                 }
             }
         )
@@ -247,6 +310,9 @@ async def remove_classification(conversation_id: str):
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
+        event_bus.publish('conversation.classified', {
+            'id': conversation_id, 'color_code': None, 'manually_classified': False
+        })
         return {"success": True, "message": "Classification removed"}
     except HTTPException:
         raise
@@ -270,36 +336,98 @@ async def handle_button_response(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@messaging_router.post("/whatsapp/webhook")
+@messaging_router.post("/whatsapp/webhook", status_code=202)
 async def whatsapp_webhook(request: Request):
-    """Webhook to receive incoming WhatsApp messages"""
+    """
+    Webhook to receive incoming WhatsApp messages
+    The raw event is stored and acknowledged; a background worker processes it.
+    """
     try:
         message_data = await request.json()
-        print(f"📨 Webhook received: {message_data}")
-        result = await handle_whatsapp_incoming(db, message_data)
-        print(f"✅ Webhook processed: {result}")
-        return result
+        event_id = await get_webhook_queue().enqueue(message_data)
+        print(f"📨 Webhook queued: {event_id}")
+        return {'success': True, 'queued': True, 'event_id': event_id}
     except Exception as e:
         print(f"❌ Webhook error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@messaging_router.post("/whatsapp/webhook/batch", status_code=202)
+async def whatsapp_webhook_batch(request: Request):
+    """
+    Webhook to receive several incoming WhatsApp messages at once
+    Body: a JSON array of message events (same shape as /whatsapp/webhook).
+    """
+    try:
+        events = await request.json()
+        if not isinstance(events, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of message events")
+        event_ids = await get_webhook_queue().enqueue_many(events)
+        print(f"📨 Webhook batch queued: {len(event_ids)} events")
+        return {'success': True, 'queued': len(event_ids), 'event_ids': event_ids}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Webhook batch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@messaging_router.get("/whatsapp/webhook/stats")
+async def get_webhook_stats():
+    """Counters and per-worker backlog of the webhook queue, persisted events per status and recent failures"""
+    try:
+        queue = get_webhook_queue()
+        return {**queue.get_stats(), 'events': await queue.get_event_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@messaging_router.post("/whatsapp/webhook/retry-failed")
+async def retry_failed_webhook_events(limit: int = Query(1000, ge=1, le=10000)):
+    """Reintentar los eventos de webhook que agotaron sus intentos"""
+    try:
+        retried = await get_webhook_queue().retry_failed(limit)
+        return {'success': True, 'retried': retried}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@messaging_router.get("/contacts/cache-stats")
+async def get_contact_cache_stats():
+    """Hit/miss counters of the phone -> contact -> conversation cache"""
+    return contact_cache.get_stats()
+
 @messaging_router.get("/contacts")
 async def get_contacts(search: str = None):
-    """Get all contacts"""
+    """
+    Get all contacts
+    With search, the best SEARCH_MAX_LIMIT matches by name (text index) or phone prefix.
+    """
     try:
-        query = {}
         if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'phone': {'$regex': search, '$options': 'i'}}
-            ]
+            page = await search_contacts(db, search, limit=SEARCH_MAX_LIMIT)
+            return page['items']
         
-        contacts = await db.contacts.find(query, {'_id': 0}).sort('updated_at', -1).to_list(None)
+        contacts = await db.contacts.find({}, {'_id': 0}).sort('updated_at', -1).to_list(None)
         return contacts
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@messaging_router.get("/search")
+async def search_messaging(
+    q: str = Query(..., min_length=2),
+    type: str = Query('all', pattern='^(all|contacts|messages)$'),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+):
+    """
+    Ranked search over contact names, phone numbers and message text
+    Returns one page of contact and message hits, each with its conversation;
+    use offset with type=contacts or type=messages to page one kind.
+    """
+    try:
+        return await search_all(db, q, kind=type, offset=offset, limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @messaging_router.get("/message-flows")
 async def get_message_flows():
     """Get all message flow templates"""
@@ -0,0 +1,258 @@
+"""
+Database Migrations
+One-shot data migrations, recorded in the 'migrations' collection so each one runs once
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from datetime_utils import to_utc_datetime
+from db_indexes import ensure_indexes
+from reminder_queue import compute_reminder_due_at
+from search import normalize_name, normalize_phone
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 1000
+
+# Campos de fecha que antes se guardaban como strings ISO
+DATETIME_FIELDS = {
+    'appointments': ['date', 'created_at'],
+    'patients': ['created_at'],
+    'conversations': ['created_at', 'updated_at', 'last_message_at', 'classified_at'],
+    'messages': ['timestamp', 'created_at'],
+}
+# Campos que siguieron escribiéndose como strings ISO después de la 0001
+LATE_DATETIME_FIELDS = {
+    'contacts': ['created_at', 'updated_at'],
+    'appointments': ['updated_at'],
+}
+# Migración que el arranque espera antes de servir: las consultas por rango y los
+# cursores comparan fechas nativas
+BLOCKING_MIGRATION = '0001_native_datetimes'
+
+
+async def migrate_datetimes(db, datetime_fields=DATETIME_FIELDS):
+    """Convert ISO string date fields to native BSON datetimes"""
+    converted = {}
+
+    for collection_name, fields in datetime_fields.items():
+        collection = db[collection_name]
+        query = {'$or': [{field: {'$type': 'string'}} for field in fields]}
+        projection = {field: 1 for field in fields}
+
+        operations = []
+        count = 0
+        async for doc in collection.find(query, projection):
+            update = {}
+            for field in fields:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                try:
+                    update[field] = to_utc_datetime(value)
+                except ValueError:
+                    print(f"⚠️ {collection_name}.{field} no es una fecha válida: {value!r} ({doc['_id']})")
+            if update:
+                operations.append(UpdateOne({'_id': doc['_id']}, {'$set': update}))
+
+            if len(operations) >= BATCH_SIZE:
+                await collection.bulk_write(operations, ordered=False)
+                count += len(operations)
+                operations = []
+
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+            count += len(operations)
+
+        converted[collection_name] = count
+        print(f"✅ {collection_name}: {count} documentos convertidos a fechas nativas")
+
+    return converted
+
+
+async def backfill_reminder_due_at(db):
+    """Precompute reminder_due_at for pending reminders of future appointments"""
+    query = {
+        'reminder_enabled': True,
+        'reminder_sent': {'$ne': True},
+        'reminder_due_at': {'$exists': False},
+        'date': {'$gt': datetime.now(timezone.utc)},
+    }
+    projection = {'date': 1, 'status': 1, 'reminder_enabled': 1, 'reminder_sent': 1, 'reminder_minutes_before': 1}
+
+    operations = []
+    count = 0
+    async for doc in db.appointments.find(query, projection):
+        due_at = compute_reminder_due_at(doc)
+        if due_at:
+            operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'reminder_due_at': due_at}}))
+        if len(operations) >= BATCH_SIZE:
+            await db.appointments.bulk_write(operations, ordered=False)
+            count += len(operations)
+            operations = []
+
+    if operations:
+        await db.appointments.bulk_write(operations, ordered=False)
+        count += len(operations)
+
+    print(f"✅ appointments: {count} recordatorios pendientes encolados")
+    return {'appointments': count}
+
+
+async def dedupe_contacts_and_conversations(db):
+    """
+    Merge duplicate contacts (same phone) and conversations (same contact)
+    The oldest document is kept and references are repointed to it, so the
+    unique indexes behind the contact/conversation upserts can be built.
+    """
+    contacts_merged = 0
+    async for group in db.contacts.aggregate([
+        {'$match': {'phone': {'$type': 'string'}}},
+        {'$sort': {'created_at': 1, '_id': 1}},
+        {'$group': {'_id': '$phone', 'ids': {'$push': '$id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True):
+        keeper, duplicates = group['ids'][0], group['ids'][1:]
+        await db.conversations.update_many({'contact_id': {'$in': duplicates}}, {'$set': {'contact_id': keeper}})
+        await db.messages.update_many({'contact_id': {'$in': duplicates}}, {'$set': {'contact_id': keeper}})
+        await db.contacts.delete_many({'id': {'$in': duplicates}})
+        contacts_merged += len(duplicates)
+
+    conversations_merged = 0
+    async for group in db.conversations.aggregate([
+        {'$match': {'contact_id': {'$type': 'string'}}},
+        {'$sort': {'created_at': 1, '_id': 1}},
+        {'$group': {
+            '_id': '$contact_id',
+            'ids': {'$push': '$id'},
+            'unread_count': {'$sum': '$unread_count'},
+            'count': {'$sum': 1},
+        }},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True):
+        keeper, duplicates = group['ids'][0], group['ids'][1:]
+        latest = await db.conversations.find_one(
+            {'id': {'$in': group['ids']}}, {'_id': 0, 'last_message': 1, 'last_message_at': 1},
+            sort=[('last_message_at', -1)]
+        )
+        await db.messages.update_many({'conversation_id': {'$in': duplicates}}, {'$set': {'conversation_id': keeper}})
+        await db.button_responses.update_many(
+            {'conversation_id': {'$in': duplicates}}, {'$set': {'conversation_id': keeper}}
+        )
+        await db.conversations.update_one({'id': keeper}, {'$set': {
+            'unread_count': group['unread_count'],
+            'last_message': latest.get('last_message'),
+            'last_message_at': latest.get('last_message_at'),
+        }})
+        await db.conversations.delete_many({'id': {'$in': duplicates}})
+        conversations_merged += len(duplicates)
+
+    print(f"✅ contacts: {contacts_merged} duplicados fusionados; conversations: {conversations_merged} duplicadas fusionadas")
+
+    # Los índices únicos pudieron fallar en el arranque por los duplicados
+    index_result = await ensure_indexes(db)
+    return {
+        'contacts_merged': contacts_merged,
+        'conversations_merged': conversations_merged,
+        'index_errors': index_result['errors'],
+    }
+
+
+async def backfill_phone_digits(db):
+    """Store the normalized phone digits searched by /api/search on existing contacts"""
+    operations = []
+    count = 0
+    async for doc in db.contacts.find({'phone_digits': {'$exists': False}}, {'phone': 1}):
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'phone_digits': normalize_phone(doc.get('phone'))}}))
+        if len(operations) >= BATCH_SIZE:
+            await db.contacts.bulk_write(operations, ordered=False)
+            count += len(operations)
+            operations = []
+
+    if operations:
+        await db.contacts.bulk_write(operations, ordered=False)
+        count += len(operations)
+
+    print(f"✅ contacts: {count} teléfonos normalizados")
+    return {'contacts': count}
+
+
+async def backfill_name_lower(db):
+    """Store the normalized name matched by the contact name prefix search"""
+    operations = []
+    count = 0
+    async for doc in db.contacts.find({'name_lower': {'$exists': False}}, {'name': 1, 'phone': 1}):
+        name = doc.get('name') or doc.get('phone')
+        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {'name_lower': normalize_name(name)}}))
+        if len(operations) >= BATCH_SIZE:
+            await db.contacts.bulk_write(operations, ordered=False)
+            count += len(operations)
+            operations = []
+
+    if operations:
+        await db.contacts.bulk_write(operations, ordered=False)
+        count += len(operations)
+
+    print(f"✅ contacts: {count} nombres normalizados")
+    return {'contacts': count}
+
+
+async def migrate_late_datetimes(db):
+    """Convert the contact and appointment dates still written as ISO strings"""
+    return await migrate_datetimes(db, LATE_DATETIME_FIELDS)
+
+
+# Migraciones en orden de ejecución: (id, función)
+MIGRATIONS = [
+    ('0001_native_datetimes', migrate_datetimes),
+    ('0002_reminder_due_at', backfill_reminder_due_at),
+    ('0003_dedupe_contacts_conversations', dedupe_contacts_and_conversations),
+    ('0004_contact_phone_digits', backfill_phone_digits),
+    ('0005_late_native_datetimes', migrate_late_datetimes),
+    ('0006_contact_name_lower', backfill_name_lower),
+]
+
+
+async def run_migrations(db, until: Optional[str] = None):
+    """
+    Run every migration that has not been recorded as completed
+    With until, stop after that migration (the rest run on a later call).
+    """
+    results = {}
+    for migration_id, migration in MIGRATIONS:
+        if await db.migrations.find_one({'id': migration_id}):
+            if migration_id == until:
+                break
+            continue
+        try:
+            print(f"🔄 Ejecutando migración {migration_id}...")
+            results[migration_id] = await migration(db)
+            await db.migrations.insert_one({
+                'id': migration_id,
+                'result': results[migration_id],
+                'completed_at': datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            print(f"❌ Error en migración {migration_id}: {e}")
+            results[migration_id] = {'error': str(e)}
+            break
+        if migration_id == until:
+            break
+    return results
+
+
+if __name__ == "__main__":
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        result = asyncio.run(run_migrations(client[os.environ['DB_NAME']]))
+        print(f"\nResultado: {result}")
+    finally:
+        client.close()
@@ -0,0 +1,262 @@
+"""
+Reminder Queue
+Appointments carry a precomputed, indexed reminder_due_at; the dispatcher only reads due items
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from datetime_utils import to_utc_datetime
+from whatsapp_client import get_whatsapp_client
+
+logger = logging.getLogger(__name__)
+
+# Máximo tiempo dormido sin revisar la cola (por si otro proceso añade recordatorios)
+MAX_SLEEP_SECONDS = float(os.environ.get('REMINDER_MAX_SLEEP_SECONDS', 300))
+# Recordatorios reclamados por lote; se reduce si no cabe en el lease (ver lease_batch_size)
+BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 30))
+RETRY_DELAY = timedelta(minutes=int(os.environ.get('REMINDER_RETRY_MINUTES', 5)))
+MAX_ATTEMPTS = int(os.environ.get('REMINDER_MAX_ATTEMPTS', 3))
+# Envíos simultáneos y ritmo máximo hacia el servicio de WhatsApp
+CONCURRENCY = int(os.environ.get('REMINDER_CONCURRENCY', 5))
+RATE_PER_SECOND = float(os.environ.get('REMINDER_RATE_PER_SECOND', 2))
+SEND_TIMEOUT_SECONDS = float(os.environ.get('REMINDER_SEND_TIMEOUT_SECONDS', 30))
+# Debe superar con margen el timeout de envío
+LEASE = timedelta(seconds=int(os.environ.get('REMINDER_LEASE_SECONDS', 300)))
+# Fracción del lease que puede ocupar un lote en el peor caso (todos los envíos agotan el timeout)
+LEASE_BUDGET = 0.8
+
+
+def compute_reminder_due_at(appointment: Dict) -> Optional[datetime]:
+    """Return when the reminder should go out, or None if no reminder is pending"""
+    if not appointment.get('reminder_enabled') or appointment.get('reminder_sent'):
+        return None
+    if appointment.get('status') == 'cancelada':
+        return None
+    if appointment.get('reminder_lease_expired') or appointment.get('reminder_attempts', 0) >= MAX_ATTEMPTS:
+        # Descartado por el dispatcher (posible envío sin confirmar o reintentos agotados)
+        return None
+    date = to_utc_datetime(appointment.get('date'))
+    if date is None or date <= datetime.now(timezone.utc):
+        # Las citas pasadas no vuelven a entrar en la cola
+        return None
+    return date - timedelta(minutes=appointment.get('reminder_minutes_before') or 0)
+
+
+def reminder_due_update(appointment: Dict) -> Dict:
+    """Mongo update fragment that keeps reminder_due_at in sync with the appointment"""
+    due_at = compute_reminder_due_at(appointment)
+    if due_at is None:
+        return {'$unset': {'reminder_due_at': ''}}
+    return {'$set': {'reminder_due_at': due_at}}
+
+
+def merge_updates(*updates: Dict) -> Dict:
+    """Merge several {'$set': ..., '$unset': ...} fragments into one update document"""
+    merged = {}
+    for update in updates:
+        for operator, fields in update.items():
+            merged.setdefault(operator, {}).update(fields)
+    return merged
+
+
+def build_reminder_message(appointment: Dict) -> str:
+    apt_date = to_utc_datetime(appointment['date'])
+    return f"Recordatorio: Tiene una cita '{appointment['title']}' programada para el {apt_date.strftime('%d/%m/%Y a las %H:%M')}."
+
+
+def lease_batch_size(batch_size: int, concurrency: int, rate_per_second: float,
+                     lease_seconds: float, send_timeout: float) -> int:
+    """
+    Largest batch, up to batch_size, whose worst case fits in the lease budget
+    Every reminder of a batch is claimed up front, so the last one is sent after
+    ceil(size / concurrency) timed-out sends plus the rate limiter's spacing.
+    """
+    def worst_case(size: int) -> float:
+        spacing = size / rate_per_second if rate_per_second > 0 else 0.0
+        return -(-size // concurrency) * send_timeout + spacing
+
+    size = batch_size
+    while size > 1 and worst_case(size) > lease_seconds * LEASE_BUDGET:
+        size -= 1
+    return size
+
+
+class RateLimiter:
+    """Spaces out calls so no more than `rate` start per second (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_slot = max(loop.time(), self._next_slot) + self.interval
+
+
+class ReminderDispatcher:
+    """
+    Sends due reminders ordered by due time and sleeps until the next one
+    Reminders are claimed atomically with a lease, so several workers can run the
+    dispatcher and each reminder is still sent at most once.
+    """
+
+    def __init__(self, db, concurrency: int = CONCURRENCY, rate_per_second: float = RATE_PER_SECOND):
+        self.db = db
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate_per_second)
+        # Ningún recordatorio reclamado debe quedarse sin lease esperando su turno
+        self.batch_size = lease_batch_size(
+            BATCH_SIZE, concurrency, rate_per_second, LEASE.total_seconds(), SEND_TIMEOUT_SECONDS
+        )
+        if self.batch_size < BATCH_SIZE:
+            logger.warning(
+                f"Reminder batch reduced from {BATCH_SIZE} to {self.batch_size} to fit the "
+                f"{LEASE.total_seconds():.0f}s lease"
+            )
+        self._wakeup = asyncio.Event()
+
+    def notify(self):
+        """Wake the dispatcher so it re-reads the next due time"""
+        self._wakeup.set()
+
+    async def _send(self, appointment: Dict):
+        await self.rate_limiter.wait()
+        response = await get_whatsapp_client().post("/send-message", json={
+            "number": appointment['patient_phone'],
+            "message": build_reminder_message(appointment)
+        }, timeout=SEND_TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+    async def claim(self, now: datetime) -> Optional[Dict]:
+        """Atomically lease the earliest due, unclaimed reminder"""
+        return await self.db.appointments.find_one_and_update(
+            {'reminder_due_at': {'$lte': now}, 'reminder_lease_until': {'$exists': False}},
+            {'$set': {'reminder_lease_until': now + LEASE, 'reminder_lease_owner': self.worker_id}},
+            projection={'_id': 0},
+            sort=[('reminder_due_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def expire_stale_leases(self, now: datetime) -> int:
+        """
+        Drop reminders whose lease ran out without a result
+        The owner may have sent the message before dying, so they are not retried.
+        """
+        result = await self.db.appointments.update_many(
+            {'reminder_lease_until': {'$lt': now}},
+            {
+                '$set': {'reminder_lease_expired': True},
+                '$unset': {'reminder_due_at': '', 'reminder_lease_until': '', 'reminder_lease_owner': ''}
+            }
+        )
+        if result.modified_count:
+            logger.warning(f"{result.modified_count} reminders dropped after an expired lease")
+        return result.modified_count
+
+    async def _process(self, apt: Dict, now: datetime, semaphore: asyncio.Semaphore) -> UpdateOne:
+        """Send one claimed reminder and return the update that records its outcome"""
+        # Solo el dueño del lease puede registrar el resultado
+        lease_filter = {'id': apt['id'], 'reminder_lease_owner': self.worker_id}
+        release = {'reminder_due_at': '', 'reminder_lease_until': '', 'reminder_lease_owner': ''}
+
+        apt_date = to_utc_datetime(apt.get('date'))
+        if apt_date is None or apt_date <= now:
+            # La cita ya pasó: el recordatorio deja de estar pendiente
+            return UpdateOne(lease_filter, {'$unset': release})
+
+        try:
+            async with semaphore:
+                await self._send(apt)
+            logger.info(f"Reminder sent for appointment {apt['id']}")
+            return UpdateOne(lease_filter, {'$set': {'reminder_sent': True}, '$unset': release})
+        except Exception as e:
+            attempts = apt.get('reminder_attempts', 0) + 1
+            logger.error(f"Error sending reminder for appointment {apt['id']} (attempt {attempts}): {e}")
+            if attempts >= MAX_ATTEMPTS:
+                return UpdateOne(lease_filter, {'$set': {'reminder_attempts': attempts}, '$unset': release})
+            return UpdateOne(lease_filter, {
+                '$set': {'reminder_attempts': attempts, 'reminder_due_at': now + RETRY_DELAY},
+                '$unset': {'reminder_lease_until': '', 'reminder_lease_owner': ''}
+            })
+
+    async def dispatch_due(self) -> int:
+        """Claim and send one batch of due reminders; returns how many were claimed"""
+        now = datetime.now(timezone.utc)
+        await self.expire_stale_leases(now)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        while len(tasks) < self.batch_size:
+            apt = await self.claim(now)
+            if not apt:
+                break
+            # Los envíos empiezan mientras se siguen reclamando recordatorios
+            tasks.append(asyncio.create_task(self._process(apt, now, semaphore)))
+
+        if not tasks:
+            return 0
+
+        operations = await asyncio.gather(*tasks)
+        await self.db.appointments.bulk_write(list(operations), ordered=False)
+        return len(tasks)
+
+    async def seconds_until_next(self) -> float:
+        """Seconds until the earliest unclaimed reminder, capped at MAX_SLEEP_SECONDS"""
+        upcoming = await self.db.appointments.find_one(
+            {'reminder_due_at': {'$exists': True}, 'reminder_lease_until': {'$exists': False}},
+            {'_id': 0, 'reminder_due_at': 1},
+            sort=[('reminder_due_at', 1)]
+        )
+        if not upcoming:
+            return MAX_SLEEP_SECONDS
+        delta = (to_utc_datetime(upcoming['reminder_due_at']) - datetime.now(timezone.utc)).total_seconds()
+        return min(max(delta, 0), MAX_SLEEP_SECONDS)
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                # Vaciar la cola mientras haya lotes completos
+                while await self.dispatch_due() >= self.batch_size:
+                    pass
+                sleep_for = await self.seconds_until_next()
+            except Exception as e:
+                logger.error(f"Error in reminder dispatcher: {e}")
+                sleep_for = 60
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+
+_dispatcher: Optional[ReminderDispatcher] = None
+
+
+def start_reminder_dispatcher(db) -> ReminderDispatcher:
+    """Create the process-wide dispatcher and start its loop"""
+    global _dispatcher
+    _dispatcher = ReminderDispatcher(db)
+    asyncio.create_task(_dispatcher.run())
+    return _dispatcher
+
+
+def notify_reminder_dispatcher():
+    """Tell the running dispatcher that reminder_due_at values changed (no-op outside the app)"""
+    if _dispatcher is not None:
+        _dispatcher.notify()
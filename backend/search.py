@@ -0,0 +1,138 @@
+"""
+Search
+Ranked, paginated search over contacts and messages
+Names and message text go through MongoDB text indexes (Spanish stemming, accent
+insensitive); phone numbers through an anchored prefix on the normalized digits.
+Contact names are also matched by an anchored prefix on the normalized name, which
+the text index cannot do ('Mar' finds 'María').
+"""
+import asyncio
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+MAX_LIMIT = 100
+# Una búsqueda con al menos estos dígitos (y nada más) se trata como teléfono
+MIN_PHONE_DIGITS = 3
+# Prefijo que se prueba también al buscar un móvil escrito sin prefijo internacional
+PHONE_COUNTRY_CODE = os.environ.get('PHONE_COUNTRY_CODE', '34')
+
+CONVERSATION_FIELDS = {
+    '_id': 0, 'id': 1, 'contact_id': 1, 'contact_name': 1, 'contact_phone': 1,
+    'color_code': 1, 'last_message': 1, 'last_message_at': 1, 'unread_count': 1
+}
+MESSAGE_FIELDS = {
+    '_id': 0, 'id': 1, 'conversation_id': 1, 'contact_id': 1, 'from_me': 1,
+    'text': 1, 'transcription': 1, 'timestamp': 1
+}
+TEXT_SCORE = {'$meta': 'textScore'}
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Digits of a phone number ('+34 612-345-678' -> '34612345678')"""
+    return re.sub(r'\D', '', phone or '')
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase name without accents or repeated spaces ('  María  José' -> 'maria jose')"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.lower().split())
+
+
+def phone_query(query: str) -> Optional[str]:
+    """Digits to search by when the query looks like a phone number, else None"""
+    if re.fullmatch(r'[\d\s+().-]+', query.strip()):
+        digits = normalize_phone(query)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            return digits
+    return None
+
+
+async def _page(cursor, offset: int, limit: int) -> Dict:
+    # Se pide uno de más para saber si hay página siguiente
+    items = await cursor.skip(offset).limit(limit + 1).to_list(limit + 1)
+    return {'items': items[:limit], 'has_more': len(items) > limit}
+
+
+async def _attach_conversations(db, items: List[Dict], field: str, key: str):
+    """Add the (lean) conversation of each hit, looked up with one $in query"""
+    values = list({item[field] for item in items if item.get(field)})
+    if not values:
+        return
+    conversations = {}
+    async for conversation in db.conversations.find({key: {'$in': values}}, CONVERSATION_FIELDS):
+        conversations[conversation[key]] = conversation
+    for item in items:
+        item['conversation'] = conversations.get(item.get(field))
+
+
+async def search_contacts(db, query: str, offset: int = 0, limit: int = 20) -> Dict:
+    digits = phone_query(query)
+    if digits:
+        prefixes = [digits]
+        if PHONE_COUNTRY_CODE and not digits.startswith(PHONE_COUNTRY_CODE):
+            prefixes.append(PHONE_COUNTRY_CODE + digits)
+        cursor = db.contacts.find(
+            {'$or': [{'phone_digits': {'$regex': f'^{prefix}'}} for prefix in prefixes]}, {'_id': 0}
+        ).sort('phone_digits', 1)
+        page = await _page(cursor, offset, limit)
+    else:
+        page = await _search_contact_names(db, query, offset, limit)
+    await _attach_conversations(db, page['items'], 'id', 'contact_id')
+    return page
+
+
+async def _search_contact_names(db, query: str, offset: int, limit: int) -> Dict:
+    """Name prefix matches first, then the text-index matches not already listed"""
+    wanted = offset + limit + 1
+    prefix = normalize_name(query)
+    prefix_matches = []
+    if prefix:
+        prefix_matches = await db.contacts.find(
+            {'name_lower': {'$regex': f'^{re.escape(prefix)}'}}, {'_id': 0}
+        ).sort([('name_lower', 1), ('id', 1)]).limit(wanted).to_list(wanted)
+    text_matches = await db.contacts.find(
+        {'$text': {'$search': query}}, {'_id': 0, 'score': TEXT_SCORE}
+    ).sort([('score', TEXT_SCORE), ('updated_at', -1)]).limit(wanted).to_list(wanted)
+
+    seen = {contact['id'] for contact in prefix_matches}
+    items = prefix_matches + [contact for contact in text_matches if contact['id'] not in seen]
+    return {'items': items[offset:offset + limit], 'has_more': len(items) > offset + limit}
+
+
+async def _purging_conversation_ids(db) -> List[str]:
+    """Conversations already deleted whose messages the purger has not removed yet"""
+    return await db.purge_jobs.distinct('conversation_id', {'status': {'$ne': 'done'}})
+
+
+async def search_messages(db, query: str, offset: int = 0, limit: int = 20) -> Dict:
+    filters = {'$text': {'$search': query}}
+    purging = await _purging_conversation_ids(db)
+    if purging:
+        filters['conversation_id'] = {'$nin': purging}
+    cursor = db.messages.find(
+        filters, {**MESSAGE_FIELDS, 'score': TEXT_SCORE}
+    ).sort([('score', TEXT_SCORE), ('timestamp', -1)])
+    page = await _page(cursor, offset, limit)
+    await _attach_conversations(db, page['items'], 'conversation_id', 'id')
+    # Restos de una conversación borrada cuyo trabajo de purga ya no existe
+    page['items'] = [item for item in page['items'] if item.get('conversation')]
+    return page
+
+
+async def search(db, query: str, kind: str = 'all', offset: int = 0, limit: int = 20) -> Dict:
+    """
+    Search contacts and/or messages (kind: 'all', 'contacts' or 'messages')
+    Each hit carries its conversation, so the inbox can open it directly.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    searches = {}
+    if kind in ('all', 'contacts'):
+        searches['contacts'] = search_contacts(db, query, offset, limit)
+    # Un número de teléfono no se busca en el texto de los mensajes
+    if kind in ('all', 'messages') and not phone_query(query):
+        searches['messages'] = search_messages(db, query, offset, limit)
+    pages = dict(zip(searches, await asyncio.gather(*searches.values())))
+    return {'query': query, 'offset': offset, 'limit': limit, **pages}
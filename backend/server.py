@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Request, BackgroundTasks, Query, Response, UploadFile, File, Header
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -9,10 +10,21 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict
 import uuid
 from datetime import datetime, timezone, timedelta
-import httpx
 import asyncio
+import shutil
+import tempfile
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from datetime_utils import to_utc_datetime
+from whatsapp_client import init_whatsapp_client, close_whatsapp_client
+from sheets_client import shutdown_sheets_executor
+from sync_coordinator import init_sync_coordinator
+from event_bus import event_bus, format_sse
+from dashboard import dashboard_cache
+from reminder_queue import (
+    build_reminder_message, compute_reminder_due_at, reminder_due_update,
+    merge_updates, start_reminder_dispatcher, notify_reminder_dispatcher
+)
 
 
 ROOT_DIR = Path(__file__).parent
@@ -20,8 +32,9 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
+sync_coordinator = init_sync_coordinator(db)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -31,6 +44,11 @@ api_router = APIRouter(prefix="/api")
 
 # WhatsApp service URL
 WHATSAPP_SERVICE_URL = "http://localhost:3001"
+# Cada cuánto se consulta el estado de WhatsApp mientras haya navegadores conectados al stream
+WHATSAPP_STATUS_POLL_SECONDS = float(os.environ.get('WHATSAPP_STATUS_POLL_SECONDS', 5))
+
+# Cliente HTTP compartido (pool keep-alive) hacia el servicio de WhatsApp
+whatsapp_client = init_whatsapp_client(WHATSAPP_SERVICE_URL)
 
 
 # Define Models
@@ -101,9 +119,8 @@ class WhatsAppStatus(BaseModel):
 @api_router.get("/whatsapp/status")
 async def get_whatsapp_status():
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{WHATSAPP_SERVICE_URL}/status")
-            return response.json()
+        response = await whatsapp_client.get("/status", timeout=5.0)
+        return response.json()
     except Exception as e:
         print(f"❌ Error getting WhatsApp status: {e}")
         return {"ready": False, "hasQR": False, "error": str(e)}
@@ -111,67 +128,63 @@ async def get_whatsapp_status():
 @api_router.get("/whatsapp/qr")
 async def get_whatsapp_qr():
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{WHATSAPP_SERVICE_URL}/qr")
-            return response.json()
+        response = await whatsapp_client.get("/qr")
+        return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/whatsapp/chats")
 async def get_whatsapp_chats():
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{WHATSAPP_SERVICE_URL}/chats")
-            return response.json()
+        response = await whatsapp_client.get("/chats", timeout=30.0)
+        return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/whatsapp/messages/{chat_id}")
 async def get_whatsapp_messages(chat_id: str):
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{WHATSAPP_SERVICE_URL}/messages/{chat_id}")
-            return response.json()
+        response = await whatsapp_client.get(f"/messages/{chat_id}", timeout=30.0)
+        return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/whatsapp/send-message")
 async def send_whatsapp_message(request: SendMessageRequest):
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{WHATSAPP_SERVICE_URL}/send-message", json={
-                "number": request.number,
-                "message": request.message
-            })
-            return response.json()
+        response = await whatsapp_client.post("/send-message", json={
+            "number": request.number,
+            "message": request.message
+        }, timeout=30.0)
+        return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/whatsapp/logout")
 async def logout_whatsapp():
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"{WHATSAPP_SERVICE_URL}/logout")
-            return response.json()
+        response = await whatsapp_client.post("/logout")
+        return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/whatsapp/client-metrics")
+async def get_whatsapp_client_metrics():
+    """Connection pool settings and request metrics of the shared WhatsApp client"""
+    return whatsapp_client.get_metrics()
+
 
 # Patients endpoints
 @api_router.post("/patients", response_model=Patient)
 async def create_patient(patient: PatientCreate):
     patient_obj = Patient(**patient.model_dump())
     doc = patient_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.patients.insert_one(doc)
     return patient_obj
 
 @api_router.get("/patients", response_model=List[Patient])
 async def get_patients():
     patients = await db.patients.find({}, {"_id": 0}).to_list(1000)
-    for patient in patients:
-        if isinstance(patient['created_at'], str):
-            patient['created_at'] = datetime.fromisoformat(patient['created_at'])
     return patients
 
 @api_router.get("/patients/{patient_id}", response_model=Patient)
@@ -179,8 +192,6 @@ async def get_patient(patient_id: str):
     patient = await db.patients.find_one({"id": patient_id}, {"_id": 0})
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-    if isinstance(patient['created_at'], str):
-        patient['created_at'] = datetime.fromisoformat(patient['created_at'])
     return patient
 
 @api_router.put("/patients/{patient_id}", response_model=Patient)
@@ -193,8 +204,6 @@ async def update_patient(patient_id: str, patient: PatientCreate):
     await db.patients.update_one({"id": patient_id}, {"$set": update_data})
     
     updated = await db.patients.find_one({"id": patient_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return updated
 
 @api_router.delete("/patients/{patient_id}")
@@ -214,38 +223,100 @@ async def create_appointment(appointment: AppointmentCreate):
         raise HTTPException(status_code=404, detail="Patient not found")
     
     appointment_data = appointment.model_dump()
-    appointment_data['date'] = datetime.fromisoformat(appointment.date)
+    appointment_data['date'] = to_utc_datetime(appointment.date)
     appointment_data['patient_name'] = patient['name']
     appointment_data['patient_phone'] = patient['phone']
     appointment_data['reminder_sent'] = False
     
     appointment_obj = Appointment(**appointment_data)
     doc = appointment_obj.model_dump()
-    doc['date'] = doc['date'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
+    due_at = compute_reminder_due_at(doc)
+    if due_at:
+        doc['reminder_due_at'] = due_at
     
     await db.appointments.insert_one(doc)
+    notify_reminder_dispatcher()
+    event_bus.publish('appointment.changed', {'action': 'created', 'id': appointment_obj.id, 'appointment': appointment_obj})
     return appointment_obj
 
+def parse_date_param(value: str, param: str) -> datetime:
+    """Parse a date/datetime query parameter; naive values are taken as UTC"""
+    try:
+        return to_utc_datetime(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{param}' date: {value}")
+
+def decode_cursor(cursor: str, param: str):
+    """Split a '<value>,<id>' keyset cursor into its two parts"""
+    # Un '+' sin codificar en la URL llega como espacio
+    value, sep, last_id = cursor.replace(' ', '+').rpartition(',')
+    if not sep or not value or not last_id:
+        raise HTTPException(status_code=400, detail=f"Invalid '{param}' cursor: {cursor}")
+    return value, last_id
+
+def encode_cursor(value, last_id: str) -> str:
+    """Build the '<value>,<id>' keyset cursor read back by decode_cursor"""
+    # Documentos aún no migrados pueden guardar la fecha como string ISO
+    if isinstance(value, str):
+        value = to_utc_datetime(value)
+    return f"{value.isoformat()},{last_id}"
+
+def build_appointment_filter(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                             doctor: Optional[str] = None, status: Optional[str] = None) -> Dict:
+    """Build the Mongo filter shared by the appointment list and stats endpoints"""
+    query = {}
+    if date_from or date_to:
+        query['date'] = {}
+        if date_from:
+            query['date']['$gte'] = parse_date_param(date_from, 'from')
+        if date_to:
+            query['date']['$lt'] = parse_date_param(date_to, 'to')
+    if doctor:
+        query['doctor'] = doctor
+    if status:
+        query['status'] = status
+    return query
+
 @api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments():
-    appointments = await db.appointments.find({}, {"_id": 0}).to_list(None)  # Devolver TODAS las citas
-    for apt in appointments:
-        if isinstance(apt['date'], str):
-            apt['date'] = datetime.fromisoformat(apt['date'])
-        if isinstance(apt['created_at'], str):
-            apt['created_at'] = datetime.fromisoformat(apt['created_at'])
-    return sorted(appointments, key=lambda x: x['date'])
+async def get_appointments(
+    response: Response,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    doctor: Optional[str] = None,
+    status: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
+    """
+    Get appointments ordered by date
+    Optional filters: from (inclusive), to (exclusive), doctor and status.
+    With limit, the next page cursor (after=<date,id>) is returned in X-Next-Cursor.
+    """
+    query = build_appointment_filter(date_from, date_to, doctor, status)
+    if after:
+        after_date, after_id = decode_cursor(after, 'after')
+        after_date = parse_date_param(after_date, 'after')
+        query = {'$and': [query, {'$or': [
+            {'date': {'$gt': after_date}},
+            {'date': after_date, 'id': {'$gt': after_id}}
+        ]}]}
+    
+    cursor = db.appointments.find(query, {"_id": 0}).sort([('date', 1), ('id', 1)])
+    if limit:
+        cursor = cursor.limit(limit)
+    appointments = await cursor.to_list(None)
+    
+    if limit and len(appointments) == limit:
+        last = appointments[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last['date'], last['id'])
+    
+    return appointments
 
 @api_router.get("/appointments/{appointment_id}", response_model=Appointment)
 async def get_appointment(appointment_id: str):
     appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
-    if isinstance(appointment['date'], str):
-        appointment['date'] = datetime.fromisoformat(appointment['date'])
-    if isinstance(appointment['created_at'], str):
-        appointment['created_at'] = datetime.fromisoformat(appointment['created_at'])
     return appointment
 
 @api_router.put("/appointments/{appointment_id}", response_model=Appointment)
@@ -260,17 +331,18 @@ async def update_appointment(appointment_id: str, appointment: AppointmentCreate
         raise HTTPException(status_code=404, detail="Patient not found")
     
     update_data = appointment.model_dump()
-    update_data['date'] = datetime.fromisoformat(update_data['date']).isoformat()
+    update_data['date'] = to_utc_datetime(update_data['date'])
     update_data['patient_name'] = patient['name']
     update_data['patient_phone'] = patient['phone']
     
-    await db.appointments.update_one({"id": appointment_id}, {"$set": update_data})
+    await db.appointments.update_one(
+        {"id": appointment_id},
+        merge_updates({"$set": update_data}, reminder_due_update({**existing, **update_data}))
+    )
+    notify_reminder_dispatcher()
     
     updated = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
-    if isinstance(updated['date'], str):
-        updated['date'] = datetime.fromisoformat(updated['date'])
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
+    event_bus.publish('appointment.changed', {'action': 'updated', 'id': appointment_id, 'appointment': updated})
     return updated
 
 @api_router.delete("/appointments/{appointment_id}")
@@ -278,6 +350,7 @@ async def delete_appointment(appointment_id: str):
     result = await db.appointments.delete_one({"id": appointment_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    event_bus.publish('appointment.changed', {'action': 'deleted', 'id': appointment_id})
 
 # Update appointment status
 @api_router.patch("/appointments/{appointment_id}/status")
@@ -286,13 +359,16 @@ async def update_appointment_status(appointment_id: str, status: str):
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
     
-    result = await db.appointments.update_one(
+    existing = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    
+    await db.appointments.update_one(
         {"id": appointment_id},
-        {"$set": {"status": status}}
+        merge_updates({"$set": {"status": status}}, reminder_due_update({**existing, "status": status}))
     )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+    notify_reminder_dispatcher()
+    event_bus.publish('appointment.changed', {'action': 'status', 'id': appointment_id, 'status': status})
     
     return {"success": True, "status": status}
 
@@ -303,15 +379,13 @@ async def send_appointment_reminder(appointment_id: str):
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    apt_date = datetime.fromisoformat(appointment['date']) if isinstance(appointment['date'], str) else appointment['date']
-    message = f"Recordatorio: Tiene una cita '{appointment['title']}' programada para el {apt_date.strftime('%d/%m/%Y a las %H:%M')}."
+    message = build_reminder_message(appointment)
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{WHATSAPP_SERVICE_URL}/send-message", json={
-                "number": appointment['patient_phone'],
-                "message": message
-            })
+        await whatsapp_client.post("/send-message", json={
+            "number": appointment['patient_phone'],
+            "message": message
+        }, timeout=30.0)
         
         return {"success": True, "message": "Recordatorio enviado"}
     except Exception as e:
@@ -320,42 +394,110 @@ async def send_appointment_reminder(appointment_id: str):
 
 # Get appointment statistics
 @api_router.get("/appointments/stats/summary")
-async def get_appointment_stats():
-    all_appointments = await db.appointments.find({}, {"_id": 0}).to_list(None)  # Todas las citas
+async def get_appointment_stats(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    doctor: Optional[str] = None,
+    breakdown: bool = False,
+):
+    """
+    Appointment counts computed server-side with a single $facet pipeline
+    Optional from/to/doctor filters; breakdown=true adds per-doctor and per-treatment counts.
+    """
+    facets = {
+        'by_status': [{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]
+    }
+    if breakdown:
+        facets['by_doctor'] = [
+            {'$group': {'_id': '$doctor', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}}
+        ]
+        facets['by_treatment'] = [
+            {'$group': {'_id': {'$ifNull': ['$tratamiento', '$title']}, 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}}
+        ]
     
-    total = len(all_appointments)
-    confirmadas = sum(1 for apt in all_appointments if apt.get('status') == 'confirmada')
-    canceladas = sum(1 for apt in all_appointments if apt.get('status') == 'cancelada')
+    pipeline = [
+        {'$match': build_appointment_filter(date_from, date_to, doctor)},
+        {'$facet': facets}
+    ]
+    result = await db.appointments.aggregate(pipeline).to_list(1)
+    result = result[0] if result else {}
     
-    return {
-        "total": total,
-        "confirmadas": confirmadas,
-        "canceladas": canceladas
+    by_status = {item['_id']: item['count'] for item in result.get('by_status', [])}
+    stats = {
+        "total": sum(by_status.values()),
+        "confirmadas": by_status.get('confirmada', 0),
+        "canceladas": by_status.get('cancelada', 0),
+        "by_status": by_status
     }
+    if breakdown:
+        stats["by_doctor"] = [
+            {"doctor": item['_id'], "count": item['count']} for item in result.get('by_doctor', [])
+        ]
+        stats["by_treatment"] = [
+            {"treatment": item['_id'], "count": item['count']} for item in result.get('by_treatment', [])
+        ]
+    return stats
+
+@api_router.get("/dashboard/summary")
+async def get_dashboard_summary(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    """
+    Today's agenda, status totals, per-color conversation and unread counts and the
+    priority (AMARILLO/AZUL) inbox, from one $facet per collection
+    from/to delimit the agenda window (default: the current UTC day). Results are
+    cached for DASHBOARD_CACHE_TTL_SECONDS.
+    """
+    if date_from:
+        window_start = parse_date_param(date_from, 'from')
+    else:
+        window_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = parse_date_param(date_to, 'to') if date_to else window_start + timedelta(days=1)
+    return await dashboard_cache.get(db, window_start, window_end)
+
+
+@api_router.get("/dashboard/cache-stats")
+async def get_dashboard_cache_stats():
+    return dashboard_cache.get_stats()
+
 
 # Google Sheets Sync
 @api_router.post("/appointments/sync-google-sheets")
-async def sync_google_sheets():
-    """Sync appointments from Google Sheets"""
+async def sync_google_sheets(response: Response, wait: bool = True):
+    """
+    Sync appointments from Google Sheets
+    Only one sync runs at a time: a call during a running sync joins it.
+    With wait=false it returns 202 at once; poll /sync/status for progress.
+    """
     try:
-        # Import the sync function
-        import sys
-        sys.path.insert(0, str(ROOT_DIR))
-        from sync_google_sheets import sync_appointments
+        if not wait:
+            started = sync_coordinator.start('manual')
+            response.status_code = 202
+            return {"success": True, "started": started, "status": sync_coordinator.get_status()}
         
-        # Run sync
-        result = await sync_appointments()
+        result = await sync_coordinator.run('manual')
         
         if result.get('success'):
             return {
                 "success": True,
                 "message": "Sincronización completada exitosamente",
                 "patients_synced": result.get('patients_synced', 0),
-                "appointments_synced": result.get('appointments_synced', 0)
+                "appointments_synced": result.get('appointments_synced', 0),
+                "inserted": result.get('inserted', 0),
+                "updated": result.get('updated', 0),
+                "unchanged": result.get('unchanged', 0),
+                "deleted": result.get('deleted', 0),
+                "rejected": result.get('rejected', 0),
+                "rejected_rows": result.get('rejected_rows', [])
             }
         else:
             raise HTTPException(status_code=500, detail=result.get('error', 'Error desconocido'))
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en la sincronización: {str(e)}")
 
@@ -371,45 +513,62 @@ async def sync_google_sheets():
     return {"success": True}
 
 
-# Background task to check and send reminders
-async def check_and_send_reminders():
-    while True:
-        try:
-            now = datetime.now(timezone.utc)
-            # Find appointments that need reminders
-            appointments = await db.appointments.find({
-                "reminder_enabled": True,
-                "reminder_sent": False
-            }, {"_id": 0}).to_list(1000)
-            
-            for apt in appointments:
-                apt_date = datetime.fromisoformat(apt['date']) if isinstance(apt['date'], str) else apt['date']
-                reminder_time = apt_date - timedelta(minutes=apt['reminder_minutes_before'])
-                
-                if now >= reminder_time and now < apt_date:
-                    # Send reminder
-                    message = f"Recordatorio: Tiene una cita '{apt['title']}' programada para el {apt_date.strftime('%d/%m/%Y a las %H:%M')}."
-                    
-                    try:
-                        async with httpx.AsyncClient(timeout=30.0) as client:
-                            await client.post(f"{WHATSAPP_SERVICE_URL}/send-message", json={
-                                "number": apt['patient_phone'],
-                                "message": message
-                            })
-                        
-                        # Mark as sent
-                        await db.appointments.update_one(
-                            {"id": apt['id']},
-                            {"$set": {"reminder_sent": True}}
-                        )
-                        logging.info(f"Reminder sent for appointment {apt['id']}")
-                    except Exception as e:
-                        logging.error(f"Error sending reminder: {e}")
-            
-            await asyncio.sleep(60)  # Check every minute
-        except Exception as e:
-            logging.error(f"Error in reminder task: {e}")
-            await asyncio.sleep(60)
+@api_router.post("/appointments/import")
+async def import_appointments_file(file: UploadFile = File(...), sheet: Optional[str] = None):
+    """
+    Import appointments from a CSV/XLSX export with the Google Sheet's columns
+    The file is streamed in blocks; imported appointments are never deleted by later syncs.
+    The import waits for a running sync, and its progress shows in /sync/status.
+    """
+    from appointment_sources import LocalFileSource
+    
+    suffix = Path(file.filename or '').suffix.lower()
+    if suffix not in ('.csv', '.xlsx'):
+        raise HTTPException(status_code=400, detail="Formato no soportado (usa .csv o .xlsx)")
+    
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        await asyncio.get_running_loop().run_in_executor(None, shutil.copyfileobj, file.file, tmp)
+        tmp.flush()
+        # Por el coordinador: nunca en paralelo con una sincronización y visible en /sync/status
+        result = await sync_coordinator.run_import(LocalFileSource(tmp.name, sheet_name=sheet))
+    
+    if not result.get('success'):
+        raise HTTPException(status_code=500, detail=f"Error en la importación: {result.get('error', 'Error desconocido')}")
+    return result
+
+
+@api_router.get("/sync/status")
+async def get_sync_status():
+    """Phase, progress, duration and last error of the Google Sheets sync"""
+    return sync_coordinator.get_status()
+
+
+@api_router.get("/events/stream")
+async def stream_events(request: Request, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events with live deltas: messages, conversations, classifications,
+    appointments, sync progress and WhatsApp status
+    Browsers reconnect with Last-Event-ID and get the events they missed, or a
+    'resync' event when those are no longer buffered.
+    """
+    async def events():
+        yield "retry: 3000\n\n"
+        async for event in event_bus.subscribe(last_event_id):
+            if await request.is_disconnected():
+                break
+            yield format_sse(event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Sin buffering en nginx para que cada evento salga al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.get("/events/stats")
+async def get_event_stats():
+    return event_bus.get_stats()
 
 
 @api_router.get("/")
@@ -425,6 +584,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Configure logging
@@ -438,18 +598,18 @@ logger = logging.getLogger(__name__)
 # Scheduler para sincronización automática
 scheduler = AsyncIOScheduler()
 
-async def auto_sync_appointments():
+async def auto_sync_appointments(trigger: str = 'scheduled'):
     """Función que se ejecuta automáticamente para sincronizar citas"""
     try:
-        print("🔄 Iniciando sincronización automática de citas...")
-        import sys
-        sys.path.insert(0, str(ROOT_DIR))
-        from sync_google_sheets import sync_appointments
+        if sync_coordinator.running:
+            print("⏭️ Sincronización ya en curso, la automática se une a ella")
+        else:
+            print("🔄 Iniciando sincronización automática de citas...")
         
-        result = await sync_appointments()
+        result = await sync_coordinator.run(trigger)
         
         if result.get('success'):
-            print(f"✅ Sincronización automática completada: {result.get('appointments_synced', 0)} citas, {result.get('patients_synced', 0)} pacientes")
+            print(f"✅ Sincronización automática completada: {result.get('inserted', 0)} nuevas, {result.get('updated', 0)} actualizadas, {result.get('unchanged', 0)} sin cambios, {result.get('deleted', 0)} eliminadas, {result.get('patients_synced', 0)} pacientes")
         else:
             print(f"❌ Error en sincronización automática: {result.get('error', 'Error desconocido')}")
     except Exception as e:
@@ -457,7 +617,24 @@ async def auto_sync_appointments():
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(check_and_send_reminders())
+    # Índices en segundo plano: en colecciones grandes la construcción tarda minutos
+    from db_indexes import build_indexes_in_background
+    from migrations import run_migrations, BLOCKING_MIGRATION
+    asyncio.create_task(build_indexes_in_background(db))
+    # Las fechas deben ser nativas antes de servir consultas por rango; el resto, en segundo plano
+    await run_migrations(db, until=BLOCKING_MIGRATION)
+    asyncio.create_task(run_migrations(db))
+    
+    # Recordatorios: cola indexada por reminder_due_at
+    start_reminder_dispatcher(db)
+    
+    # Webhooks de WhatsApp: cola persistente procesada en segundo plano
+    from webhook_queue import start_webhook_queue
+    start_webhook_queue(db)
+    
+    # Borrado de conversaciones grandes: por lotes en segundo plano
+    from conversation_purger import start_conversation_purger
+    start_conversation_purger(db)
     
     # Configurar sincronización automática cada 5 minutos
     scheduler.add_job(
@@ -471,7 +648,22 @@ async def startup_event():
     print("✅ Scheduler de sincronización automática iniciado (cada 5 minutos)")
     
     # Ejecutar una sincronización inmediata al iniciar
-    asyncio.create_task(auto_sync_appointments())
+    asyncio.create_task(auto_sync_appointments('startup'))
+    
+    # Estado de WhatsApp: una consulta para todos los navegadores conectados
+    asyncio.create_task(watch_whatsapp_status())
+
+async def watch_whatsapp_status():
+    """Poll the WhatsApp service while someone is listening and publish status changes"""
+    last_status = None
+    while True:
+        await asyncio.sleep(WHATSAPP_STATUS_POLL_SECONDS)
+        if not event_bus.subscriber_count:
+            continue
+        status = await get_whatsapp_status()
+        if status != last_status:
+            event_bus.publish('whatsapp.status', status)
+            last_status = status
 
 
 
@@ -799,4 +991,6 @@ print("   - Recordatorios automáticos cada hora")
 @app.on_event("shutdown")
 async def shutdown_db_client():
     scheduler.shutdown()
+    await close_whatsapp_client()
+    shutdown_sheets_executor()
     client.close()
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Sheet Date/Time Parsing
+Detects the format of a fecha/hora column once and parses the whole column with precompiled regexes
+"""
+import re
+from datetime import date, datetime, time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Cuántos valores no vacíos se miran para detectar el formato de la columna
+SAMPLE_SIZE = 50
+
+
+def _two_digit_year(year: int) -> int:
+    # Igual que strptime %y: 00-68 -> 2000-2068, 69-99 -> 1969-1999
+    return year + (2000 if year < 69 else 1900)
+
+
+# nombre -> (regex, constructor a partir de los grupos)
+DATE_FORMATS: Dict[str, Tuple[re.Pattern, Callable]] = {
+    'dd/mm/yyyy': (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})'), lambda d, m, y: date(int(y), int(m), int(d))),
+    'dd-mm-yyyy': (re.compile(r'(\d{1,2})-(\d{1,2})-(\d{4})'), lambda d, m, y: date(int(y), int(m), int(d))),
+    'yyyy-mm-dd': (re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'), lambda y, m, d: date(int(y), int(m), int(d))),
+    'dd/mm/yy': (re.compile(r'(\d{1,2})/(\d{1,2})/(\d{2})'), lambda d, m, y: date(_two_digit_year(int(y)), int(m), int(d))),
+    'dd.mm.yyyy': (re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})'), lambda d, m, y: date(int(y), int(m), int(d))),
+}
+
+
+def _build_time(hour: str, minute: str, second: Optional[str] = None, meridiem: Optional[str] = None) -> time:
+    hour = int(hour)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"hour {hour} out of range for {meridiem}")
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    return time(hour, int(minute), int(second or 0))
+
+
+TIME_FORMATS: Dict[str, Tuple[re.Pattern, Callable]] = {
+    'HH:MM': (re.compile(r'(\d{1,2}):(\d{2})'), _build_time),
+    'HH:MM:SS': (re.compile(r'(\d{1,2}):(\d{2}):(\d{2})'), _build_time),
+    'hh:MM AM/PM': (
+        re.compile(r'(\d{1,2}):(\d{2})\s*([AaPp][Mm])'),
+        lambda h, m, meridiem: _build_time(h, m, meridiem=meridiem)
+    ),
+}
+
+
+def detect_format(values: List[str], formats: Dict[str, Tuple[re.Pattern, Callable]]) -> Optional[str]:
+    """Name of the format matching most of a sample of the column's non-empty values"""
+    sample = [value.strip() for value in values if value and value.strip()][:SAMPLE_SIZE]
+    best, best_hits = None, 0
+    for name, (pattern, _) in formats.items():
+        hits = sum(1 for value in sample if pattern.fullmatch(value))
+        if hits > best_hits:
+            best, best_hits = name, hits
+    return best
+
+
+def _parse_value(value: str, formats: Dict[str, Tuple[re.Pattern, Callable]], order: List[str]):
+    """Parse one value trying the formats in order; returns (parsed, error)"""
+    for name in order:
+        pattern, build = formats[name]
+        match = pattern.fullmatch(value)
+        if match:
+            try:
+                return build(*match.groups()), None
+            except ValueError as e:
+                # Coincide el formato pero no es una fecha/hora válida (p. ej. 31/02)
+                return None, f"'{value}' no es válido ({e})"
+    return None, f"formato no reconocido: '{value}'"
+
+
+def parse_column(values: List[str], formats: Dict[str, Tuple[re.Pattern, Callable]]):
+    """
+    Parse a whole column
+    The detected format is tried first; the others only for values that do not
+    match it. Each distinct value is parsed once.
+    Returns (parsed values, detected format, {position: error}).
+    """
+    detected = detect_format(values, formats)
+    order = ([detected] if detected else []) + [name for name in formats if name != detected]
+
+    memo: Dict[str, Tuple] = {}
+    parsed, errors = [], {}
+    for position, raw in enumerate(values):
+        value = raw.strip() if raw else ''
+        if not value:
+            parsed.append(None)
+            errors[position] = 'vacío'
+            continue
+        if value not in memo:
+            memo[value] = _parse_value(value, formats, order)
+        result, error = memo[value]
+        parsed.append(result)
+        if error:
+            errors[position] = error
+    return parsed, detected, errors
+
+
+def parse_date_column(values: List[str]):
+    return parse_column(values, DATE_FORMATS)
+
+
+def parse_time_column(values: List[str]):
+    return parse_column(values, TIME_FORMATS)
+
+
+def parse_datetime_columns(dates: List[str], times: List[str], row_numbers: List[int]):
+    """
+    Combine a fecha and an hora column into naive datetimes
+    Returns (datetimes with None for rejected rows, [{'row', 'reason'}] for the rejected ones).
+    """
+    parsed_dates, _, date_errors = parse_date_column(dates)
+    parsed_times, _, time_errors = parse_time_column(times)
+
+    datetimes, rejected = [], []
+    for position, (parsed_date, parsed_time) in enumerate(zip(parsed_dates, parsed_times)):
+        if parsed_date is None or parsed_time is None:
+            reasons = []
+            if position in date_errors:
+                reasons.append(f"fecha {date_errors[position]}")
+            if position in time_errors:
+                reasons.append(f"hora {time_errors[position]}")
+            rejected.append({'row': row_numbers[position], 'reason': '; '.join(reasons)})
+            datetimes.append(None)
+            continue
+        datetimes.append(datetime.combine(parsed_date, parsed_time))
+    return datetimes, rejected
+
+
+def parse_sheet_datetime(fecha: str, hora: str) -> Optional[datetime]:
+    """Single-row convenience for callers that only have one appointment"""
+    datetimes, _ = parse_datetime_columns([fecha], [hora], [0])
+    return datetimes[0]
@@ -0,0 +1,135 @@
+"""
+Google Sheets Snapshot Cache
+One shared, TTL-cached copy of each sheet range, with an index by appointment date
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sheet_parsing import parse_date_column
+from sheets_client import get_sheet_values
+
+DEFAULT_SPREADSHEET_ID = '1MBDBHQ08XGuf5LxVHCFhHDagIazFkpBnxwqyEQIBJrQ'
+DEFAULT_RANGE = 'Hoja 1!A:Z'  # La hoja se llama "Hoja 1"
+
+# Segundos que una copia se considera fresca
+SNAPSHOT_TTL_SECONDS = float(os.environ.get('SHEET_SNAPSHOT_TTL_SECONDS', 300))
+
+
+class SheetSnapshot:
+    """Immutable copy of a sheet range plus a sorted (fecha, row) index"""
+
+    def __init__(self, values: List[List[str]], digest: str):
+        self.values = values
+        self.digest = digest
+        self.fetched_at = time.monotonic()
+        self.headers = values[0] if values else []
+        self.column_map = {header.lower().strip(): i for i, header in enumerate(self.headers)}
+        self._date_index = self._build_date_index()
+        self._date_keys = [entry[0] for entry in self._date_index]
+
+    @property
+    def rows(self) -> List[List[str]]:
+        """Data rows, without the header row"""
+        return self.values[1:]
+
+    def _build_date_index(self) -> List[Tuple[date, int]]:
+        column = self.column_map.get('fecha')
+        if column is None:
+            return []
+        fechas = [row[column] if column < len(row) else '' for row in self.rows]
+        parsed, _, _ = parse_date_column(fechas)
+        index = [(fecha, position) for position, fecha in enumerate(parsed) if fecha is not None]
+        index.sort()
+        return index
+
+    def rows_between(self, start: date, end: date) -> List[List[str]]:
+        """Rows whose fecha falls in [start, end], in date order"""
+        lo = bisect.bisect_left(self._date_keys, start)
+        hi = bisect.bisect_right(self._date_keys, end)
+        return [self.rows[position] for _, position in self._date_index[lo:hi]]
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+def values_digest(values: List[List[str]]) -> str:
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class SheetSnapshotCache:
+    """
+    Snapshots keyed by (spreadsheet_id, range)
+    Concurrent readers of a stale key share one download. Every refresh downloads
+    the whole range: the Sheets API has no conditional read, and a Drive revision
+    check would need a Drive scope the service account does not have. The content
+    digest only saves rebuilding the snapshot and its date index when nothing changed.
+    """
+
+    def __init__(self, ttl: float = SNAPSHOT_TTL_SECONDS):
+        self.ttl = ttl
+        self._snapshots: Dict[Tuple[str, str], SheetSnapshot] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self._stats = {'hits': 0, 'refreshes': 0, 'unchanged_refreshes': 0}
+
+    async def get(self, spreadsheet_id: str, range_name: str, max_age: Optional[float] = None) -> SheetSnapshot:
+        key = (spreadsheet_id, range_name)
+        max_age = self.ttl if max_age is None else max_age
+
+        snapshot = self._snapshots.get(key)
+        if snapshot and snapshot.age() <= max_age:
+            self._stats['hits'] += 1
+            return snapshot
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Otro lector pudo refrescarla mientras esperábamos el lock
+            snapshot = self._snapshots.get(key)
+            if snapshot and snapshot.age() <= max_age:
+                self._stats['hits'] += 1
+                return snapshot
+
+            values = await get_sheet_values(spreadsheet_id, range_name)
+            digest = values_digest(values)
+            self._stats['refreshes'] += 1
+            if snapshot and snapshot.digest == digest:
+                # Descargada igualmente; sin cambios se reutiliza el índice y se renueva la marca de tiempo
+                self._stats['unchanged_refreshes'] += 1
+                snapshot.fetched_at = time.monotonic()
+            else:
+                snapshot = SheetSnapshot(values, digest)
+                self._snapshots[key] = snapshot
+            return snapshot
+
+    def invalidate(self, spreadsheet_id: Optional[str] = None, range_name: Optional[str] = None):
+        for key in list(self._snapshots):
+            if spreadsheet_id in (None, key[0]) and range_name in (None, key[1]):
+                del self._snapshots[key]
+
+    def get_stats(self) -> Dict:
+        return {
+            **self._stats,
+            'ttl_seconds': self.ttl,
+            'snapshots': {
+                f"{spreadsheet_id}:{range_name}": {
+                    'rows': len(snapshot.rows),
+                    'age_seconds': round(snapshot.age(), 1),
+                    'digest': snapshot.digest,
+                }
+                for (spreadsheet_id, range_name), snapshot in self._snapshots.items()
+            },
+        }
+
+
+sheet_cache = SheetSnapshotCache()
+
+
+async def get_sheet_snapshot(spreadsheet_id: str = DEFAULT_SPREADSHEET_ID, range_name: str = DEFAULT_RANGE,
+                             max_age: Optional[float] = None) -> SheetSnapshot:
+    """Return the process-wide snapshot of a sheet range, refreshing it if older than max_age"""
+    return await sheet_cache.get(spreadsheet_id, range_name, max_age=max_age)
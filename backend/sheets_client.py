@@ -0,0 +1,97 @@
+"""
+Google Sheets API Client
+Runs the blocking googleapiclient calls in a bounded thread pool, with timeouts and retry/backoff
+"""
+import asyncio
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List
+
+import httplib2
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+ROOT_DIR = Path(__file__).parent
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+CREDENTIALS_FILE = os.environ.get('GOOGLE_CREDENTIALS_FILE', str(ROOT_DIR / 'credentials.json'))
+
+MAX_WORKERS = int(os.environ.get('GOOGLE_API_MAX_WORKERS', 4))
+TIMEOUT_SECONDS = float(os.environ.get('GOOGLE_API_TIMEOUT_SECONDS', 60))
+MAX_RETRIES = int(os.environ.get('GOOGLE_API_MAX_RETRIES', 3))
+BACKOFF_SECONDS = float(os.environ.get('GOOGLE_API_BACKOFF_SECONDS', 1))
+
+# Errores HTTP de Google que merece la pena reintentar
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='google-api')
+_credentials = None
+_credentials_lock = threading.Lock()
+# Los objetos service/httplib2 no son thread-safe: uno por hilo del pool
+_thread_local = threading.local()
+
+
+def _get_credentials():
+    global _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            _credentials = service_account.Credentials.from_service_account_file(
+                CREDENTIALS_FILE, scopes=SCOPES
+            )
+        return _credentials
+
+
+def get_sheets_service():
+    """Return the Sheets service of the current thread, building it on first use"""
+    service = getattr(_thread_local, 'service', None)
+    if service is None:
+        http = AuthorizedHttp(_get_credentials(), http=httplib2.Http(timeout=TIMEOUT_SECONDS))
+        service = build('sheets', 'v4', http=http, cache_discovery=False)
+        _thread_local.service = service
+    return service
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUS
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+async def run_blocking(func, *args, timeout: float = TIMEOUT_SECONDS, retries: int = MAX_RETRIES):
+    """Run a blocking Google API call in the pool, retrying transient errors with backoff"""
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(_executor, partial(func, *args)),
+                timeout=timeout
+            )
+        except Exception as e:
+            if attempt >= retries or not _is_retryable(e):
+                raise
+            delay = BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, BACKOFF_SECONDS)
+            print(f"⚠️ Google API falló ({e!r}), reintento {attempt + 1}/{retries} en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _fetch_values(spreadsheet_id: str, range_name: str) -> dict:
+    service = get_sheets_service()
+    return service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=range_name
+    ).execute()
+
+
+async def get_sheet_values(spreadsheet_id: str, range_name: str) -> List[List[str]]:
+    """Read a range of a spreadsheet without blocking the event loop"""
+    result = await run_blocking(_fetch_values, spreadsheet_id, range_name)
+    return result.get('values', [])
+
+
+def shutdown_sheets_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,162 @@
+"""
+Sync Coordinator
+Runs at most one Google Sheets sync at a time and tracks its progress
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from event_bus import event_bus
+from sync_google_sheets import sync_appointments
+
+# Resumen del resultado que viaja en el evento sync.finished
+RESULT_SUMMARY_FIELDS = (
+    'success', 'error', 'inserted', 'updated', 'unchanged', 'deleted', 'delete_skipped', 'rejected',
+    'patients_synced', 'appointments_synced'
+)
+
+
+class SyncCoordinator:
+    """
+    Single-flight wrapper around sync_appointments
+    Callers that arrive while a sync is running await that same run instead of
+    starting another one. File imports go through the same coordinator: they wait
+    for the running sync (or import) and syncs requested meanwhile run after them.
+    The guard is per process.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._task: Optional[asyncio.Task] = None
+        # La tarea en curso es una importación (no se une a ella una sincronización)
+        self._importing = False
+        self._import_lock = asyncio.Lock()
+        # Sincronización pedida sin esperar mientras corre una importación
+        self._queued: Optional[asyncio.Task] = None
+        self._started_monotonic = 0.0
+        self._status = {
+            'running': False,
+            'trigger': None,
+            'source': None,
+            'phase': 'idle',
+            # La hoja se lee por bloques: solo se conoce lo procesado, no el total
+            'rows_processed': 0,
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'last_result': None,
+            'last_error': None,
+            'last_success_at': None,
+            'runs': 0,
+            'joined': 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _progress(self, phase: str, **counts):
+        if phase != self._status['phase']:
+            event_bus.publish('sync.progress', {'phase': phase, 'trigger': self._status['trigger']})
+        self._status['phase'] = phase
+        self._status.update(counts)
+
+    async def _run(self, trigger: str, source=None) -> Dict:
+        self._started_monotonic = time.monotonic()
+        self._status.update({
+            'running': True,
+            'trigger': trigger,
+            'source': source.describe() if source else 'Google Sheets',
+            'phase': 'starting',
+            'rows_processed': 0,
+            'started_at': datetime.now(timezone.utc),
+            'finished_at': None,
+            'duration_seconds': None,
+        })
+        self._status['runs'] += 1
+        try:
+            result = await sync_appointments(self.db, source=source, progress=self._progress)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        finished_at = datetime.now(timezone.utc)
+        self._status.update({
+            'running': False,
+            'phase': 'done' if result.get('success') else 'failed',
+            'finished_at': finished_at,
+            'duration_seconds': round(time.monotonic() - self._started_monotonic, 3),
+            'last_result': result,
+        })
+        if result.get('success'):
+            self._status['last_error'] = None
+            self._status['last_success_at'] = finished_at
+        else:
+            self._status['last_error'] = result.get('error', 'Error desconocido')
+        event_bus.publish('sync.finished', {
+            'trigger': trigger,
+            'duration_seconds': self._status['duration_seconds'],
+            **{field: result[field] for field in RESULT_SUMMARY_FIELDS if field in result},
+        })
+        return result
+
+    async def _wait_current(self):
+        try:
+            await asyncio.shield(self._task)
+        except Exception:
+            pass
+
+    def start(self, trigger: str = 'manual') -> bool:
+        """Start a sync in the background; returns False if one was already running or queued"""
+        if self.running and self._importing:
+            # Tras la importación en curso
+            if self._queued is None or self._queued.done():
+                self._queued = asyncio.create_task(self.run(trigger))
+                return True
+            self._status['joined'] += 1
+            return False
+        if self.running:
+            self._status['joined'] += 1
+            return False
+        self._importing = False
+        self._task = asyncio.create_task(self._run(trigger))
+        return True
+
+    async def run(self, trigger: str = 'manual') -> Dict:
+        """Run a sync, or wait for the one in flight, and return its result"""
+        while self.running and self._importing:
+            await self._wait_current()
+        self.start(trigger)
+        # shield: si un cliente HTTP se desconecta, la sincronización sigue
+        return await asyncio.shield(self._task)
+
+    async def run_import(self, source, trigger: str = 'import') -> Dict:
+        """Import appointments from another source once no sync or import is running"""
+        async with self._import_lock:
+            while self.running:
+                await self._wait_current()
+            self._importing = True
+            self._task = asyncio.create_task(self._run(trigger, source=source))
+            return await asyncio.shield(self._task)
+
+    def get_status(self) -> Dict:
+        status = dict(self._status)
+        if self.running:
+            status['duration_seconds'] = round(time.monotonic() - self._started_monotonic, 3)
+        return status
+
+
+_coordinator: Optional[SyncCoordinator] = None
+
+
+def init_sync_coordinator(db) -> SyncCoordinator:
+    """Create the process-wide coordinator (called once by the main app)"""
+    global _coordinator
+    _coordinator = SyncCoordinator(db)
+    return _coordinator
+
+
+def get_sync_coordinator() -> SyncCoordinator:
+    if _coordinator is None:
+        raise RuntimeError("Sync coordinator not initialized")
+    return _coordinator
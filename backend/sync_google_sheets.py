@@ -1,293 +1,372 @@
 import os
+import argparse
 import json
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import hashlib
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import asyncio
 from dotenv import load_dotenv
 from pathlib import Path
 import uuid
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from sheet_parsing import parse_datetime_columns
+from sheet_snapshot import DEFAULT_SPREADSHEET_ID, DEFAULT_RANGE
+from appointment_sources import GoogleSheetsSource, LocalFileSource
+from reminder_queue import compute_reminder_due_at, reminder_due_update, merge_updates, notify_reminder_dispatcher
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Google Sheets setup
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-SPREADSHEET_ID = '1MBDBHQ08XGuf5LxVHCFhHDagIazFkpBnxwqyEQIBJrQ'
-RANGE_NAME = 'Hoja 1!A:Z'  # La hoja se llama "Hoja 1"
+SPREADSHEET_ID = os.environ.get('GOOGLE_SHEET_ID', DEFAULT_SPREADSHEET_ID)
+RANGE_NAME = DEFAULT_RANGE
 
-# MongoDB setup
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Antigüedad máxima de la copia de la hoja que acepta una sincronización
+SYNC_MAX_AGE_SECONDS = float(os.environ.get('SYNC_SHEET_MAX_AGE_SECONDS', 60))
 
-def get_google_sheets_service():
-    """Initialize Google Sheets API service"""
-    creds = service_account.Credentials.from_service_account_file(
-        ROOT_DIR / 'credentials.json', scopes=SCOPES)
-    service = build('sheets', 'v4', credentials=creds)
-    return service
+# Operaciones por llamada a bulk_write
+BULK_CHUNK_SIZE = int(os.environ.get('SYNC_BULK_CHUNK_SIZE', 500))
+# Filas que se leen, comparan y escriben juntas
+READ_CHUNK_SIZE = int(os.environ.get('SYNC_READ_CHUNK_SIZE', 2000))
 
-def parse_date_time(date_str, time_str):
-    """Parse date and time strings to datetime object"""
-    try:
-        # Intenta varios formatos de fecha
-        date_formats = [
-            '%d/%m/%Y',
-            '%d-%m-%Y',
-            '%Y-%m-%d',
-            '%d/%m/%y',
-            '%d.%m.%Y'
-        ]
-        
-        parsed_date = None
-        for fmt in date_formats:
-            try:
-                parsed_date = datetime.strptime(date_str.strip(), fmt)
-                break
-            except ValueError:
+# Filas rechazadas que se devuelven en el resultado (el total siempre se cuenta)
+MAX_REJECTED_REPORTED = 100
+
+# Fracción máxima de las citas sincronizadas que una pasada puede borrar
+SYNC_MAX_DELETE_RATIO = float(os.environ.get('SYNC_MAX_DELETE_RATIO', 0.2))
+# Borrados que siempre se permiten aunque superen la fracción (hojas pequeñas)
+SYNC_DELETE_ALWAYS_ALLOWED = int(os.environ.get('SYNC_DELETE_ALWAYS_ALLOWED', 10))
+
+# Campos de la fila que determinan si una cita cambió en la hoja
+HASHED_FIELDS = ('registro', 'nombre', 'telefono', 'fecha', 'hora', 'tratamiento', 'doctor', 'notas', 'estado_cita')
+
+def row_hash(row_data):
+    """Stable hash of the source values of a sheet row"""
+    payload = json.dumps([row_data.get(field, '') for field in HASHED_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def delete_guard(column_map, valid_rows, to_delete=0, synced=0,
+                 max_ratio=SYNC_MAX_DELETE_RATIO, always_allowed=SYNC_DELETE_ALWAYS_ALLOWED):
+    """
+    Reason to skip deleting the appointments whose row disappeared, or None if it is safe
+    Without a registro column or a single valid row every synced appointment
+    would look missing; a delete above max_ratio of them is treated the same way.
+    """
+    if not column_map or 'registro' not in column_map:
+        return "la hoja no tiene columna 'registro'"
+    if valid_rows == 0:
+        return "la hoja no tiene ninguna fila válida"
+    if to_delete > always_allowed and to_delete > synced * max_ratio:
+        return f"se borrarían {to_delete} de {synced} citas sincronizadas (máximo {max_ratio:.0%})"
+    return None
+
+def build_appointment_fields(apt_data):
+    """Appointment fields written on every sync of a changed row"""
+    nombre = apt_data['nombre']
+    tratamiento = apt_data['tratamiento']
+    doctor = apt_data['doctor']
+    estado_cita = apt_data['estado_cita']
+    
+    # Separar nombre y apellidos
+    nombre_parts = nombre.split(' ', 1)
+    nombre_solo = nombre_parts[0] if len(nombre_parts) > 0 else nombre
+    apellidos_solo = nombre_parts[1] if len(nombre_parts) > 1 else ''
+    
+    return {
+        "patient_name": nombre,  # Mantener para compatibilidad
+        "patient_phone": apt_data['telefono'],
+        # Campos que espera el frontend
+        "nombre": nombre_solo,
+        "apellidos": apellidos_solo,
+        "fecha": apt_data['fecha'],  # Fecha original del Google Sheet
+        "hora": apt_data['hora'],    # Hora original del Google Sheet
+        "tratamiento": tratamiento or "Consulta",
+        "estado_cita": estado_cita.lower() if estado_cita else "planificada",
+        "odontologo": doctor or "Dra. Virginia Tresgallo",
+        "notas": apt_data['notas'],
+        "tel_movil": apt_data['telefono'],
+        # Campos adicionales para compatibilidad con backend
+        "title": tratamiento or "Consulta",
+        "date": apt_data['appointment_datetime'],
+        "doctor": doctor or "Dra. Virginia Tresgallo",
+        "status": estado_cita.lower() if estado_cita else "planificada",
+        "source": apt_data['source'],
+        "sheet_row_hash": apt_data['sheet_row_hash']
+    }
+
+async def flush_operations(collection, operations, chunk_size):
+    """
+    Send operations with unordered bulk_write in chunks
+    Returns what was actually written ('upserted', 'modified') and the number of
+    write errors; a failed chunk still counts the operations that went through.
+    """
+    totals = {'upserted': 0, 'modified': 0, 'errors': 0}
+    for i in range(0, len(operations), chunk_size):
+        try:
+            result = await collection.bulk_write(operations[i:i + chunk_size], ordered=False)
+            totals['upserted'] += result.upserted_count
+            totals['modified'] += result.modified_count
+        except BulkWriteError as e:
+            totals['upserted'] += e.details.get('nUpserted', 0)
+            totals['modified'] += e.details.get('nModified', 0)
+            totals['errors'] += len(e.details.get('writeErrors', []))
+            print(f"❌ Errores escribiendo en {collection.name}: {e.details.get('writeErrors', [])[:3]}")
+    return totals
+
+def _no_progress(phase, **counts):
+    pass
+
+def extract_rows(column_map, chunk_rows, first_row_idx, seen_registros, rejected):
+    """Map raw rows to row_data dicts keyed by registro (if a registro repeats, the last row wins)"""
+    def get_value(row, col_name):
+        idx = column_map.get(col_name.lower().strip())
+        if idx is not None and idx < len(row):
+            return row[idx].strip() if row[idx] else ''
+        return ''
+    
+    rows = {}
+    for row_idx, row in enumerate(chunk_rows, start=first_row_idx):
+        try:
+            # Saltar filas vacías
+            if not row or len(row) < 3:
                 continue
-        
-        if not parsed_date:
-            print(f"No se pudo parsear la fecha: {date_str}")
-            return None
-        
-        # Parsear hora
-        time_str = time_str.strip()
-        time_formats = ['%H:%M', '%H:%M:%S', '%I:%M %p']
-        
-        parsed_time = None
-        for fmt in time_formats:
-            try:
-                parsed_time = datetime.strptime(time_str, fmt).time()
-                break
-            except ValueError:
+            
+            # Extraer datos según el script correcto
+            registro = get_value(row, 'registro')
+            # "Visto" significa que la fila sigue en la hoja, aunque se rechace: una fila
+            # incompleta de momento no borra su cita. Las filas válidas se cuentan aparte.
+            if registro:
+                seen_registros.add(registro)
+            apellidos = get_value(row, 'apellidos')
+            nombre_pila = get_value(row, 'nombre')
+            nombre = f"{nombre_pila} {apellidos}".strip() if (nombre_pila or apellidos) else ''
+            row_data = {
+                'registro': registro,
+                'nombre': nombre,
+                'telefono': get_value(row, 'telmovil') or get_value(row, 'tel_movil') or get_value(row, 'tel_móvil'),
+                'fecha': get_value(row, 'fecha'),
+                'hora': get_value(row, 'hora'),
+                'tratamiento': get_value(row, 'tratamiento'),
+                'doctor': get_value(row, 'odontologo') or get_value(row, 'odontólogo'),
+                'notas': get_value(row, 'notas'),
+                'estado_cita': get_value(row, 'estadocita') or get_value(row, 'estado_cita')
+            }
+            
+            # Validar datos mínimos (registro es obligatorio para evitar duplicados)
+            if not all(row_data[field] for field in ('registro', 'nombre', 'telefono', 'fecha', 'hora')):
+                missing = [field for field in ('registro', 'nombre', 'telefono', 'fecha', 'hora') if not row_data[field]]
+                rejected.append({'row': row_idx, 'reason': f"faltan campos: {', '.join(missing)}"})
                 continue
-        
-        if not parsed_time:
-            print(f"No se pudo parsear la hora: {time_str}")
-            return None
-        
-        # Combinar fecha y hora
-        combined = datetime.combine(parsed_date.date(), parsed_time)
-        # Convertir a UTC
-        return combined.replace(tzinfo=timezone.utc)
-        
-    except Exception as e:
-        print(f"Error parseando fecha/hora: {date_str} {time_str} - {str(e)}")
-        return None
+            
+            row_data['row_idx'] = row_idx
+            row_data['sheet_row_hash'] = row_hash(row_data)
+            rows[registro] = row_data
+            
+        except Exception as e:
+            print(f"Error procesando fila {row_idx}: {str(e)}")
+            rejected.append({'row': row_idx, 'reason': str(e)})
+            continue
+    return rows
 
-async def sync_appointments():
-    """Sync appointments from Google Sheets to MongoDB"""
-    try:
-        print("Iniciando sincronización con Google Sheets...")
+async def sync_chunk(db, source_name, rows, counters, rejected, chunk_size):
+    """Compare, parse and write one block of extracted rows"""
+    # 1. Citas ya sincronizadas con estos registros, en una sola consulta $in
+    existing_appointments = {}
+    async for doc in db.appointments.find(
+        {"registro": {"$in": list(rows)}},
+        {"_id": 0, "registro": 1, "sheet_row_hash": 1, "status": 1,
+         "reminder_enabled": 1, "reminder_sent": 1, "reminder_minutes_before": 1}
+    ):
+        existing_appointments[doc["registro"]] = doc
+    
+    # 2. Descartar filas sin cambios y parsear fecha/hora del resto por columnas
+    changed_rows = []
+    for registro, row_data in rows.items():
+        existing = existing_appointments.get(registro)
+        if existing and existing.get('sheet_row_hash') == row_data['sheet_row_hash']:
+            continue
+        changed_rows.append(row_data)
+    counters['unchanged'] += len(rows) - len(changed_rows)
+    
+    datetimes, rejected_dates = parse_datetime_columns(
+        [row_data['fecha'] for row_data in changed_rows],
+        [row_data['hora'] for row_data in changed_rows],
+        [row_data['row_idx'] for row_data in changed_rows]
+    )
+    rejected.extend(rejected_dates)
+    pending_appointments = [
+        # Las horas de la hoja se guardan como UTC
+        {**row_data, 'appointment_datetime': appointment_datetime.replace(tzinfo=timezone.utc), 'source': source_name}
+        for row_data, appointment_datetime in zip(changed_rows, datetimes)
+        if appointment_datetime is not None
+    ]
+    
+    # 3. Pacientes de las citas nuevas, en una sola consulta $in
+    new_phones = {
+        apt['telefono'] for apt in pending_appointments
+        if apt['registro'] not in existing_appointments
+    }
+    patient_ids = {}
+    async for patient in db.patients.find({"phone": {"$in": list(new_phones)}}, {"_id": 0, "id": 1, "phone": 1}):
+        patient_ids[patient['phone']] = patient['id']
+    
+    # 4. Construir las operaciones
+    patient_operations = []
+    appointment_operations = []
+    now = datetime.now(timezone.utc)
+    
+    for apt_data in pending_appointments:
+        registro = apt_data['registro']
+        fields = build_appointment_fields(apt_data)
+        existing = existing_appointments.get(registro)
         
-        # Obtener datos de Google Sheets
-        service = get_google_sheets_service()
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME).execute()
-        values = result.get('values', [])
+        if existing:
+            appointment_operations.append(UpdateOne(
+                {"registro": registro},
+                merge_updates({"$set": fields}, reminder_due_update({**existing, **fields}))
+            ))
+            continue
         
-        if not values:
-            print('No se encontraron datos en la hoja.')
-            return
-        
-        # Primera fila son los headers
-        headers = values[0]
-        print(f"Headers encontrados: {headers}")
+        telefono = apt_data['telefono']
+        if telefono not in patient_ids:
+            patient_ids[telefono] = str(uuid.uuid4())
+            patient_operations.append(UpdateOne(
+                {"phone": telefono},
+                {"$setOnInsert": {
+                    "id": patient_ids[telefono],
+                    "name": apt_data['nombre'],
+                    "email": "",
+                    "notes": "",
+                    "created_at": now
+                }},
+                upsert=True
+            ))
         
-        # Mapear índices de columnas
-        column_map = {}
-        for i, header in enumerate(headers):
-            column_map[header.lower().strip()] = i
+        insert_fields = {
+            "id": str(uuid.uuid4()),
+            "patient_id": patient_ids[telefono],
+            "duration_minutes": 30,
+            "reminder_enabled": True,
+            "reminder_minutes_before": 1440,  # 1 día antes
+            "reminder_sent": False,
+            "created_at": now
+        }
+        due_at = compute_reminder_due_at({**fields, **insert_fields})
+        if due_at:
+            fields["reminder_due_at"] = due_at
         
-        print(f"Mapa de columnas: {column_map}")
+        appointment_operations.append(UpdateOne(
+            {"registro": registro},
+            {"$set": fields, "$setOnInsert": insert_fields},
+            upsert=True
+        ))
+    
+    # 5. Escribir en lotes (primero pacientes, que las citas nuevas referencian)
+    # Los contadores salen de lo que Mongo escribió de verdad, no de lo encolado
+    patients = await flush_operations(db.patients, patient_operations, chunk_size)
+    appointments = await flush_operations(db.appointments, appointment_operations, chunk_size)
+    counters['patients'] += patients['upserted']
+    counters['inserted'] += appointments['upserted']
+    counters['updated'] += appointments['modified']
+    counters['write_errors'] += patients['errors'] + appointments['errors']
+
+async def sync_appointments(db, source=None, chunk_size=BULK_CHUNK_SIZE, read_chunk_size=READ_CHUNK_SIZE,
+                            max_age=SYNC_MAX_AGE_SECONDS, progress=None):
+    """
+    Sync appointments from a source (the Google Sheet by default) to MongoDB
+    Rows are read and written block by block. Only complete sources (the sheet)
+    delete synced appointments whose row disappeared.
+    progress(phase, **counts) is called as the sync moves through its phases.
+    The caller owns the Mongo client behind db; it is never closed here.
+    """
+    progress = progress or _no_progress
+    source = source or GoogleSheetsSource(SPREADSHEET_ID, RANGE_NAME, max_age=max_age)
+    try:
+        print(f"Iniciando sincronización desde {source.describe()}...")
+        progress('fetching')
         
-        # Procesar filas
-        appointments_synced = 0
-        patients_synced = 0
+        counters = {'patients': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'write_errors': 0}
+        seen_registros = set()
+        rejected = []
+        rows_processed = 0
+        column_map = None
         
-        # Primero recolectar todas las citas válidas con sus fechas para ordenar
-        pending_appointments = []
+        async for headers, chunk_rows in source.iter_chunks(read_chunk_size):
+            if column_map is None:
+                print(f"Headers encontrados: {headers}")
+                # Mapear índices de columnas
+                column_map = {header.lower().strip(): i for i, header in enumerate(headers)}
+            
+            # La fila 1 son los headers
+            rows = extract_rows(column_map, chunk_rows, rows_processed + 2, seen_registros, rejected)
+            rows_processed += len(chunk_rows)
+            progress('writing', rows_processed=rows_processed)
+            await sync_chunk(db, source.name, rows, counters, rejected, chunk_size)
         
-        for row_idx, row in enumerate(values[1:], start=2):
-            try:
-                # Saltar filas vacías
-                if not row or len(row) < 3:
-                    continue
-                
-                # Obtener valores
-                def get_value(col_name):
-                    idx = column_map.get(col_name.lower().strip())
-                    if idx is not None and idx < len(row):
-                        return row[idx].strip() if row[idx] else ''
-                    return ''
-                
-                # Extraer datos según el script correcto
-                registro = get_value('registro')
-                apellidos = get_value('apellidos')
-                nombre_pila = get_value('nombre')
-                nombre = f"{nombre_pila} {apellidos}".strip() if (nombre_pila or apellidos) else ''
-                telefono = get_value('telmovil') or get_value('tel_movil') or get_value('tel_móvil')
-                fecha = get_value('fecha')
-                hora = get_value('hora')
-                tratamiento = get_value('tratamiento')
-                doctor = get_value('odontologo') or get_value('odontólogo')
-                notas = get_value('notas')
-                estado_cita = get_value('estadocita') or get_value('estado_cita')
-                
-                # Validar datos mínimos (registro es obligatorio para evitar duplicados)
-                if not registro or not nombre or not telefono or not fecha or not hora:
-                    print(f"Fila {row_idx}: Datos incompletos (falta registro, nombre, teléfono, fecha u hora), saltando...")
-                    continue
-                
-                # Parsear fecha y hora
-                appointment_datetime = parse_date_time(fecha, hora)
-                if not appointment_datetime:
-                    print(f"Fila {row_idx}: No se pudo parsear fecha/hora, saltando...")
-                    continue
-                
-                # Agregar a la lista para ordenar después
-                pending_appointments.append({
-                    'row_idx': row_idx,
-                    'registro': registro,
-                    'nombre': nombre,
-                    'telefono': telefono,
-                    'fecha': fecha,
-                    'hora': hora,
-                    'appointment_datetime': appointment_datetime,
-                    'tratamiento': tratamiento,
-                    'doctor': doctor,
-                    'notas': notas,
-                    'estado_cita': estado_cita
-                })
-                
-            except Exception as e:
-                print(f"Error procesando fila {row_idx}: {str(e)}")
-                continue
+        if column_map is None:
+            print('No se encontraron datos en la hoja.')
+            return {
+                "success": True,
+                "patients_synced": 0,
+                "appointments_synced": 0,
+                "inserted": 0,
+                "updated": 0,
+                "unchanged": 0,
+                "deleted": 0
+            }
         
-        # Ordenar citas por fecha y hora
-        pending_appointments.sort(key=lambda x: x['appointment_datetime'])
-        print(f"\n📅 Procesando {len(pending_appointments)} citas ordenadas por fecha y hora...")
+        # Borrar las citas sincronizadas cuya fila ya no existe en la hoja
+        # (las importadas desde archivos no se tocan)
+        deleted = 0
+        delete_skipped = None
+        if source.deletes_missing:
+            progress('deleting')
+            valid_rows = counters['inserted'] + counters['updated'] + counters['unchanged']
+            delete_skipped = delete_guard(column_map, valid_rows)
+            if delete_skipped is None:
+                synced_filter = {"sheet_row_hash": {"$exists": True}, "source": {"$in": [None, source.name]}}
+                missing_filter = {**synced_filter, "registro": {"$nin": list(seen_registros)}}
+                to_delete = await db.appointments.count_documents(missing_filter)
+                if to_delete:
+                    synced = await db.appointments.count_documents(synced_filter)
+                    delete_skipped = delete_guard(column_map, valid_rows, to_delete, synced)
+                if delete_skipped is None and to_delete:
+                    deleted = (await db.appointments.delete_many(missing_filter)).deleted_count
+            if delete_skipped:
+                print(f"⚠️ Borrado de citas desaparecidas cancelado: {delete_skipped}")
         
-        # Ahora procesar las citas ordenadas
-        for apt_data in pending_appointments:
-            try:
-                registro = apt_data['registro']
-                nombre = apt_data['nombre']
-                telefono = apt_data['telefono']
-                appointment_datetime = apt_data['appointment_datetime']
-                tratamiento = apt_data['tratamiento']
-                doctor = apt_data['doctor']
-                notas = apt_data['notas']
-                estado_cita = apt_data['estado_cita']
-                row_idx = apt_data['row_idx']
-                
-                # Buscar si ya existe una cita con este registro (ID único)
-                existing_appointment = await db.appointments.find_one({"registro": registro})
-                
-                if existing_appointment:
-                    print(f"Fila {row_idx}: Cita con registro {registro} ya existe, actualizando...")
-                    
-                    # Separar nombre y apellidos para actualización
-                    nombre_parts = nombre.split(' ', 1)
-                    nombre_solo = nombre_parts[0] if len(nombre_parts) > 0 else nombre
-                    apellidos_solo = nombre_parts[1] if len(nombre_parts) > 1 else ''
-                    
-                    # Actualizar la cita existente con todos los campos
-                    await db.appointments.update_one(
-                        {"registro": registro},
-                        {"$set": {
-                            "patient_name": nombre,
-                            "patient_phone": telefono,
-                            "nombre": nombre_solo,
-                            "apellidos": apellidos_solo,
-                            "fecha": apt_data['fecha'],
-                            "hora": apt_data['hora'],
-                            "tratamiento": tratamiento or "Consulta",
-                            "estado_cita": estado_cita.lower() if estado_cita else "planificada",
-                            "odontologo": doctor or "Dra. Virginia Tresgallo",
-                            "notas": notas,
-                            "tel_movil": telefono,
-                            "title": tratamiento or "Consulta",
-                            "date": appointment_datetime.isoformat(),
-                            "doctor": doctor or "Dra. Virginia Tresgallo",
-                            "status": estado_cita.lower() if estado_cita else "planificada"
-                        }}
-                    )
-                    continue
-                
-                # Buscar o crear paciente
-                patient = await db.patients.find_one({"phone": telefono})
-                
-                if not patient:
-                    patient_id = str(uuid.uuid4())
-                    patient_doc = {
-                        "id": patient_id,
-                        "name": nombre,
-                        "phone": telefono,
-                        "email": "",
-                        "notes": "",
-                        "created_at": datetime.now(timezone.utc).isoformat()
-                    }
-                    await db.patients.insert_one(patient_doc)
-                    patient = patient_doc
-                    patients_synced += 1
-                    print(f"✓ Paciente creado: {nombre}")
-                else:
-                    patient_id = patient['id']
-                
-                # Separar nombre y apellidos
-                nombre_parts = nombre.split(' ', 1)
-                nombre_solo = nombre_parts[0] if len(nombre_parts) > 0 else nombre
-                apellidos_solo = nombre_parts[1] if len(nombre_parts) > 1 else ''
-                
-                # Crear cita con los campos que espera el frontend
-                appointment_doc = {
-                    "id": str(uuid.uuid4()),
-                    "registro": registro,  # ID único del registro de Google Sheets
-                    "patient_id": patient_id,
-                    "patient_name": nombre,  # Mantener para compatibilidad
-                    "patient_phone": telefono,
-                    # Campos que espera el frontend
-                    "nombre": nombre_solo,
-                    "apellidos": apellidos_solo,
-                    "fecha": apt_data['fecha'],  # Fecha original del Google Sheet
-                    "hora": apt_data['hora'],    # Hora original del Google Sheet
-                    "tratamiento": tratamiento or "Consulta",
-                    "estado_cita": estado_cita.lower() if estado_cita else "planificada",
-                    "odontologo": doctor or "Dra. Virginia Tresgallo",
-                    "notas": notas,
-                    "tel_movil": telefono,
-                    # Campos adicionales para compatibilidad con backend
-                    "title": tratamiento or "Consulta",
-                    "date": appointment_datetime.isoformat(),
-                    "duration_minutes": 30,
-                    "status": estado_cita.lower() if estado_cita else "planificada",
-                    "doctor": doctor or "Dra. Virginia Tresgallo",
-                    "reminder_enabled": True,
-                    "reminder_minutes_before": 1440,  # 1 día antes
-                    "reminder_sent": False,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                }
-                
-                await db.appointments.insert_one(appointment_doc)
-                appointments_synced += 1
-                print(f"✓ Cita creada: {nombre} - {apt_data['fecha']} {apt_data['hora']}")
-                
-            except Exception as e:
-                print(f"Error procesando cita de {nombre}: {str(e)}")
-                continue
+        notify_reminder_dispatcher()
         
+        inserted = counters['inserted']
+        write_errors = counters['write_errors']
         print("\n✅ Sincronización completada:")
-        print(f"   - Pacientes nuevos: {patients_synced}")
-        print(f"   - Citas sincronizadas: {appointments_synced}")
+        print(f"   - Filas leídas: {rows_processed}")
+        print(f"   - Pacientes nuevos: {counters['patients']}")
+        print(f"   - Citas nuevas: {inserted}")
+        print(f"   - Citas actualizadas: {counters['updated']}")
+        print(f"   - Citas sin cambios: {counters['unchanged']}")
+        print(f"   - Citas eliminadas: {deleted}")
+        print(f"   - Filas rechazadas: {len(rejected)}")
+        for item in sorted(rejected, key=lambda item: item['row'])[:10]:
+            print(f"     Fila {item['row']}: {item['reason']}")
+        if write_errors:
+            print(f"   - Errores de escritura: {write_errors}")
         
         return {
             "success": True,
-            "patients_synced": patients_synced,
-            "appointments_synced": appointments_synced
+            "source": source.describe(),
+            "rows_read": rows_processed,
+            "patients_synced": counters['patients'],
+            "appointments_synced": inserted,
+            "inserted": inserted,
+            "updated": counters['updated'],
+            "unchanged": counters['unchanged'],
+            "deleted": deleted,
+            "delete_skipped": delete_skipped,
+            "rejected": len(rejected),
+            "rejected_rows": sorted(rejected, key=lambda item: item['row'])[:MAX_REJECTED_REPORTED],
+            "write_errors": write_errors
         }
         
     except Exception as e:
@@ -296,9 +375,19 @@ async def sync_appointments():
             "success": False,
             "error": str(e)
         }
+
+async def main(file_path=None, sheet_name=None):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        source = LocalFileSource(file_path, sheet_name=sheet_name) if file_path else None
+        return await sync_appointments(client[os.environ['DB_NAME']], source=source)
     finally:
         client.close()
 
 if __name__ == "__main__":
-    result = asyncio.run(sync_appointments())
+    parser = argparse.ArgumentParser(description="Sincroniza citas desde Google Sheets o importa un CSV/XLSX")
+    parser.add_argument('--file', help="Ruta de un export .csv o .xlsx a importar en lugar de la hoja")
+    parser.add_argument('--sheet', help="Hoja del XLSX (por defecto la activa)")
+    args = parser.parse_args()
+    result = asyncio.run(main(args.file, args.sheet))
     print(f"\nResultado: {result}")
@@ -11,6 +11,7 @@ system_router = APIRouter()
 
 # Importar la conexión a la base de datos
 from server import db
+from db_indexes import ensure_indexes, report_indexes
 
 # ==================== MODELOS ====================
 
@@ -46,6 +47,22 @@ async def database_status():
     except Exception:
         return {"connected": False}
 
+@system_router.get("/database/indexes")
+async def database_indexes():
+    """Índices declarados que faltan, no se usan o no están declarados"""
+    try:
+        return await report_indexes(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@system_router.post("/database/indexes")
+async def rebuild_database_indexes():
+    """Crear los índices que falten sin reiniciar el servidor"""
+    try:
+        return await ensure_indexes(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @system_router.post("/system/restart/{service}")
 async def restart_service(service: str):
     """Reiniciar un servicio (simulado)"""
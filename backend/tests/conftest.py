@@ -0,0 +1,15 @@
+"""
+Unit tests for the backend's pure helpers
+Backend modules import each other by bare name (as server.py does), so the
+backend directory goes on sys.path.
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Algunos módulos leen la configuración de Mongo al importarse
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
@@ -0,0 +1,44 @@
+from contact_cache import ContactCache
+
+CONTACT = {'id': 'c1', 'phone': '34600000001', 'name': 'Ana', 'email': 'ana@example.com'}
+CONVERSATION = {'id': 'v1', 'contact_id': 'c1', 'contact_name': 'Ana', 'contact_phone': '34600000001', 'unread_count': 3}
+
+
+def test_put_keeps_identity_fields_only():
+    cache = ContactCache()
+    cache.put(CONTACT, CONVERSATION)
+
+    cached = cache.get_by_phone('34600000001')
+    assert cached['contact'] == {'id': 'c1', 'phone': '34600000001', 'name': 'Ana'}
+    assert 'unread_count' not in cached['conversation']
+    assert cache.get_conversation('v1')['contact_id'] == 'c1'
+
+
+def test_invalidate_phone_drops_both_entries():
+    cache = ContactCache()
+    cache.put(CONTACT, CONVERSATION)
+    cache.invalidate_phone('34600000001')
+
+    assert cache.get_by_phone('34600000001') is None
+    assert cache.get_conversation('v1') is None
+
+
+def test_invalidate_conversation_drops_phone_entry():
+    cache = ContactCache()
+    cache.put(CONTACT, CONVERSATION)
+    cache.invalidate_conversation('v1')
+
+    assert cache.get_by_phone('34600000001') is None
+    assert cache.get_stats()['invalidations'] == 2
+
+
+def test_lru_eviction_and_ttl():
+    cache = ContactCache(max_entries=2)
+    cache.put(CONTACT, CONVERSATION)
+    cache.put_conversation({**CONVERSATION, 'id': 'v2'})
+    assert cache.get_by_phone('34600000001') is None
+    assert cache.get_stats()['evictions'] == 1
+
+    expired = ContactCache(ttl=-1)
+    expired.put(CONTACT, CONVERSATION)
+    assert expired.get_conversation('v1') is None
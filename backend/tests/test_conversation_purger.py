@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+import conversation_purger
+from conversation_purger import MAX_ATTEMPTS, MAX_SLEEP_SECONDS, RETRY_BASE_SECONDS, ConversationPurger, retry_delay
+
+
+class FailingCollection:
+    def find(self, *args, **kwargs):
+        raise RuntimeError('mongo unavailable')
+
+
+class FakeJobs:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(matched_count=1)
+
+
+class FakeDb(dict):
+    def __init__(self):
+        super().__init__(messages=FailingCollection(), button_responses=FailingCollection())
+        self.purge_jobs = FakeJobs()
+
+
+def _job(attempts):
+    return {'id': 'job-1', 'conversation_id': 'conv-1', 'attempts': attempts, 'deleted': {}}
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert retry_delay(1) == timedelta(seconds=RETRY_BASE_SECONDS)
+    assert retry_delay(2) == timedelta(seconds=RETRY_BASE_SECONDS * 2)
+    assert retry_delay(50) == timedelta(seconds=MAX_SLEEP_SECONDS)
+
+
+def test_failed_attempt_goes_back_to_pending_with_backoff(monkeypatch):
+    monkeypatch.setattr(conversation_purger.event_bus, 'publish', lambda *args, **kwargs: None)
+    db = FakeDb()
+    before = datetime.now(timezone.utc)
+    asyncio.run(ConversationPurger(db).purge(_job(attempts=1)))
+
+    _, update = db.purge_jobs.updates[-1]
+    assert update['$set']['status'] == 'pending'
+    assert update['$set']['next_attempt_at'] >= before + retry_delay(1)
+    assert update['$set']['error'] == 'mongo unavailable'
+
+
+def test_job_fails_for_good_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(conversation_purger.event_bus, 'publish', lambda *args, **kwargs: None)
+    db = FakeDb()
+    asyncio.run(ConversationPurger(db).purge(_job(attempts=MAX_ATTEMPTS)))
+    assert db.purge_jobs.updates[-1][1]['$set']['status'] == 'failed'
+
+    # Reclamado de nuevo tras vencer el lease demasiadas veces: falla sin reintentar
+    db = FakeDb()
+    asyncio.run(ConversationPurger(db).purge(_job(attempts=MAX_ATTEMPTS + 1)))
+    assert [update['$set']['status'] for _, update in db.purge_jobs.updates] == ['failed']
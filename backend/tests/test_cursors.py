@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from server import decode_cursor, encode_cursor, parse_date_param
+
+
+def test_cursor_round_trip():
+    value = datetime(2025, 3, 1, 9, 30, tzinfo=timezone.utc)
+    raw_value, last_id = decode_cursor(encode_cursor(value, 'abc'), 'after')
+    assert last_id == 'abc'
+    assert parse_date_param(raw_value, 'after') == value
+
+
+def test_encode_cursor_accepts_unmigrated_iso_strings():
+    assert encode_cursor('2025-03-01T09:30:00Z', 'abc') == '2025-03-01T09:30:00+00:00,abc'
+
+
+def test_decode_cursor_restores_unencoded_plus_sign():
+    assert decode_cursor('2025-03-01T09:30:00 00:00,abc', 'before') == ('2025-03-01T09:30:00+00:00', 'abc')
+
+
+@pytest.mark.parametrize('cursor', ['abc', ',abc', '2025-03-01,'])
+def test_decode_cursor_rejects_malformed(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 'before')
+    assert error.value.status_code == 400
@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import dashboard
+from dashboard import DashboardSummaryCache
+
+DAY = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+def _fake_builder(builds):
+    async def build(db, window_start, window_end):
+        builds.append((window_start, window_end))
+        await asyncio.sleep(0.01)
+        return {'window': {'from': window_start, 'to': window_end}, 'build': len(builds)}
+    return build
+
+
+def test_concurrent_misses_share_one_build(monkeypatch):
+    builds = []
+    monkeypatch.setattr(dashboard, 'build_dashboard_summary', _fake_builder(builds))
+    cache = DashboardSummaryCache(ttl=60)
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get(None, DAY, DAY + timedelta(days=1)) for _ in range(5)])
+
+    summaries = asyncio.run(scenario())
+    assert len(builds) == 1
+    assert all(summary is summaries[0] for summary in summaries)
+    assert cache.get_stats()['misses'] == 1 and cache.get_stats()['hits'] == 4
+
+
+def test_expired_entries_and_invalidate_rebuild(monkeypatch):
+    builds = []
+    monkeypatch.setattr(dashboard, 'build_dashboard_summary', _fake_builder(builds))
+
+    async def scenario():
+        expired = DashboardSummaryCache(ttl=-1)
+        await expired.get(None, DAY, DAY + timedelta(days=1))
+        await expired.get(None, DAY, DAY + timedelta(days=1))
+
+        cache = DashboardSummaryCache(ttl=60)
+        await cache.get(None, DAY, DAY + timedelta(days=1))
+        cache.invalidate()
+        await cache.get(None, DAY, DAY + timedelta(days=1))
+        # Otra ventana es otra entrada
+        await cache.get(None, DAY + timedelta(days=1), DAY + timedelta(days=2))
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert len(builds) == 5
+    assert cache.get_stats()['entries'] == 2
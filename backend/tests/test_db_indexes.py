@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from db_indexes import REBUILD_SUFFIX, _find_index, _index_matches, _rebuild_index
+
+SPEC = {'name': 'phone', 'keys': [('phone', ASCENDING)], 'options': {'unique': True}}
+
+
+class FakeCollection:
+    """Records index operations; create_index fails for the names in fail_names"""
+
+    def __init__(self, fail_names=()):
+        self.fail_names = set(fail_names)
+        self.calls = []
+
+    async def create_index(self, keys, name, **options):
+        self.calls.append(('create', name, options))
+        if name in self.fail_names:
+            self.fail_names.discard(name)
+            raise OperationFailure('Index build failed', code=85)
+
+    async def drop_index(self, name):
+        self.calls.append(('drop', name))
+
+
+def test_index_matches_compares_keys_and_options():
+    assert _index_matches({'name': 'phone', 'key': {'phone': 1}, 'unique': True}, SPEC)
+    assert not _index_matches({'name': 'phone', 'key': {'phone': 1}}, SPEC)
+    assert not _index_matches({'name': 'phone', 'key': {'phone': -1}, 'unique': True}, SPEC)
+    assert _index_matches(
+        {'name': 'updated_at', 'key': {'updated_at': -1}, 'unique': False},
+        {'name': 'updated_at', 'keys': [('updated_at', DESCENDING)], 'options': {}},
+    )
+
+
+def test_find_index_accepts_the_alternate_name():
+    alternate = {'name': f'phone{REBUILD_SUFFIX}', 'key': {'phone': 1}}
+    assert _find_index({alternate['name']: alternate}, 'phone') is alternate
+    assert _find_index({}, 'phone') is None
+
+
+def test_rebuild_builds_new_index_before_dropping_old():
+    collection = FakeCollection()
+    asyncio.run(_rebuild_index(collection, {'name': 'phone', 'key': {'phone': 1}}, SPEC))
+    assert collection.calls == [
+        ('create', f'phone{REBUILD_SUFFIX}', {'unique': True}),
+        ('drop', 'phone'),
+    ]
+
+
+def test_rebuild_restores_old_index_when_new_one_fails():
+    current = {'name': 'phone', 'key': {'phone': 1}, 'unique': True}
+    spec = {'name': 'phone', 'keys': [('phone', ASCENDING)], 'options': {'unique': True, 'sparse': True}}
+    collection = FakeCollection(fail_names=[f'phone{REBUILD_SUFFIX}', 'phone'])
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(_rebuild_index(collection, current, spec))
+
+    assert collection.calls[-2:] == [
+        ('create', 'phone', {'unique': True, 'sparse': True}),
+        ('create', 'phone', {'unique': True}),
+    ]
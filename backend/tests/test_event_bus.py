@@ -0,0 +1,68 @@
+import asyncio
+
+from event_bus import EventBus, format_sse
+
+
+def test_replay_returns_events_after_last_id():
+    bus = EventBus(replay_size=10)
+    first = bus.publish('message.created', {'id': 'm1'})
+    bus.publish('message.created', {'id': 'm2'})
+    bus.publish('message.created', {'id': 'm3'})
+    assert [event['data']['id'] for event in bus._replay(first['id'])] == ['m2', 'm3']
+
+
+def test_replay_asks_for_resync_after_restart_or_expiry():
+    bus = EventBus(replay_size=2)
+    first = bus.publish('a')
+    bus.publish('b')
+    bus.publish('c')
+    # 'b' y 'c' siguen en el buffer: nada se perdió
+    assert [event['type'] for event in bus._replay(first['id'])] == ['b', 'c']
+    bus.publish('d')
+    # 'b' ya salió del buffer
+    assert bus._replay(first['id'])[0]['data'] == {'reason': 'expired'}
+    assert bus._replay('otroboot-1')[0]['data'] == {'reason': 'restart'}
+    assert bus._replay(f"{first['id'].split('-')[0]}-x")[0]['type'] == 'resync'
+
+
+def test_slow_subscriber_gets_a_single_resync_on_overflow():
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        stream = bus.subscribe()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        bus.publish('a')
+        first = await pending
+        for name in ('b', 'c', 'd'):
+            bus.publish(name)
+        second = await stream.__anext__()
+        await stream.aclose()
+        return bus, first, second
+
+    bus, first, second = asyncio.run(scenario())
+    assert first['type'] == 'a'
+    assert second['type'] == 'resync' and second['data'] == {'reason': 'overflow'}
+    assert bus.get_stats()['resyncs'] == 1
+    assert bus.subscriber_count == 0
+
+
+def test_subscribe_replays_then_skips_duplicates():
+    async def scenario():
+        bus = EventBus()
+        first = bus.publish('a')
+        bus.publish('b')
+        stream = bus.subscribe(last_event_id=first['id'])
+        replayed = await stream.__anext__()
+        bus.publish('c')
+        live = await stream.__anext__()
+        await stream.aclose()
+        return replayed, live
+
+    replayed, live = asyncio.run(scenario())
+    assert (replayed['type'], live['type']) == ('b', 'c')
+
+
+def test_format_sse():
+    assert format_sse(None) == ": ping\n\n"
+    event = EventBus().publish('sync.finished', {'ok': True})
+    assert format_sse(event).startswith(f"id: {event['id']}\ndata: {{\"type\": \"sync.finished\"")
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from google_sheets_service import APPOINTMENT_COLUMNS, GoogleSheetsService
+from sheet_snapshot import SheetSnapshot, values_digest
+
+
+def _row(registro, start: datetime):
+    row = {column: '' for column in APPOINTMENT_COLUMNS}
+    row.update(registro=registro, fecha=start.strftime('%d/%m/%Y'), hora=start.strftime('%H:%M'))
+    return [row[column] for column in APPOINTMENT_COLUMNS]
+
+
+def _snapshot(rows):
+    values = [APPOINTMENT_COLUMNS] + rows
+    return SheetSnapshot(values, values_digest(values))
+
+
+def test_rows_between_is_inclusive_and_date_ordered():
+    day = datetime(2025, 3, 10, 10, 0)
+    snapshot = _snapshot([_row('C', day + timedelta(days=2)), _row('A', day), _row('B', day + timedelta(days=1))])
+    rows = snapshot.rows_between(day.date(), (day + timedelta(days=1)).date())
+    assert [row[0] for row in rows] == ['A', 'B']
+
+
+def test_upcoming_appointments_cover_now_through_seven_days():
+    now = datetime.now()
+    snapshot = _snapshot([
+        _row('past', now - timedelta(hours=2)),
+        _row('soon', now + timedelta(hours=2)),
+        _row('in_week', now + timedelta(days=6)),
+        _row('too_late', now + timedelta(days=7, hours=2)),
+    ])
+    service = GoogleSheetsService()
+
+    async def get_snapshot():
+        return snapshot
+
+    service._get_snapshot = get_snapshot
+    registros = [appointment['registro'] for appointment in asyncio.run(service.get_upcoming_appointments())]
+    assert 'past' not in registros and 'too_late' not in registros
+    assert {'soon', 'in_week'} <= set(registros)
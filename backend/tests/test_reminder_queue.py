@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from reminder_queue import (
+    BATCH_SIZE, CONCURRENCY, LEASE, LEASE_BUDGET, MAX_ATTEMPTS, RATE_PER_SECOND, SEND_TIMEOUT_SECONDS,
+    compute_reminder_due_at, lease_batch_size, merge_updates, reminder_due_update,
+)
+
+
+def _appointment(**fields):
+    return {
+        'reminder_enabled': True, 'reminder_sent': False, 'status': 'confirmada',
+        'date': datetime.now(timezone.utc) + timedelta(days=1), 'reminder_minutes_before': 60, **fields
+    }
+
+
+def test_due_at_is_date_minus_minutes_before():
+    appointment = _appointment()
+    assert compute_reminder_due_at(appointment) == appointment['date'] - timedelta(minutes=60)
+
+
+def test_due_at_accepts_iso_strings():
+    appointment = _appointment(date='2099-01-01T10:00:00Z', reminder_minutes_before=30)
+    assert compute_reminder_due_at(appointment) == datetime(2099, 1, 1, 9, 30, tzinfo=timezone.utc)
+
+
+def test_no_due_at_when_not_pending():
+    assert compute_reminder_due_at(_appointment(reminder_enabled=False)) is None
+    assert compute_reminder_due_at(_appointment(reminder_sent=True)) is None
+    assert compute_reminder_due_at(_appointment(status='cancelada')) is None
+    assert compute_reminder_due_at(_appointment(date=datetime.now(timezone.utc) - timedelta(hours=1))) is None
+
+
+def test_reminder_due_update_and_merge():
+    assert reminder_due_update(_appointment(reminder_sent=True)) == {'$unset': {'reminder_due_at': ''}}
+    merged = merge_updates({'$set': {'status': 'cancelada'}}, reminder_due_update(_appointment(status='cancelada')))
+    assert merged == {'$set': {'status': 'cancelada'}, '$unset': {'reminder_due_at': ''}}
+
+
+def test_dropped_reminders_are_not_requeued():
+    for dropped in (_appointment(reminder_lease_expired=True), _appointment(reminder_attempts=MAX_ATTEMPTS)):
+        assert compute_reminder_due_at(dropped) is None
+        # Una edición posterior de la cita no debe volver a encolarlo
+        update = reminder_due_update({**dropped, 'reminder_minutes_before': 30})
+        assert update == {'$unset': {'reminder_due_at': ''}}
+    assert compute_reminder_due_at(_appointment(reminder_attempts=MAX_ATTEMPTS - 1)) is not None
+
+
+def test_default_batch_fits_the_lease():
+    size = lease_batch_size(BATCH_SIZE, CONCURRENCY, RATE_PER_SECOND, LEASE.total_seconds(), SEND_TIMEOUT_SECONDS)
+    assert size == BATCH_SIZE
+    worst_case = -(-size // CONCURRENCY) * SEND_TIMEOUT_SECONDS + size / RATE_PER_SECOND
+    assert worst_case <= LEASE.total_seconds() * LEASE_BUDGET
+
+
+def test_lease_batch_size_shrinks_oversized_batches():
+    # 100 recordatorios, 5 envíos a la vez y 30s de timeout: ~600s, más que el lease de 300s
+    assert lease_batch_size(100, 5, 0, 300, 30) == 40
+    assert lease_batch_size(100, 1, 0, 10, 30) == 1
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.updates = []
+
+    async def find_one(self, query, *args):
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in query.items())), None)
+
+    async def update_one(self, query, update):
+        self.updates.append((query, update))
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+
+class FakeDB:
+    def __init__(self, **collections):
+        self.collections = collections
+
+    def __getattr__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+def test_button_cancellation_leaves_the_reminder_queue():
+    from functions.handle_whatsapp_response import handle_whatsapp_response
+    button = {'id': 'b1', 'text': 'Cancelar', 'actions': [
+        {'type': 'update_appointment_status', 'status': 'cancelada', 'appointment_id': 'apt1'}
+    ]}
+    appointments = FakeCollection([_appointment(id='apt1', reminder_due_at=datetime.now(timezone.utc))])
+    db = FakeDB(messages=FakeCollection([{'id': 'm1', 'buttons': [button]}]), appointments=appointments)
+    asyncio.run(handle_whatsapp_response(db, 'http://wa', {'button_id': 'b1', 'conversation_id': 'c1', 'message_id': 'm1'}))
+    (query, update), = appointments.updates
+    assert query == {'id': 'apt1'}
+    assert update['$set']['status'] == 'cancelada'
+    assert update['$unset'] == {'reminder_due_at': ''}
@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+
+from functions.contact_upserts import contact_update
+from search import normalize_name, normalize_phone, phone_query, search_messages
+
+
+def test_normalize_name_strips_accents_case_and_spaces():
+    assert normalize_name('  María   JOSÉ Núñez ') == 'maria jose nunez'
+    assert normalize_name(None) == ''
+
+
+def test_phone_query_only_for_phone_like_input():
+    assert normalize_phone('+34 612-345-678') == '34612345678'
+    assert phone_query('(612) 345') == '612345'
+    assert phone_query('12') is None
+    assert phone_query('María 612') is None
+
+
+def test_contact_update_keeps_name_lower_in_sync():
+    inserted = contact_update('34600000001', name='Ángela')
+    assert inserted['$setOnInsert']['name_lower'] == 'angela'
+
+    renamed = contact_update('34600000001', set_fields={'name': 'Óscar'})
+    assert renamed['$set']['name_lower'] == 'oscar'
+    assert 'name_lower' not in renamed['$setOnInsert']
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def skip(self, offset):
+        return self
+
+    def limit(self, limit):
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+
+class FakeMessages:
+    def __init__(self, docs):
+        self.docs = docs
+        self.filters = None
+
+    def find(self, filters, projection):
+        self.filters = filters
+        excluded = filters.get('conversation_id', {}).get('$nin', [])
+        return FakeCursor([doc for doc in self.docs if doc['conversation_id'] not in excluded])
+
+
+class FakeConversations:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def find(self, filters, projection):
+        return FakeCursor([{'id': id} for id in filters['id']['$in'] if id in self.ids])
+
+
+class FakePurgeJobs:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    async def distinct(self, field, filters):
+        return [job[field] for job in self.jobs if job['status'] != filters['status']['$ne']]
+
+
+def test_search_messages_skips_deleted_conversations():
+    db = SimpleNamespace(
+        messages=FakeMessages([
+            {'id': 'm1', 'conversation_id': 'live'},
+            {'id': 'm2', 'conversation_id': 'purging'},
+            {'id': 'm3', 'conversation_id': 'orphan'},
+        ]),
+        conversations=FakeConversations({'live', 'purging'}),
+        purge_jobs=FakePurgeJobs([
+            {'conversation_id': 'purging', 'status': 'running'},
+            {'conversation_id': 'live-before', 'status': 'done'},
+        ]),
+    )
+    page = asyncio.run(search_messages(db, 'hola'))
+    assert db.messages.filters['conversation_id'] == {'$nin': ['purging']}
+    assert [item['id'] for item in page['items']] == ['m1']
@@ -0,0 +1,41 @@
+from datetime import date, datetime, time
+
+from sheet_parsing import (
+    DATE_FORMATS, detect_format, parse_date_column, parse_datetime_columns, parse_sheet_datetime, parse_time_column,
+)
+
+
+def test_detect_format_uses_the_majority_of_the_sample():
+    assert detect_format(['01/02/2025', '15/03/2025', '2025-04-01'], DATE_FORMATS) == 'dd/mm/yyyy'
+    assert detect_format(['', '  '], DATE_FORMATS) is None
+
+
+def test_parse_date_column_mixed_formats_and_errors():
+    parsed, detected, errors = parse_date_column(['01/02/2025', '2025-03-04', '31/02/2025', '', 'mañana', '1/2/25'])
+    assert detected == 'dd/mm/yyyy'
+    assert parsed[:2] == [date(2025, 2, 1), date(2025, 3, 4)]
+    assert parsed[5] == date(2025, 2, 1)
+    assert set(errors) == {2, 3, 4}
+    assert errors[3] == 'vacío'
+    assert 'no es válido' in errors[2]
+    assert 'formato no reconocido' in errors[4]
+
+
+def test_parse_time_column_handles_seconds_and_meridiem():
+    parsed, _, errors = parse_time_column(['9:30', '10:15:20', '3:05 PM', '12:00 am', '13:00 PM'])
+    assert parsed[:4] == [time(9, 30), time(10, 15, 20), time(15, 5), time(0, 0)]
+    assert parsed[4] is None and 4 in errors
+
+
+def test_parse_datetime_columns_reports_rejected_rows():
+    datetimes, rejected = parse_datetime_columns(['01/02/2025', '', '03/02/2025'], ['10:00', '11:00', 'tarde'], [2, 3, 4])
+    assert datetimes == [datetime(2025, 2, 1, 10, 0), None, None]
+    assert rejected == [
+        {'row': 3, 'reason': 'fecha vacío'},
+        {'row': 4, 'reason': "hora formato no reconocido: 'tarde'"},
+    ]
+
+
+def test_parse_sheet_datetime_single_row():
+    assert parse_sheet_datetime('2025-02-01', '08:45') == datetime(2025, 2, 1, 8, 45)
+    assert parse_sheet_datetime('2025-02-30', '08:45') is None
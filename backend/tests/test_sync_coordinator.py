@@ -0,0 +1,55 @@
+import asyncio
+
+import sync_coordinator
+from sync_coordinator import SyncCoordinator
+
+
+class FakeSource:
+    def describe(self):
+        return 'CSV citas.csv'
+
+
+def test_import_never_overlaps_a_sync(monkeypatch):
+    calls = []
+    active = []
+
+    async def fake_sync(db, source=None, progress=None):
+        kind = 'import' if source else 'sync'
+        assert not active, f"{kind} started while {active[0]} was running"
+        active.append(kind)
+        calls.append(kind)
+        await asyncio.sleep(0.01)
+        active.pop()
+        return {'success': True, 'kind': kind}
+
+    monkeypatch.setattr(sync_coordinator, 'sync_appointments', fake_sync)
+
+    async def scenario():
+        coordinator = SyncCoordinator(db=None)
+        sync = asyncio.create_task(coordinator.run('manual'))
+        await asyncio.sleep(0)
+        imported = asyncio.create_task(coordinator.run_import(FakeSource()))
+        while coordinator.get_status()['trigger'] != 'import':
+            await asyncio.sleep(0.001)
+        # Una sincronización pedida durante la importación no se une a ella
+        later_sync = asyncio.create_task(coordinator.run('scheduled'))
+        results = await asyncio.gather(sync, imported, later_sync)
+        return coordinator, results
+
+    coordinator, results = asyncio.run(scenario())
+    assert [result['kind'] for result in results] == ['sync', 'import', 'sync']
+    assert calls == ['sync', 'import', 'sync']
+    assert coordinator.get_status()['runs'] == 3
+
+
+def test_import_shows_in_status(monkeypatch):
+    async def fake_sync(db, source=None, progress=None):
+        return {'success': True}
+
+    monkeypatch.setattr(sync_coordinator, 'sync_appointments', fake_sync)
+    coordinator = SyncCoordinator(db=None)
+    asyncio.run(coordinator.run_import(FakeSource()))
+    status = coordinator.get_status()
+    assert status['trigger'] == 'import'
+    assert status['source'] == 'CSV citas.csv'
+    assert status['phase'] == 'done'
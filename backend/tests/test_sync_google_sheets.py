@@ -0,0 +1,78 @@
+import asyncio
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError
+
+from sync_google_sheets import delete_guard, extract_rows, flush_operations, row_hash
+
+HEADERS = ['Registro', 'Apellidos', 'Nombre', 'TelMovil', 'Fecha', 'Hora', 'Tratamiento']
+COLUMN_MAP = {header.lower(): i for i, header in enumerate(HEADERS)}
+
+
+def _row(registro, fecha='01/02/2025', hora='10:30'):
+    return [registro, 'García', 'Ana', '612345678', fecha, hora, 'Limpieza']
+
+
+def test_delete_guard_requires_registro_column():
+    column_map = {header: i for header, i in COLUMN_MAP.items() if header != 'registro'}
+    assert delete_guard(column_map, valid_rows=50) is not None
+
+
+def test_delete_guard_requires_valid_rows():
+    # Hoja con solo la fila de encabezados, o con todas las filas rechazadas
+    assert delete_guard(COLUMN_MAP, valid_rows=0) is not None
+
+
+def test_delete_guard_caps_delete_ratio():
+    assert delete_guard(COLUMN_MAP, valid_rows=100, to_delete=60, synced=100, max_ratio=0.2, always_allowed=10)
+    assert delete_guard(COLUMN_MAP, valid_rows=100, to_delete=15, synced=100, max_ratio=0.2, always_allowed=10) is None
+
+
+def test_delete_guard_always_allows_small_deletes():
+    assert delete_guard(COLUMN_MAP, valid_rows=3, to_delete=2, synced=5, max_ratio=0.2, always_allowed=10) is None
+
+
+def test_extract_rows_keeps_valid_rows_and_rejects_incomplete():
+    seen, rejected = set(), []
+    rows = extract_rows(COLUMN_MAP, [_row('R1'), _row('R2', fecha='')], 2, seen, rejected)
+
+    assert list(rows) == ['R1']
+    assert rows['R1']['nombre'] == 'Ana García'
+    assert rows['R1']['row_idx'] == 2
+    assert rejected == [{'row': 3, 'reason': 'faltan campos: fecha'}]
+    # Una fila incompleta sigue "vista": su cita no se borra mientras siga en la hoja
+    assert seen == {'R1', 'R2'}
+
+
+def test_extract_rows_last_duplicate_wins():
+    rows = extract_rows(COLUMN_MAP, [_row('R1', hora='10:00'), _row('R1', hora='11:00')], 2, set(), [])
+    assert rows['R1']['hora'] == '11:00'
+
+
+def test_row_hash_changes_with_hashed_fields_only():
+    row = extract_rows(COLUMN_MAP, [_row('R1')], 2, set(), [])['R1']
+    assert row_hash(row) == row_hash({**row, 'row_idx': 99})
+    assert row_hash(row) != row_hash({**row, 'hora': '12:00'})
+
+
+class FakeBulkCollection:
+    name = 'appointments'
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    async def bulk_write(self, operations, ordered=True):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_flush_operations_counts_what_was_written():
+    collection = FakeBulkCollection([
+        SimpleNamespace(upserted_count=2, modified_count=1),
+        # Un lote con un error: lo demás sí se escribió
+        BulkWriteError({'nUpserted': 1, 'nModified': 0, 'writeErrors': [{'index': 0, 'errmsg': 'dup'}]}),
+    ])
+    totals = asyncio.run(flush_operations(collection, list(range(5)), 3))
+    assert totals == {'upserted': 3, 'modified': 1, 'errors': 1}
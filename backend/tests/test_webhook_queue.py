@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+
+import webhook_queue
+from webhook_queue import WebhookQueue, event_sender
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeEvents:
+    """webhook_events collection that returns the given pending documents"""
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.updates = []
+
+    def find(self, query, projection=None):
+        return FakeCursor([doc for doc in self.pending if doc['received_at'] < query['received_at']['$lt']])
+
+    async def update_many(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=2)
+
+
+def _event(event_id, sender, age_seconds):
+    return {
+        'id': event_id, 'sender': sender, 'payload': {'from': f'{sender}@s.whatsapp.net'}, 'status': 'pending',
+        'attempts': 0, 'received_at': datetime.now(timezone.utc) - timedelta(seconds=age_seconds),
+    }
+
+
+def test_event_sender_strips_the_whatsapp_suffix():
+    assert event_sender({'from': '34600000001@s.whatsapp.net'}) == '34600000001'
+    assert event_sender({}) == ''
+
+
+def test_recover_only_resets_expired_leases():
+    async def scenario():
+        events = FakeEvents([])
+        queue = WebhookQueue(SimpleNamespace(webhook_events=events), workers=2)
+        assert await queue.recover() == 2
+        query, update = events.updates[0]
+        assert query['status'] == 'processing' and '$lt' in query['lease_until']
+        assert update['$set'] == {'status': 'pending'}
+        # Nada se encola directamente: lo hace el sondeo
+        assert sum(q.qsize() for q in queue._queues) == 0
+
+    asyncio.run(scenario())
+
+
+def test_poll_pending_skips_recent_and_already_queued_events():
+    async def scenario():
+        held = _event('held', '346', 300)
+        events = FakeEvents([held, _event('old', '347', 300), _event('fresh', '348', 1)])
+        queue = WebhookQueue(SimpleNamespace(webhook_events=events), workers=2)
+        queue._put(held)
+
+        assert await queue.poll_pending() == 1
+        queued = []
+        for q in queue._queues:
+            while not q.empty():
+                queued.append(q.get_nowait()['id'])
+        assert sorted(queued) == ['held', 'old']
+
+    asyncio.run(scenario())
+
+
+class ClaimingEvents(FakeEvents):
+    """Claims every event for the worker and records the final updates"""
+
+    def __init__(self):
+        super().__init__([])
+        self.finished = {}
+
+    async def update_many(self, query, update):
+        if update['$set'].get('status') in ('done', 'failed'):
+            for event_id in query['id']['$in']:
+                self.finished[event_id] = update['$set']['status']
+        return SimpleNamespace(modified_count=0)
+
+    def find(self, query, projection=None):
+        return FakeCursor([{'id': event_id} for event_id in query['id']['$in']])
+
+
+def test_one_bad_event_does_not_fail_other_senders(monkeypatch):
+    async def fake_batch(db, payloads):
+        if any(payload.get('timestamp') == 'ayer' for payload in payloads):
+            raise ValueError("could not convert string to float: 'ayer'")
+        return {'success': True}
+
+    monkeypatch.setattr(webhook_queue, 'handle_whatsapp_incoming_batch', fake_batch)
+    monkeypatch.setattr(webhook_queue, 'RETRY_DELAY_SECONDS', 0)
+
+    events = [_event('a1', '346', 0), _event('b1', '347', 0), _event('b2', '347', 0), _event('a2', '346', 0)]
+    events[2]['payload']['timestamp'] = 'ayer'
+
+    async def scenario():
+        collection = ClaimingEvents()
+        queue = WebhookQueue(SimpleNamespace(webhook_events=collection), workers=1)
+        await queue._process(events)
+        return collection.finished
+
+    assert asyncio.run(scenario()) == {'a1': 'done', 'a2': 'done', 'b1': 'done', 'b2': 'failed'}
+
+
+def test_poll_pending_is_capped():
+    async def scenario():
+        events = FakeEvents([_event(f'e{i}', str(i), 300) for i in range(10)])
+        queue = WebhookQueue(SimpleNamespace(webhook_events=events), workers=2)
+        queue.poll_limit = 4
+        return await queue.poll_pending()
+
+    assert asyncio.run(scenario()) == 4
@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+import whatsapp_client
+from whatsapp_client import OTHER_ENDPOINT, WhatsAppServiceClient, endpoint_template
+
+
+def test_endpoint_template_groups_variable_segments():
+    assert endpoint_template('POST', '/send-message') == 'POST /send-message'
+    assert endpoint_template('GET', 'http://localhost:3001/chats/34600000001/messages') == 'GET /chats/{id}/messages'
+    assert endpoint_template('GET', '/chats/34600000001@s.whatsapp.net') == 'GET /chats/{id}'
+    assert endpoint_template('GET', '/media/3f2b8c1e-0d4a-4c5b-9e1f-2a3b4c5d6e7f?thumb=1') == 'GET /media/{id}'
+
+
+def test_endpoint_metrics_are_capped(monkeypatch):
+    monkeypatch.setattr(whatsapp_client, 'MAX_METRIC_ENDPOINTS', 2)
+    transport = httpx.MockTransport(lambda request: httpx.Response(200))
+
+    async def scenario():
+        client = WhatsAppServiceClient('http://whatsapp.test')
+        client._client = httpx.AsyncClient(base_url=client.base_url, transport=transport)
+        for path in ('/status', '/qr', '/logout', '/restart', '/status'):
+            await client.get(path)
+        await client.close()
+        return client.get_metrics()['by_endpoint']
+
+    by_endpoint = asyncio.run(scenario())
+    assert set(by_endpoint) == {'GET /status', 'GET /qr', OTHER_ENDPOINT}
+    assert by_endpoint['GET /status']['requests'] == 2
+    assert by_endpoint[OTHER_ENDPOINT]['requests'] == 2
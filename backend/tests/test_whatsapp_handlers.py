@@ -0,0 +1,28 @@
+from datetime import datetime, timezone, timedelta
+
+from functions.whatsapp_handlers import COUNTED_IDS_KEPT, conversation_counter_update
+
+NOW = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _message(message_id, minutes_ago, text='hola'):
+    return {'id': message_id, 'text': text, 'timestamp': NOW - timedelta(minutes=minutes_ago)}
+
+
+def test_counter_update_only_counts_unseen_message_ids():
+    pipeline = conversation_counter_update([_message('m1', 2), _message('m2', 1)], NOW)
+    new_ids = pipeline[0]['$set']['_new_ids']['$setDifference']
+    assert new_ids[0] == {'$literal': ['m1', 'm2']}
+    assert new_ids[1] == {'$ifNull': ['$counted_message_ids', []]}
+
+    fields = pipeline[1]['$set']
+    assert fields['unread_count'] == {'$add': [{'$ifNull': ['$unread_count', 0]}, {'$size': '$_new_ids'}]}
+    assert fields['counted_message_ids']['$slice'][1] == -COUNTED_IDS_KEPT
+    assert pipeline[2] == {'$unset': '_new_ids'}
+
+
+def test_counter_update_uses_latest_message_as_literal():
+    pipeline = conversation_counter_update([_message('m1', 1, text='$100 pagados'), _message('m2', 5)], NOW)
+    fields = pipeline[1]['$set']
+    assert fields['last_message']['$cond'][1] == {'$literal': '$100 pagados'}
+    assert fields['last_message_at']['$cond'][1] == NOW - timedelta(minutes=1)
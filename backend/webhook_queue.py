@@ -0,0 +1,291 @@
+"""
+Webhook Ingestion Queue
+Incoming WhatsApp events are persisted and acknowledged at once, then processed
+in the background by sharded workers so each sender's messages keep their order
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+import zlib
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional, Set
+
+from functions.whatsapp_handlers import handle_whatsapp_incoming_batch
+
+logger = logging.getLogger(__name__)
+
+# Workers en paralelo; los eventos de un mismo remitente van siempre al mismo
+WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+# Eventos que un worker procesa juntos (contactos, conversaciones y mensajes en bloque)
+BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 100))
+MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 3))
+RETRY_DELAY_SECONDS = float(os.environ.get('WEBHOOK_RETRY_DELAY_SECONDS', 2))
+# Un evento en 'processing' con el lease vencido se considera abandonado
+LEASE = timedelta(seconds=int(os.environ.get('WEBHOOK_LEASE_SECONDS', 300)))
+# Cada cuánto se buscan en MongoDB eventos pendientes que ningún worker tiene en cola
+POLL_SECONDS = float(os.environ.get('WEBHOOK_POLL_SECONDS', 30))
+# Un evento pendiente más reciente lo está procesando el proceso que lo recibió
+PENDING_GRACE = timedelta(seconds=int(os.environ.get('WEBHOOK_PENDING_GRACE_SECONDS', 60)))
+# Eventos fallidos que se muestran en las estadísticas
+RECENT_FAILURES = 20
+
+
+def event_sender(payload: Dict) -> str:
+    """Phone number the event belongs to (same rule as handle_whatsapp_incoming_batch)"""
+    return (payload.get('from') or '').split('@')[0]
+
+
+class WebhookQueue:
+    """
+    Persist-then-ack queue over the webhook_events collection
+    Events are claimed with a lease before processing, so an event is handled by
+    one worker even if several app processes recover the same backlog. Events that
+    no worker holds in memory (after a restart, an expired lease or a retry of
+    failed ones) are picked up by the poll loop. 'failed' events stay failed until
+    retry_failed() puts them back to pending.
+    """
+
+    def __init__(self, db, workers: int = WORKERS):
+        self.db = db
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queues = [asyncio.Queue() for _ in range(max(workers, 1))]
+        # Eventos encolados como máximo por sondeo: un lote por worker
+        self.poll_limit = BATCH_SIZE * len(self._queues)
+        self._tasks: List[asyncio.Task] = []
+        # Ids en las colas de este proceso: el sondeo no los vuelve a encolar
+        self._queued_ids: Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._stats = {
+            'received': 0, 'processed': 0, 'failed': 0, 'retried': 0, 'recovered': 0, 'polled': 0,
+            'failed_retried': 0,
+        }
+
+    def _put(self, event: Dict):
+        self._queued_ids.add(event['id'])
+        self._shard(event['sender']).put_nowait(event)
+
+    def _shard(self, sender: str) -> asyncio.Queue:
+        return self._queues[zlib.crc32(sender.encode('utf-8')) % len(self._queues)]
+
+    async def enqueue(self, payload: Dict) -> str:
+        """Persist a raw event and hand it to its sender's worker; returns the event id"""
+        return (await self.enqueue_many([payload]))[0]
+
+    async def enqueue_many(self, payloads: List[Dict]) -> List[str]:
+        """Persist several raw events with one insert_many; returns their ids in order"""
+        received_at = datetime.now(timezone.utc)
+        events = [
+            {
+                'id': str(uuid.uuid4()),
+                'sender': event_sender(payload),
+                'payload': payload,
+                'status': 'pending',
+                'attempts': 0,
+                'received_at': received_at,
+            }
+            for payload in payloads
+        ]
+        if not events:
+            return []
+        await self.db.webhook_events.insert_many([dict(event) for event in events])
+        self._stats['received'] += len(events)
+        for event in events:
+            self._put(event)
+        return [event['id'] for event in events]
+
+    async def _claim(self, events: List[Dict]) -> List[Dict]:
+        """Lease the still-pending events of a batch; returns the ones this worker owns"""
+        now = datetime.now(timezone.utc)
+        ids = [event['id'] for event in events]
+        await self.db.webhook_events.update_many(
+            {'id': {'$in': ids}, 'status': 'pending'},
+            {'$set': {'status': 'processing', 'lease_until': now + LEASE, 'lease_owner': self.worker_id}}
+        )
+        owned = set()
+        async for doc in self.db.webhook_events.find(
+            {'id': {'$in': ids}, 'lease_owner': self.worker_id}, {'_id': 0, 'id': 1}
+        ):
+            owned.add(doc['id'])
+        # Los que no son nuestros ya los reclamó otro proceso
+        return [event for event in events if event['id'] in owned]
+
+    async def _handle(self, events: List[Dict]) -> Optional[str]:
+        """Run the batch handler once over some events; returns the error, if any"""
+        # El id del evento pasa a ser el id del mensaje: reintentar no duplica
+        payloads = [{**event['payload'], 'event_id': event['id']} for event in events]
+        try:
+            result = await handle_whatsapp_incoming_batch(self.db, payloads)
+            return None if result.get('success') else result.get('error', 'Error desconocido')
+        except Exception as e:
+            return str(e)
+
+    async def _handle_with_retries(self, events: List[Dict], attempts: int):
+        """Retry some events in place until they succeed or use up MAX_ATTEMPTS; returns (attempts, error)"""
+        error = f"max attempts ({MAX_ATTEMPTS}) reached"
+        while attempts < MAX_ATTEMPTS:
+            attempts += 1
+            error = await self._handle(events)
+            if error is None:
+                break
+            if attempts < MAX_ATTEMPTS:
+                # Reintentar aquí mismo mantiene el orden del remitente
+                self._stats['retried'] += 1
+                await asyncio.sleep(RETRY_DELAY_SECONDS * attempts)
+        return attempts, error
+
+    async def _finish(self, events: List[Dict], attempts: int, error: Optional[str]):
+        update = {'attempts': attempts, 'processed_at': datetime.now(timezone.utc)}
+        if error is None:
+            update['status'] = 'done'
+            self._stats['processed'] += len(events)
+        else:
+            update.update({'status': 'failed', 'error': error})
+            self._stats['failed'] += len(events)
+            logger.error(f"{len(events)} webhook events failed after {attempts} attempts: {error}")
+        await self.db.webhook_events.update_many(
+            {'id': {'$in': [event['id'] for event in events]}, 'lease_owner': self.worker_id},
+            {'$set': update, '$unset': {'lease_until': '', 'lease_owner': ''}}
+        )
+
+    async def _process(self, events: List[Dict]):
+        """
+        Process a claimed batch, isolating failures
+        The whole batch is tried once; if it fails, each sender's events are retried
+        on their own, and a sender whose events still fail is split into single
+        events, so only the bad events end up 'failed'.
+        """
+        events = await self._claim(events)
+        if not events:
+            return
+
+        attempts = max(event.get('attempts', 0) for event in events)
+        if attempts < MAX_ATTEMPTS and await self._handle(events) is None:
+            await self._finish(events, attempts + 1, None)
+            return
+
+        by_sender: Dict[str, List[Dict]] = {}
+        for event in events:
+            by_sender.setdefault(event['sender'], []).append(event)
+        for sender_events in by_sender.values():
+            # El intento conjunto ya cuenta
+            sender_attempts = max(event.get('attempts', 0) for event in sender_events) + 1
+            sender_attempts, error = await self._handle_with_retries(sender_events, sender_attempts)
+            if error is None or len(sender_events) == 1:
+                await self._finish(sender_events, sender_attempts, error)
+                continue
+            # Uno a uno, en orden: solo fallan los eventos que fallan solos
+            for event in sender_events:
+                await self._finish([event], sender_attempts, await self._handle([event]))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            # Esperar un evento y llevarse también los que ya estén en cola
+            batch = [await queue.get()]
+            while len(batch) < BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.error(f"Error in webhook worker: {e}")
+            finally:
+                for event in batch:
+                    self._queued_ids.discard(event['id'])
+                    queue.task_done()
+
+    async def recover(self) -> int:
+        """Put events abandoned mid-processing (expired lease) back to pending"""
+        result = await self.db.webhook_events.update_many(
+            {'status': 'processing', 'lease_until': {'$lt': datetime.now(timezone.utc)}},
+            {'$set': {'status': 'pending'}, '$unset': {'lease_until': '', 'lease_owner': ''}}
+        )
+        self._stats['recovered'] += result.modified_count
+        if result.modified_count:
+            print(f"🔁 {result.modified_count} eventos de webhook abandonados vuelven a pendientes")
+        return result.modified_count
+
+    async def poll_pending(self) -> int:
+        """Queue up to poll_limit pending events no worker of this process holds, oldest first"""
+        polled = 0
+        cutoff = datetime.now(timezone.utc) - PENDING_GRACE
+        # Por tandas: tras una caída, el resto se encola en los siguientes sondeos
+        async for event in self.db.webhook_events.find(
+            {'status': 'pending', 'received_at': {'$lt': cutoff}}, {'_id': 0}
+        ).sort('received_at', 1).limit(self.poll_limit):
+            if event['id'] in self._queued_ids:
+                continue
+            # El claim decide qué proceso lo procesa si varios lo encolan
+            self._put(event)
+            polled += 1
+        self._stats['polled'] += polled
+        if polled:
+            print(f"🔁 {polled} eventos de webhook pendientes encolados")
+        return polled
+
+    async def _poll_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.recover()
+                await self.poll_pending()
+            except Exception as e:
+                logger.error(f"Error polling webhook events: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def retry_failed(self, limit: int = 1000) -> int:
+        """Put failed events back to pending with a fresh attempt budget (dead-letter retry)"""
+        ids = [
+            doc['id'] async for doc in
+            self.db.webhook_events.find({'status': 'failed'}, {'_id': 0, 'id': 1}).sort('received_at', 1).limit(limit)
+        ]
+        if not ids:
+            return 0
+        result = await self.db.webhook_events.update_many(
+            {'id': {'$in': ids}, 'status': 'failed'},
+            {'$set': {'status': 'pending', 'attempts': 0}, '$unset': {'error': '', 'processed_at': ''}}
+        )
+        self._stats['failed_retried'] += result.modified_count
+        self._wakeup.set()
+        return result.modified_count
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+        self._tasks.append(asyncio.create_task(self._poll_loop()))
+
+    def get_stats(self) -> Dict:
+        return {
+            **self._stats,
+            'workers': len(self._queues),
+            'queued': [queue.qsize() for queue in self._queues],
+        }
+
+    async def get_event_stats(self) -> Dict:
+        """Persisted events per status, plus the most recent failures"""
+        by_status = {}
+        async for group in self.db.webhook_events.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            by_status[group['_id']] = group['count']
+        recent_failures = await self.db.webhook_events.find(
+            {'status': 'failed'}, {'_id': 0, 'id': 1, 'sender': 1, 'error': 1, 'attempts': 1, 'processed_at': 1}
+        ).sort('processed_at', -1).limit(RECENT_FAILURES).to_list(RECENT_FAILURES)
+        return {'by_status': by_status, 'recent_failures': recent_failures}
+
+
+_queue: Optional[WebhookQueue] = None
+
+
+def start_webhook_queue(db) -> WebhookQueue:
+    """Create the process-wide queue and start its workers and its poll loop (which recovers the backlog)"""
+    global _queue
+    _queue = WebhookQueue(db)
+    _queue.start()
+    return _queue
+
+
+def get_webhook_queue() -> WebhookQueue:
+    if _queue is None:
+        raise RuntimeError("Webhook queue not started")
+    return _queue
@@ -0,0 +1,146 @@
+"""
+WhatsApp Service Client
+Shared, pooled HTTP client for the Node whatsapp-service, kept open for the app lifetime
+"""
+import os
+import re
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+DEFAULT_SERVICE_URL = os.environ.get('WHATSAPP_SERVICE_URL', 'http://localhost:3001')
+
+# Límites del pool: el servicio Node es local, pocas conexiones reutilizadas bastan
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.environ.get('WHATSAPP_HTTP_MAX_CONNECTIONS', 20)),
+    max_keepalive_connections=int(os.environ.get('WHATSAPP_HTTP_MAX_KEEPALIVE', 10)),
+    keepalive_expiry=float(os.environ.get('WHATSAPP_HTTP_KEEPALIVE_SECONDS', 30)),
+)
+DEFAULT_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# Métricas por endpoint: rutas con ids se agrupan y, pasado el máximo, van a 'other'
+MAX_METRIC_ENDPOINTS = int(os.environ.get('WHATSAPP_METRIC_MAX_ENDPOINTS', 50))
+OTHER_ENDPOINT = 'other'
+# Segmentos variables de una ruta: números (teléfonos, ids), uuids, hashes e ids de WhatsApp
+_VARIABLE_SEGMENT = re.compile(
+    r'^(\+?\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9A-Fa-f]{16,}|[^/]*@[^/]*)$'
+)
+
+
+def endpoint_template(method: str, url: str) -> str:
+    """Metrics key for a request: 'POST /chats/{id}/messages' for '/chats/34600000001/messages'"""
+    path = urlsplit(url).path or url
+    segments = ['{id}' if _VARIABLE_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
+
+
+class WhatsAppServiceClient:
+    """Pooled async client with per-call timeouts and request metrics"""
+
+    def __init__(self, base_url: str = DEFAULT_SERVICE_URL):
+        self.base_url = base_url.rstrip('/')
+        self._client: Optional[httpx.AsyncClient] = None
+        self._metrics = {
+            'requests': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'total_seconds': 0.0,
+            'max_seconds': 0.0,
+            'by_endpoint': {},
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Se crea al primer uso para quedar ligado al event loop de la app
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=POOL_LIMITS,
+                timeout=DEFAULT_TIMEOUT,
+            )
+        return self._client
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        Send a request through the shared pool
+        url may be a path relative to the service or an absolute URL.
+        """
+        by_endpoint = self._metrics['by_endpoint']
+        endpoint = endpoint_template(method, url)
+        if endpoint not in by_endpoint and len(by_endpoint) >= MAX_METRIC_ENDPOINTS:
+            endpoint = OTHER_ENDPOINT
+        endpoint_metrics = by_endpoint.setdefault(endpoint, {'requests': 0, 'errors': 0, 'total_seconds': 0.0})
+        if timeout is not None:
+            kwargs['timeout'] = httpx.Timeout(timeout, connect=5.0)
+
+        self._metrics['requests'] += 1
+        self._metrics['in_flight'] += 1
+        endpoint_metrics['requests'] += 1
+        started = time.perf_counter()
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except Exception:
+            self._metrics['errors'] += 1
+            endpoint_metrics['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._metrics['in_flight'] -= 1
+            self._metrics['total_seconds'] += elapsed
+            self._metrics['max_seconds'] = max(self._metrics['max_seconds'], elapsed)
+            endpoint_metrics['total_seconds'] += elapsed
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    def get_metrics(self) -> Dict:
+        """Request counters and latencies since startup"""
+        metrics = dict(self._metrics)
+        requests = metrics['requests']
+        metrics['avg_seconds'] = metrics['total_seconds'] / requests if requests else 0.0
+        metrics['by_endpoint'] = {
+            endpoint: {
+                **values,
+                'avg_seconds': values['total_seconds'] / values['requests'] if values['requests'] else 0.0,
+            }
+            for endpoint, values in self._metrics['by_endpoint'].items()
+        }
+        metrics['pool'] = {
+            'max_connections': POOL_LIMITS.max_connections,
+            'max_keepalive_connections': POOL_LIMITS.max_keepalive_connections,
+            'keepalive_expiry': POOL_LIMITS.keepalive_expiry,
+        }
+        return metrics
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_whatsapp_client: Optional[WhatsAppServiceClient] = None
+
+
+def init_whatsapp_client(base_url: str) -> WhatsAppServiceClient:
+    """Create the app-wide client (called once by the main app)"""
+    global _whatsapp_client
+    _whatsapp_client = WhatsAppServiceClient(base_url)
+    return _whatsapp_client
+
+
+def get_whatsapp_client() -> WhatsAppServiceClient:
+    """Return the app-wide client, creating a default one outside the app (scripts)"""
+    global _whatsapp_client
+    if _whatsapp_client is None:
+        _whatsapp_client = WhatsAppServiceClient()
+    return _whatsapp_client
+
+
+async def close_whatsapp_client():
+    if _whatsapp_client is not None:
+        await _whatsapp_client.close()
@@ -21,6 +21,8 @@ import { toast } from 'sonner';
 const ChatArea = ({ 
   selectedContact, 
   messages, 
+  hasOlderMessages,
+  onLoadOlder,
   onSendMessage, 
   onBack,
   onClassify,
@@ -32,9 +34,11 @@ const ChatArea = ({
   const messagesEndRef = useRef(null);
   const textareaRef = useRef(null);
 
+  // Solo bajar al final cuando llega un mensaje nuevo, no al cargar historial antiguo
+  const lastMessageId = messages.length ? messages[messages.length - 1].id : null;
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [lastMessageId]);
 
   useEffect(() => {
     if (textareaRef.current) {
@@ -200,6 +204,13 @@ const ChatArea = ({
           </div>
         ) : (
           <>
+            {hasOlderMessages && (
+              <div className="flex justify-center mb-3">
+                <Button variant="outline" size="sm" onClick={onLoadOlder}>
+                  Cargar mensajes anteriores
+                </Button>
+              </div>
+            )}
             {messages.map((msg, index) => (
               <MessageBubble key={msg.id || index} message={msg} />
             ))}
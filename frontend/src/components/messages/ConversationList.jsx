@@ -111,10 +111,80 @@ const ConversationList = ({
   onSelectContact,
   onArchive,
   onDelete,
-  onNewChat 
+  onNewChat,
+  hasMore,
+  onLoadMore,
+  onSearch
 }) => {
   const [searchQuery, setSearchQuery] = React.useState('');
   const [filter, setFilter] = React.useState('all');
+  const [searchResults, setSearchResults] = React.useState(null);
+  const onSearchRef = React.useRef(onSearch);
+  onSearchRef.current = onSearch;
+
+  // Con 2+ caracteres se busca en el servidor (incluye conversaciones no cargadas y mensajes)
+  React.useEffect(() => {
+    const query = searchQuery.trim();
+    if (!onSearchRef.current || query.length < 2) {
+      setSearchResults(null);
+      return undefined;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const results = await onSearchRef.current(query);
+        if (!cancelled) setSearchResults(results);
+      } catch (error) {
+        console.error('Error searching:', error);
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery]);
+
+  const renderSearchResults = () => {
+    const contactHits = (searchResults.contacts?.items || []).filter(hit => hit.conversation);
+    const messageHits = (searchResults.messages?.items || []).filter(hit => hit.conversation);
+    if (contactHits.length === 0 && messageHits.length === 0) {
+      return (
+        <div className="p-8 text-center text-gray-500">
+          <p>Sin resultados</p>
+        </div>
+      );
+    }
+    return (
+      <>
+        {contactHits.length > 0 && (
+          <p className="px-3 pt-3 pb-1 text-xs font-semibold uppercase text-gray-300">Contactos</p>
+        )}
+        {contactHits.map((hit) => (
+          <ConversationItem
+            key={`contact-${hit.id}`}
+            conversation={hit.conversation}
+            isSelected={selectedContact?.id === hit.conversation.id}
+            onSelect={onSelectContact}
+            onArchive={onArchive}
+            onDelete={onDelete}
+          />
+        ))}
+        {messageHits.length > 0 && (
+          <p className="px-3 pt-3 pb-1 text-xs font-semibold uppercase text-gray-300">Mensajes</p>
+        )}
+        {messageHits.map((hit) => (
+          <ConversationItem
+            key={`message-${hit.id}`}
+            conversation={{ ...hit.conversation, last_message: hit.text, last_message_at: hit.timestamp }}
+            isSelected={selectedContact?.id === hit.conversation.id}
+            onSelect={() => onSelectContact(hit.conversation)}
+            onArchive={onArchive}
+            onDelete={onDelete}
+          />
+        ))}
+      </>
+    );
+  };
 
   const filteredConversations = React.useMemo(() => {
     let filtered = conversations;
@@ -198,7 +268,7 @@ const ConversationList = ({
 
       {/* Lista de conversaciones con fondo azul oscuro */}
       <ScrollArea className="flex-1 bg-[#312ea3]">
-        {filteredConversations.length === 0 ? (
+        {searchResults ? renderSearchResults() : filteredConversations.length === 0 ? (
           <div className="p-8 text-center text-gray-500">
             <p>No hay conversaciones</p>
           </div>
@@ -214,6 +284,18 @@ const ConversationList = ({
             />
           ))
         )}
+        {hasMore && !searchResults && (
+          <div className="p-3 text-center">
+            <Button
+              variant="ghost"
+              size="sm"
+              onClick={onLoadMore}
+              className="text-white hover:bg-white/20"
+            >
+              Cargar más
+            </Button>
+          </div>
+        )}
       </ScrollArea>
     </div>
   );
@@ -0,0 +1,64 @@
+import { useEffect, useRef, useState } from 'react';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const STREAM_URL = `${BACKEND_URL}/api/events/stream`;
+
+// Una sola conexión SSE por pestaña, compartida por todas las páginas
+let source = null;
+const listeners = new Set();
+const connectionListeners = new Set();
+
+const notifyConnection = (connected) => {
+  connectionListeners.forEach(listener => listener(connected));
+};
+
+const openSource = () => {
+  source = new EventSource(STREAM_URL);
+  source.onopen = () => notifyConnection(true);
+  // EventSource reintenta solo (con Last-Event-ID); mientras tanto las páginas vuelven a sondear
+  source.onerror = () => notifyConnection(false);
+  source.onmessage = (message) => {
+    let event;
+    try {
+      event = JSON.parse(message.data);
+    } catch (error) {
+      console.error('Invalid event from stream:', error);
+      return;
+    }
+    listeners.forEach(listener => listener(event));
+  };
+};
+
+const subscribe = (listener, onConnection) => {
+  listeners.add(listener);
+  connectionListeners.add(onConnection);
+  if (!source) {
+    openSource();
+  } else {
+    onConnection(source.readyState === EventSource.OPEN);
+  }
+  return () => {
+    listeners.delete(listener);
+    connectionListeners.delete(onConnection);
+    if (listeners.size === 0 && source) {
+      source.close();
+      source = null;
+    }
+  };
+};
+
+/**
+ * Receive live events ({type, data, at}) from the backend.
+ * Returns whether the stream is connected, so callers can fall back to polling.
+ */
+export function useEventStream(onEvent) {
+  const [connected, setConnected] = useState(false);
+  const handlerRef = useRef(onEvent);
+  handlerRef.current = onEvent;
+
+  useEffect(() => {
+    return subscribe((event) => handlerRef.current(event), setConnected);
+  }, []);
+
+  return connected;
+}
@@ -10,9 +10,26 @@ import { Switch } from '@/components/ui/switch';
 import { toast } from 'sonner';
 import { format, addDays, subDays, parseISO } from 'date-fns';
 import { es } from 'date-fns/locale';
+import { useEventStream } from '@/hooks/use-event-stream';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const SYNC_POLL_INTERVAL_MS = 2000;
+
+// Lanza la sincronización sin bloquear la petición y consulta su estado hasta que termine
+const runGoogleSheetsSync = async () => {
+  await axios.post(`${API}/appointments/sync-google-sheets`, null, { params: { wait: false } });
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, SYNC_POLL_INTERVAL_MS));
+    const { data: status } = await axios.get(`${API}/sync/status`);
+    if (!status.running) {
+      if (status.last_error) {
+        throw new Error(status.last_error);
+      }
+      return status.last_result || {};
+    }
+  }
+};
 
 const AppointmentsNew = () => {
   const [appointments, setAppointments] = useState([]);
@@ -45,12 +62,22 @@ const AppointmentsNew = () => {
     fetchStats();
   }, [selectedDate]);
 
+  // Recargar la agenda cuando otra pestaña o la sincronización cambian citas
+  useEventStream(({ type, data }) => {
+    const syncChanged = type === 'sync.finished' && data.success &&
+      (data.inserted || data.updated || data.deleted);
+    if (type === 'appointment.changed' || type === 'resync' || syncChanged) {
+      fetchAppointments();
+      fetchStats();
+    }
+  });
+
   // Sincronizar al cargar la página por primera vez
   useEffect(() => {
     const syncOnLoad = async () => {
       try {
         console.log('🔄 Sincronizando citas al cargar la página...');
-        await axios.post(`${API}/appointments/sync-google-sheets`);
+        await runGoogleSheetsSync();
         console.log('✅ Sincronización inicial completada');
         fetchAppointments();
         fetchStats();
@@ -64,7 +91,13 @@ const AppointmentsNew = () => {
 
   const fetchAppointments = async () => {
     try {
-      const response = await axios.get(`${API}/appointments`);
+      // Pedir solo la ventana del día seleccionado
+      const response = await axios.get(`${API}/appointments`, {
+        params: {
+          from: format(selectedDate, 'yyyy-MM-dd'),
+          to: format(addDays(selectedDate, 1), 'yyyy-MM-dd')
+        }
+      });
       setAppointments(response.data);
     } catch (error) {
       console.error('Error fetching appointments:', error);
@@ -239,9 +272,9 @@ const AppointmentsNew = () => {
   const handleSyncGoogleSheets = async () => {
     setIsSyncing(true);
     try {
-      const response = await axios.post(`${API}/appointments/sync-google-sheets`);
+      const result = await runGoogleSheetsSync();
       toast.success(
-        `Sincronización completada: ${response.data.appointments_synced} citas, ${response.data.patients_synced} pacientes nuevos`
+        `Sincronización completada: ${result.appointments_synced || 0} citas, ${result.patients_synced || 0} pacientes nuevos`
       );
       setLastSyncTime(new Date());
       fetchAppointments();
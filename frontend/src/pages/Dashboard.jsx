@@ -1,11 +1,12 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import axios from 'axios';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Calendar, MessageSquare, Users, Clock, TrendingUp } from 'lucide-react';
-import { format } from 'date-fns';
+import { format, addDays } from 'date-fns';
 import { es } from 'date-fns/locale';
 import { Badge } from '@/components/ui/badge';
+import { useEventStream } from '@/hooks/use-event-stream';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -22,9 +23,10 @@ const statusConfig = {
 };
 
 function DashboardContent() {
-  const [appointments, setAppointments] = useState([]);
   const [todayAppointments, setTodayAppointments] = useState([]);
-  const [patients, setPatients] = useState([]);
+  const [todayTotal, setTodayTotal] = useState(0);
+  const [remindersSent, setRemindersSent] = useState(0);
+  const [colorCounts, setColorCounts] = useState({});
   const [whatsappStatus, setWhatsappStatus] = useState({ ready: false });
   const [priorityConversations, setPriorityConversations] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
@@ -33,49 +35,59 @@ function DashboardContent() {
     loadData();
   }, []);
 
-  const loadData = async () => {
-    setIsLoading(true);
+  // Cambios en vivo: el estado de WhatsApp se aplica directamente, el resto recarga
+  // los datos una sola vez por ráfaga de eventos
+  const reloadTimer = useRef(null);
+  useEffect(() => () => clearTimeout(reloadTimer.current), []);
+  useEventStream(({ type, data }) => {
+    if (type === 'whatsapp.status') {
+      setWhatsappStatus(data);
+      return;
+    }
+    const relevant = [
+      'appointment.changed', 'sync.finished', 'conversation.classified', 'conversation.deleted', 'resync'
+    ];
+    if (relevant.includes(type)) {
+      clearTimeout(reloadTimer.current);
+      reloadTimer.current = setTimeout(() => loadData(false), 1000);
+    }
+  });
+
+  const loadData = async (showLoading = true) => {
+    if (showLoading) setIsLoading(true);
     try {
-      const [appointmentsRes, patientsRes, whatsappRes, conversationsRes] = await Promise.all([
-        axios.get(`${API}/appointments`),
-        axios.get(`${API}/patients`),
-        axios.get(`${API}/whatsapp/status`),
-        axios.get(`${API}/conversations`)
+      // Un único resumen calculado en el servidor (agenda de hoy y bandeja prioritaria)
+      const [summaryRes, whatsappRes] = await Promise.all([
+        axios.get(`${API}/dashboard/summary`, {
+          params: {
+            from: format(new Date(), 'yyyy-MM-dd'),
+            to: format(addDays(new Date(), 1), 'yyyy-MM-dd')
+          }
+        }),
+        axios.get(`${API}/whatsapp/status`)
       ]);
 
-      setAppointments(appointmentsRes.data);
-      setPatients(patientsRes.data);
+      const { appointments, conversations } = summaryRes.data;
+      setTodayAppointments(appointments.today);
+      setTodayTotal(appointments.total);
+      setRemindersSent(appointments.reminders_sent);
+      setPriorityConversations(conversations.priority);
+      setColorCounts(conversations.by_color);
       setWhatsappStatus(whatsappRes.data);
-      
-      // Filtrar conversaciones prioritarias (AZUL y AMARILLO)
-      const priority = conversationsRes.data.filter(conv => 
-        conv.color_code === 'AZUL' || conv.color_code === 'AMARILLO'
-      );
-      setPriorityConversations(priority);
-
-      const today = format(new Date(), 'yyyy-MM-dd');
-      const filtered = appointmentsRes.data.filter(apt => {
-        if (!apt.date) return false;
-        const aptDate = format(new Date(apt.date), 'yyyy-MM-dd');
-        return aptDate === today;
-      });
-      filtered.sort((a, b) => {
-        return new Date(a.date) - new Date(b.date);
-      });
-      setTodayAppointments(filtered);
     } catch (error) {
       console.error('Error loading data:', error);
-      setAppointments([]);
       setTodayAppointments([]);
-      setPatients([]);
+      setTodayTotal(0);
+      setRemindersSent(0);
       setPriorityConversations([]);
+      setColorCounts({});
     }
     setIsLoading(false);
   };
 
-  const confirmedToday = todayAppointments.filter(a => a.reminder_sent).length;
-  const amarilloCount = priorityConversations.filter(c => c.color_code === 'AMARILLO').length;
-  const azulCount = priorityConversations.filter(c => c.color_code === 'AZUL').length;
+  const confirmedToday = remindersSent;
+  const amarilloCount = colorCounts.AMARILLO?.conversations || 0;
+  const azulCount = colorCounts.AZUL?.conversations || 0;
 
   return (
     <div className="min-h-screen">
@@ -96,7 +108,7 @@ function DashboardContent() {
             </div>
             <div>
               <p className="text-xs text-white/90 font-medium">Citas de Hoy</p>
-              <p className="text-3xl font-bold text-white">{todayAppointments.length}</p>
+              <p className="text-3xl font-bold text-white">{todayTotal}</p>
             </div>
           </div>
 
@@ -148,7 +160,7 @@ function DashboardContent() {
                     </p>
                   </div>
                 </div>
-                <div className="text-3xl font-bold text-white">{todayAppointments.length}</div>
+                <div className="text-3xl font-bold text-white">{todayTotal}</div>
               </div>
             </CardHeader>
             <CardContent className="p-4 max-h-[400px] overflow-y-auto">
@@ -202,7 +214,7 @@ function DashboardContent() {
                     </p>
                   </div>
                 </div>
-                <div className="text-3xl font-bold text-white">{priorityConversations.length}</div>
+                <div className="text-3xl font-bold text-white">{amarilloCount + azulCount}</div>
               </div>
             </CardHeader>
             <CardContent className="p-4 max-h-[400px] overflow-y-auto">
@@ -264,13 +276,13 @@ function DashboardContent() {
                 <div className="flex justify-between mb-2">
                   <span className="text-sm text-gray-600">Citas Confirmadas</span>
                   <span className="text-sm font-bold text-[#0071BC]">
-                    {todayAppointments.length > 0 ? Math.round((confirmedToday / todayAppointments.length) * 100) : 0}%
+                    {todayTotal > 0 ? Math.round((confirmedToday / todayTotal) * 100) : 0}%
                   </span>
                 </div>
                 <div className="w-full bg-gray-200 rounded-full h-2">
                   <div
                     className="bg-gradient-to-r from-[#0071BC] to-[#65C8D0] h-2 rounded-full transition-all duration-500"
-                    style={{ width: `${todayAppointments.length > 0 ? (confirmedToday / todayAppointments.length) * 100 : 0}%` }}
+                    style={{ width: `${todayTotal > 0 ? (confirmedToday / todayTotal) * 100 : 0}%` }}
                   ></div>
                 </div>
               </div>
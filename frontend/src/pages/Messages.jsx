@@ -4,15 +4,20 @@ import { toast } from 'sonner';
 import ConversationList from '@/components/messages/ConversationList';
 import ChatArea from '@/components/messages/ChatArea';
 import ContactInfo from '@/components/messages/ContactInfo';
+import { useEventStream } from '@/hooks/use-event-stream';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const CONVERSATIONS_PAGE_SIZE = 50;
+const MESSAGES_PAGE_SIZE = 50;
 
 const Messages = () => {
   // Estado central
   const [conversations, setConversations] = useState([]);
+  const [conversationsCursor, setConversationsCursor] = useState(null);
   const [selectedContact, setSelectedContact] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [messagesCursor, setMessagesCursor] = useState(null);
   const [messageTemplates, setMessageTemplates] = useState([]);
   const [whatsappStatus, setWhatsappStatus] = useState({ ready: false });
   const [qrCode, setQrCode] = useState(null);
@@ -40,8 +45,67 @@ const Messages = () => {
     loadInitialData();
   }, []);
 
-  // Poll para actualizaciones - separado para capturar selectedContact correctamente
+  // Actualizaciones en vivo: el servidor envía solo los cambios
+  const handleStreamEvent = ({ type, data }) => {
+    switch (type) {
+      case 'message.created':
+        if (selectedContact && data.conversation_id === selectedContact.id) {
+          setMessages(prev => prev.some(msg => msg.id === data.id) ? prev : [...prev, data]);
+          if (!data.from_me) {
+            axios.post(`${API}/conversations/${data.conversation_id}/mark-read`).catch(() => {});
+          }
+        }
+        break;
+      case 'conversation.activity': {
+        const existing = conversations.find(conv => conv.id === data.id);
+        if (!existing) {
+          fetchConversations();
+          break;
+        }
+        const isOpen = selectedContact?.id === data.id;
+        const updated = {
+          ...existing,
+          last_message: data.last_message,
+          last_message_at: data.last_message_at,
+          unread_count: isOpen ? 0 : (existing.unread_count || 0) + data.unread_delta
+        };
+        setConversations(prev => [updated, ...prev.filter(conv => conv.id !== data.id)]);
+        break;
+      }
+      case 'conversation.classified':
+        setConversations(prev =>
+          prev.map(conv => conv.id === data.id ? { ...conv, color_code: data.color_code } : conv)
+        );
+        break;
+      case 'conversation.read':
+        setConversations(prev =>
+          prev.map(conv => conv.id === data.id ? { ...conv, unread_count: 0 } : conv)
+        );
+        break;
+      case 'conversation.deleted':
+        setConversations(prev => prev.filter(conv => conv.id !== data.id));
+        if (selectedContact?.id === data.id) {
+          setSelectedContact(null);
+        }
+        break;
+      case 'whatsapp.status':
+        applyWhatsAppStatus(data);
+        break;
+      case 'resync':
+        fetchConversations();
+        if (selectedContact) {
+          fetchMessages(selectedContact.id);
+        }
+        break;
+      default:
+        break;
+    }
+  };
+  const streamConnected = useEventStream(handleStreamEvent);
+
+  // Poll para actualizaciones solo si el stream no está conectado
   useEffect(() => {
+    if (streamConnected) return undefined;
     const pollInterval = setInterval(() => {
       checkWhatsAppStatus();
       if (selectedContact) {
@@ -51,9 +115,12 @@ const Messages = () => {
     }, 5000);
     
     return () => clearInterval(pollInterval);
-  }, [selectedContact]);
+  }, [selectedContact, streamConnected]);
 
   useEffect(() => {
+    // Al cambiar de conversación se empieza por la página más reciente
+    setMessages([]);
+    setMessagesCursor(null);
     if (selectedContact) {
       fetchMessages(selectedContact.id);
     }
@@ -62,16 +129,23 @@ const Messages = () => {
   const checkWhatsAppStatus = async () => {
     try {
       const response = await axios.get(`${API}/whatsapp/status`);
-      setWhatsappStatus(response.data);
-      
-      if (response.data.hasQR) {
+      await applyWhatsAppStatus(response.data);
+    } catch (error) {
+      console.error('Error checking WhatsApp status:', error);
+    }
+  };
+
+  const applyWhatsAppStatus = async (status) => {
+    setWhatsappStatus(status);
+    try {
+      if (status.hasQR) {
         const qrResponse = await axios.get(`${API}/whatsapp/qr`);
         setQrCode(qrResponse.data.qr);
       } else {
         setQrCode(null);
       }
     } catch (error) {
-      console.error('Error checking WhatsApp status:', error);
+      console.error('Error fetching WhatsApp QR:', error);
     }
   };
 
@@ -84,18 +158,70 @@ const Messages = () => {
 
   const fetchConversations = async () => {
     try {
-      const response = await axios.get(`${API}/conversations`);
-      setConversations(response.data);
+      const response = await axios.get(`${API}/conversations`, {
+        params: { limit: CONVERSATIONS_PAGE_SIZE }
+      });
+      const firstPage = response.data;
+      // Refrescar la primera página sin perder las páginas antiguas ya cargadas
+      setConversations(prev => {
+        if (firstPage.length < CONVERSATIONS_PAGE_SIZE) return firstPage;
+        const ids = new Set(firstPage.map(conv => conv.id));
+        const oldest = firstPage[firstPage.length - 1].last_message_at;
+        return [
+          ...firstPage,
+          ...prev.filter(conv => !ids.has(conv.id) && conv.last_message_at < oldest)
+        ];
+      });
+      setConversationsCursor(prev =>
+        firstPage.length < CONVERSATIONS_PAGE_SIZE ? null : (prev || response.headers['x-next-cursor'] || null)
+      );
     } catch (error) {
       console.error('Error fetching conversations:', error);
     }
   };
 
+  // Búsqueda en servidor: contactos (nombre o teléfono) y texto de mensajes
+  const searchInbox = async (query) => {
+    const response = await axios.get(`${API}/search`, { params: { q: query, limit: 20 } });
+    return response.data;
+  };
+
+  const loadMoreConversations = async () => {
+    if (!conversationsCursor) return;
+    try {
+      const response = await axios.get(`${API}/conversations`, {
+        params: { limit: CONVERSATIONS_PAGE_SIZE, before: conversationsCursor }
+      });
+      setConversations(prev => {
+        const ids = new Set(prev.map(conv => conv.id));
+        return [...prev, ...response.data.filter(conv => !ids.has(conv.id))];
+      });
+      setConversationsCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading more conversations:', error);
+    }
+  };
+
   const fetchMessages = async (conversationId) => {
     try {
       setLoading(true);
-      const response = await axios.get(`${API}/conversations/${conversationId}/messages`);
-      setMessages(response.data);
+      const response = await axios.get(`${API}/conversations/${conversationId}/messages`, {
+        params: { limit: MESSAGES_PAGE_SIZE, lean: true }
+      });
+      const latest = response.data;
+      // Refrescar los mensajes recientes conservando el historial antiguo ya cargado
+      setMessages(prev => {
+        if (latest.length < MESSAGES_PAGE_SIZE) return latest;
+        const ids = new Set(latest.map(msg => msg.id));
+        const oldest = latest[0].timestamp;
+        return [
+          ...prev.filter(msg => msg.conversation_id === conversationId && !ids.has(msg.id) && msg.timestamp < oldest),
+          ...latest
+        ];
+      });
+      setMessagesCursor(prev =>
+        latest.length < MESSAGES_PAGE_SIZE ? null : (prev || response.headers['x-next-cursor'] || null)
+      );
       
       // Marcar como leído
       await axios.post(`${API}/conversations/${conversationId}/mark-read`);
@@ -114,6 +240,23 @@ const Messages = () => {
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!selectedContact || !messagesCursor) return;
+    try {
+      const response = await axios.get(`${API}/conversations/${selectedContact.id}/messages`, {
+        params: { limit: MESSAGES_PAGE_SIZE, lean: true, before: messagesCursor }
+      });
+      setMessages(prev => {
+        const ids = new Set(prev.map(msg => msg.id));
+        return [...response.data.filter(msg => !ids.has(msg.id)), ...prev];
+      });
+      setMessagesCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+      toast.error('Error al cargar mensajes anteriores');
+    }
+  };
+
   const fetchMessageTemplates = async () => {
     try {
       const response = await axios.get(`${API}/message-flows`);
@@ -318,6 +461,9 @@ const Messages = () => {
             onArchive={handleArchive}
             onDelete={handleDelete}
             onNewChat={handleNewChat}
+            hasMore={!!conversationsCursor}
+            onLoadMore={loadMoreConversations}
+            onSearch={searchInbox}
           />
         </div>
       );
@@ -327,6 +473,8 @@ const Messages = () => {
           <ChatArea
             selectedContact={selectedContact}
             messages={messages}
+            hasOlderMessages={!!messagesCursor}
+            onLoadOlder={loadOlderMessages}
             onSendMessage={handleSendMessage}
             onBack={() => setSelectedContact(null)}
             onClassify={handleClassify}
@@ -350,6 +498,9 @@ const Messages = () => {
           onArchive={handleArchive}
           onDelete={handleDelete}
           onNewChat={handleNewChat}
+          hasMore={!!conversationsCursor}
+          onLoadMore={loadMoreConversations}
+          onSearch={searchInbox}
         />
       </div>
 
@@ -361,6 +512,8 @@ const Messages = () => {
         <ChatArea
           selectedContact={selectedContact}
           messages={messages}
+          hasOlderMessages={!!messagesCursor}
+          onLoadOlder={loadOlderMessages}
           onSendMessage={handleSendMessage}
           onClassify={handleClassify}
           messageTemplates={messageTemplates}
@@ -81,6 +81,7 @@ async function connectToWhatsApp() {
   // Handle incoming messages
   sock.ev.on('messages.upsert', async ({ messages, type }) => {
     if (type === 'notify') {
+      const batch = [];
       for (const msg of messages) {
         if (!msg.key.fromMe && msg.message) {
           console.log('New message received:', msg.key.remoteJid);
@@ -95,14 +96,17 @@ async function connectToWhatsApp() {
           
           // Emit to socket
           io.emit('message', messageData);
-          
-          // Send to backend webhook for processing
-          try {
-            await axios.post('http://localhost:8001/api/whatsapp/webhook', messageData);
-            console.log('✅ Message sent to backend webhook');
-          } catch (error) {
-            console.error('❌ Error sending to webhook:', error.message);
-          }
+          batch.push(messageData);
+        }
+      }
+      
+      // Send the whole upsert to the backend in one request
+      if (batch.length > 0) {
+        try {
+          await axios.post('http://localhost:8001/api/whatsapp/webhook/batch', batch);
+          console.log(`✅ ${batch.length} message(s) sent to backend webhook`);
+        } catch (error) {
+          console.error('❌ Error sending to webhook:', error.message);
         }
       }
     }